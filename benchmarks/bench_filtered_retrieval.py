@@ -0,0 +1,153 @@
+"""
+bench_filtered_retrieval.py
+Compare plain vector search with company pre-filtered search
+(rag_pipeline.retrieve) on latency and hit rate.
+
+Two modes:
+- default: the ingested index (QDRANT_STORAGE_PATH or data/qdrant_data) with
+  eval/retrieval_eval_ground_truth.json; a hit means the ground-truth chunk id
+  is in the top k.
+- --synthetic N: builds an offline index of N synthetic documents with the
+  mock provider; a hit means a top-k chunk belongs to the company the query asks about.
+
+Filtering is forced on (COMPANY_FILTER=1). Against embedded Qdrant, which
+ignores payload indexes, the filtered search is expected to be slower; the
+latency gain needs a Qdrant server.
+
+Usage:
+    python benchmarks/bench_filtered_retrieval.py --top-k 5
+    python benchmarks/bench_filtered_retrieval.py --synthetic 400 --queries 200
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+import run_benchmarks as bench
+
+EVAL_FILE = os.path.join(PROJECT_ROOT, "eval", "retrieval_eval_ground_truth.json")
+
+
+def time_search(fn, repeat):
+    """Return (result of the last call, per-call latencies in ms)."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def evaluate(rag_pipeline, cases, top_k, repeat):
+    """cases: list of (query, is_hit(hits) -> bool)."""
+    results = {"unfiltered": {"hits": 0, "ms": []}, "filtered": {"hits": 0, "ms": []}}
+    filtered_queries = 0
+
+    for query, is_hit in cases:
+        embedding = rag_pipeline.get_embedder().embed_query(query)  # shared; excluded from timing
+        with rag_pipeline.registry.acquire() as handle:
+            companies = rag_pipeline.detect_companies(query, handle.company_aliases)
+        if companies:
+            filtered_queries += 1
+
+        hits, samples = time_search(lambda: rag_pipeline.search_documents(embedding, top_k=top_k), repeat)
+        results["unfiltered"]["hits"] += is_hit(hits)
+        results["unfiltered"]["ms"].extend(samples)
+
+        hits, samples = time_search(lambda: rag_pipeline.retrieve(query, embedding, top_k=top_k), repeat)
+        results["filtered"]["hits"] += is_hit(hits)
+        results["filtered"]["ms"].extend(samples)
+
+    summary = {"queries": len(cases), "queries_with_company": filtered_queries, "top_k": top_k}
+    for mode, stats in results.items():
+        summary[mode] = {
+            "hit_rate": round(stats["hits"] / len(cases), 4) if cases else 0.0,
+            "latency": bench.percentiles(stats["ms"]),
+        }
+    return summary
+
+
+def ground_truth_cases():
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        eval_data = json.load(f)
+    return [
+        (item["query"],
+         lambda hits, answer_id=item["answer_id"]: any(
+             answer_id == h.payload.get("source_id") or answer_id in h.payload.get("duplicate_ids", [])
+             for h in hits))
+        for item in eval_data
+    ]
+
+
+def synthetic_cases(companies, n_queries):
+    import upload_qdrant  # after src/ is on sys.path
+    cases = []
+    for query in bench.generate_queries(companies, n_queries):
+        company = next(c for c in companies if c in query)
+        cases.append((query, lambda hits, company=company: any(
+            company in upload_qdrant.payload_companies(h.payload) for h in hits)))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark company pre-filtered retrieval.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="timed searches per query and mode")
+    parser.add_argument("--synthetic", type=int, help="build an offline synthetic index with this many documents")
+    parser.add_argument("--queries", type=int, default=200, help="synthetic queries")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/filtered_<commit>.json)")
+    args = parser.parse_args()
+
+    os.environ["COMPANY_FILTER"] = "1"
+    work_root = None
+    if args.synthetic:
+        work_root = tempfile.mkdtemp(prefix="tosdr_filter_bench_")
+        os.environ["LLM_PROVIDER"] = "mock"
+        os.environ["QDRANT_STORAGE_PATH"] = os.path.join(work_root, "qdrant_data")
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+    try:
+        if args.synthetic:
+            print(f"🚀 Building synthetic index with {args.synthetic} documents...")
+            _, companies = bench.bench_ingestion(os.path.join(work_root, "corpus"), args.synthetic, 3000)
+            cases = synthetic_cases(companies, args.queries)
+        else:
+            cases = ground_truth_cases()
+
+        import rag_pipeline
+        summary = evaluate(rag_pipeline, cases, args.top_k, args.repeat)
+        rag_pipeline.registry.close_all()
+    finally:
+        if work_root:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    summary.update({
+        "commit": bench.git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "mode": f"synthetic_{args.synthetic}" if args.synthetic else "ground_truth",
+        "storage": "embedded",  # payload indexes have no effect; see the module docstring
+    })
+    output = args.output or os.path.join(bench.RESULTS_DIR, f"filtered_{summary['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print("\n===============================")
+    print(f"🏢 Queries naming a known company: {summary['queries_with_company']}/{summary['queries']}")
+    for mode in ("unfiltered", "filtered"):
+        stats = summary[mode]
+        print(f"🔍 {mode:<10} Hit Rate@{args.top_k}: {stats['hit_rate']:.3f} | "
+              f"p50 {stats['latency']['p50_ms']}ms | p99 {stats['latency']['p99_ms']}ms")
+    print("===============================")
+    print(f"✅ Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+import_time.py
+Import-time budget check for the modules the web app, CLI tools and eval
+scripts load at startup.
+
+Each module is imported in a fresh interpreter with `python -X importtime`
+and without any Azure credentials in the environment, so it fails if a module
+builds clients or does other work at import. Two checks:
+1. cumulative import time (best of --repeat runs) against the budget in
+   benchmarks/import_budget.json
+2. none of the heavy client libraries (HEAVY_MODULES) may be imported; they
+   load lazily on first use
+
+Usage:
+    python benchmarks/import_time.py             # check, exit 1 on a regression
+    python benchmarks/import_time.py --update    # re-baseline the budget on this machine
+    python benchmarks/import_time.py --top 10    # also list the slowest imports per module
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BUDGET_FILE = os.path.join(PROJECT_ROOT, "benchmarks", "import_budget.json")
+SEARCH_PATH = [os.path.join(PROJECT_ROOT, "src"), os.path.join(PROJECT_ROOT, "eval")]
+
+MODULES = [
+    "providers",
+    "rag_pipeline",
+    "app_flask",
+    "api",
+    "collection_registry",
+    "profiling",
+    "embedding_generation",
+    "llm_eval",
+    "retrieval_eval",
+    "tune_thresholds",
+    "compare_routing",
+]
+HEAVY_MODULES = ("openai", "qdrant_client", "fastembed", "kagglehub")
+CREDENTIAL_PREFIXES = ("AZURE_", "OPENAI_")
+HEADROOM = 1.5        # budget = measured time x HEADROOM on --update
+MIN_BUDGET_MS = 50
+
+
+def measure(module):
+    """Return ({package: (self_us, cumulative_us)}, error) for one cold import."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith(CREDENTIAL_PREFIXES)}
+    env["PYTHONPATH"] = os.pathsep.join(SEARCH_PATH + [env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=PROJECT_ROOT,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    error = None if proc.returncode == 0 else proc.stderr.strip().splitlines()[-1]
+    return timings, error
+
+
+def profile(module, repeat):
+    best_ms, timings, error = None, {}, None
+    for _ in range(repeat):
+        timings, error = measure(module)
+        if error or module not in timings:
+            return None, timings, error or f"{module} not found in -X importtime output"
+        ms = timings[module][1] / 1000
+        best_ms = ms if best_ms is None else min(best_ms, ms)
+    return best_ms, timings, None
+
+
+def load_budget():
+    if not os.path.exists(BUDGET_FILE):
+        return {}
+    with open(BUDGET_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)["modules"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check module import times against the checked-in budget.")
+    parser.add_argument("--update", action="store_true", help="write a new budget from this machine's timings")
+    parser.add_argument("--repeat", type=int, default=5, help="cold imports per module (best run counts)")
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest imports of each module")
+    args = parser.parse_args()
+
+    budget = load_budget()
+    measured, failures = {}, []
+
+    print(f"{'module':<22} {'import ms':>10} {'budget ms':>10}")
+    for module in MODULES:
+        ms, timings, error = profile(module, args.repeat)
+        if error:
+            failures.append(f"{module}: import failed ({error})")
+            print(f"{module:<22} {'error':>10}")
+            continue
+        measured[module] = ms
+        limit = budget.get(module)
+        status = ""
+        if limit is not None and ms > limit and not args.update:
+            failures.append(f"{module}: {ms:.1f}ms exceeds budget {limit}ms")
+            status = "  ❌ over budget"
+        heavy = sorted({name.split(".")[0] for name in timings if name.split(".")[0] in HEAVY_MODULES})
+        if heavy:
+            failures.append(f"{module}: imports {', '.join(heavy)} at import time")
+            status += f"  ❌ imports {', '.join(heavy)}"
+        print(f"{module:<22} {ms:>10.1f} {limit if limit is not None else '-':>10}{status}")
+        if args.top:
+            slowest = sorted(timings.items(), key=lambda item: -item[1][0])[:args.top]
+            for name, (self_us, _) in slowest:
+                print(f"    {self_us / 1000:8.1f}ms  {name}")
+
+    if args.update:
+        new_budget = {module: max(MIN_BUDGET_MS, int(math.ceil(ms * HEADROOM / 10) * 10))
+                      for module, ms in measured.items()}
+        with open(BUDGET_FILE, "w", encoding="utf-8") as f:
+            json.dump({"headroom": HEADROOM, "python": sys.version.split()[0], "modules": new_budget}, f, indent=2)
+        print(f"✅ Budget written to {BUDGET_FILE}")
+
+    if failures:
+        print("\n❌ Import-time check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n✅ All modules import within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+run_benchmarks.py
+End-to-end benchmarks for the ingestion pipeline and the query path.
+
+Runs fully offline against the mock provider (see src/providers.py):
+1. Generates a synthetic ToS-like corpus at each requested scale.
+2. Times every ingestion stage (process, chunk, dedup, embed, upload, sentences).
+3. Drives the query path (embed, search, prompt, LLM) under concurrent load,
+   optionally profiling every query (--profile sample|cprofile, see
+   src/profiling.py) and writing the flamegraph/top-function files next to
+   the results.
+4. Writes throughput, latency percentiles and peak memory to a JSON file
+   that can be compared across commits with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales 50,200 --queries 200 --concurrency 8
+    python benchmarks/run_benchmarks.py --scales 200 --profile sample
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+import statistics
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+# ==============================
+# SYNTHETIC CORPUS
+# ==============================
+DOC_TYPES = ["PrivacyPolicy", "TermsofService", "CookiePolicy", "DataPolicy"]
+
+CLAUSES = [
+    "{company} collects information you provide when you create an account, such as your name, email address and phone number.",
+    "We use cookies, pixel tags and similar technologies to personalize content and measure the effectiveness of ads on {company} and partner sites.",
+    "{company} may share your personal information with third-party service providers who process data on our behalf.",
+    "You can access, edit or delete your personal data at any time from the {company} account settings page.",
+    "We retain account and activity data for as long as your account is active or as needed to provide the {company} services.",
+    "{company} may transfer your information to a new owner in the event of a merger, acquisition or sale of assets.",
+    "Any dispute arising from these terms will be resolved through binding arbitration, and you waive the right to a class action against {company}.",
+    "{company} may suspend or terminate your access to the services at any time without prior notice.",
+    "By submitting content you grant {company} a worldwide, royalty-free license to use, copy, modify and distribute that content.",
+    "Our services are not directed to children under 13 and {company} does not knowingly collect their personal information.",
+    "{company} uses automated systems and machine learning to analyze content for security and abuse prevention.",
+    "Information about your device, location and browsing activity may be combined with data from other {company} products.",
+]
+
+QUERY_TEMPLATES = [
+    "Does {company} share my data with third parties?",
+    "How does {company} use cookies for advertising?",
+    "Can I delete my personal data from {company}?",
+    "How long does {company} keep my account data?",
+    "Does {company} force arbitration for disputes?",
+    "What license do I grant {company} over my content?",
+]
+
+
+def generate_corpus(raw_dir, n_docs, words_per_doc, seed=42):
+    """Write n_docs synthetic policy files named <Company>_<DocType>.txt and return the company list."""
+    rng = random.Random(seed)
+    os.makedirs(raw_dir, exist_ok=True)
+    companies = [f"Company{i:04d}" for i in range(max(1, n_docs // len(DOC_TYPES)) + 1)]
+    for i in range(n_docs):
+        company = companies[i // len(DOC_TYPES)]
+        doc_type = DOC_TYPES[i % len(DOC_TYPES)]
+        sentences, n_words = [], 0
+        while n_words < words_per_doc:
+            sentence = rng.choice(CLAUSES).format(company=company)
+            sentences.append(sentence)
+            n_words += len(sentence.split())
+        with open(os.path.join(raw_dir, f"{company}_{doc_type}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join(sentences))
+    return companies[: (n_docs - 1) // len(DOC_TYPES) + 1]
+
+
+def generate_queries(companies, n_queries, seed=42):
+    rng = random.Random(seed)
+    return [rng.choice(QUERY_TEMPLATES).format(company=rng.choice(companies)) for _ in range(n_queries)]
+
+# ==============================
+# MEASUREMENT HELPERS
+# ==============================
+def peak_rss_mb():
+    """Peak resident set size of this process so far (monotonic)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(pct(50), 3),
+        "p90_ms": round(pct(90), 3),
+        "p99_ms": round(pct(99), 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def timed_stage(name, fn, unit):
+    """Run one ingestion stage and return its timing record."""
+    start = time.perf_counter()
+    items = fn()
+    elapsed = time.perf_counter() - start
+    record = {
+        "seconds": round(elapsed, 4),
+        "items": items,
+        "unit": unit,
+        "throughput_per_s": round(items / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(f"  ⏱️ {name:<8} {elapsed:8.3f}s  {items:>7} {unit:<6} {record['throughput_per_s']}/s")
+    return record
+
+
+def dir_size_mb(path, exclude=()):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in exclude]
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / (1024 * 1024), 3)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# ==============================
+# BENCHMARKS
+# ==============================
+def bench_ingestion(work_dir, n_docs, words_per_doc):
+    import data_processing
+    import chunking
+    import dedup
+    import embedding_generation
+    import upload_qdrant
+    import sentence_index
+    from collection_registry import collection_embedder
+    from text_store import text_store_path
+
+    raw_dir = os.path.join(work_dir, "raw", "text")
+    processed = os.path.join(work_dir, "processed", "tosdr_docs.jsonl")
+    chunked = os.path.join(work_dir, "processed", "tosdr_docs_chunked.jsonl")
+    deduped = os.path.join(work_dir, "processed", "tosdr_docs_deduped.jsonl")
+    dedup_report = os.path.join(work_dir, "processed", "dedup_report.json")
+    embedded = os.path.join(work_dir, "processed", "tosdr_docs_embedded.jsonl")
+
+    companies = generate_corpus(raw_dir, n_docs, words_per_doc)
+
+    stages = {}
+    stages["process"] = timed_stage("process", lambda: data_processing.process_text_files(raw_dir, processed), "docs")
+    stages["chunk"] = timed_stage("chunk", lambda: chunking.chunk_documents(processed, chunked), "chunks")
+    stages["dedup"] = timed_stage("dedup", lambda: dedup.dedup_chunks(chunked, deduped, dedup_report), "chunks")
+    with open(dedup_report, "r", encoding="utf-8") as f:
+        stages["dedup"]["duplicate_rate"] = json.load(f)["duplicate_rate"]
+    stages["embed"] = timed_stage(
+        "embed",
+        lambda: embedding_generation.embed_documents_batched(deduped, embedded, batch_size=64, sleep_between=0),
+        "chunks",
+    )
+    qdrant_path = os.environ["QDRANT_STORAGE_PATH"]
+    stages["upload"] = timed_stage(
+        "upload", lambda: upload_qdrant.main(embedded, qdrant_path, deduped, sentences=False), "points"
+    )
+    stages["sentences"] = timed_stage(
+        "sentences",
+        lambda: sentence_index.build_for_collection(qdrant_path, upload_qdrant.COLLECTION_NAME,
+                                                    collection_embedder())["passages"],
+        "passages",
+    )
+
+    text_dir = text_store_path(qdrant_path, upload_qdrant.COLLECTION_NAME)
+    stages["upload"]["vector_store_mb"] = dir_size_mb(qdrant_path, exclude=(os.path.dirname(text_dir),))
+    stages["upload"]["text_store_mb"] = dir_size_mb(text_dir)
+    return stages, companies
+
+
+def bench_query_path(queries, concurrency, profile=None):
+    import rag_pipeline
+    import profiling
+
+    stage_ms = {"embed": [], "search": [], "prompt": [], "llm": [], "total": []}
+    context_chars = []
+
+    def run_query(query):
+        with profiling.profiled("query", profile) if profile else contextlib.nullcontext():
+            return timed_query(query)
+
+    def timed_query(query):
+        t0 = time.perf_counter()
+        embedding = rag_pipeline.get_embedder().embed_query(query)
+        t1 = time.perf_counter()
+        hits = rag_pipeline.retrieve(query, embedding, top_k=rag_pipeline.TOP_K)
+        t2 = time.perf_counter()
+        messages = rag_pipeline.build_prompt(hits, query, embedding)
+        t3 = time.perf_counter()
+        context_chars.append(len(messages[-1]["content"]))
+        rag_pipeline.call_llm(rag_pipeline.get_chat_client(), messages)
+        t4 = time.perf_counter()
+        return [(t1 - t0), (t2 - t1), (t3 - t2), (t4 - t3), (t4 - t0)]
+
+    # Warm up: opens the embedded Qdrant client and loads the collection
+    timed_query(queries[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for timings in executor.map(run_query, queries):
+            for key, seconds in zip(stage_ms, timings):
+                stage_ms[key].append(seconds * 1000)
+    elapsed = time.perf_counter() - start
+
+    # Release the storage lock so the next scale can re-upload
+    rag_pipeline.registry.close_all()
+
+    result = {
+        "queries": len(queries),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "qps": round(len(queries) / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "avg_prompt_chars": round(sum(context_chars) / len(context_chars)),
+        "latency": {key: percentiles(samples) for key, samples in stage_ms.items()},
+    }
+    total = result["latency"]["total"]
+    print(f"  🔎 query    {elapsed:8.3f}s  {len(queries):>7} queries {result['qps']}/s "
+          f"p50 {total['p50_ms']}ms p99 {total['p99_ms']}ms")
+    return result
+
+
+def run(args):
+    work_root = tempfile.mkdtemp(prefix="tosdr_bench_")
+    # Must be configured before any pipeline module is imported
+    os.environ["LLM_PROVIDER"] = "mock"
+    os.environ.setdefault("MOCK_CHAT_LATENCY", str(args.llm_latency))
+    os.environ["QDRANT_STORAGE_PATH"] = os.path.join(work_root, "qdrant_data")
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "scales": {},
+    }
+
+    try:
+        for n_docs in args.scales:
+            print(f"\n🚀 Scale: {n_docs} documents")
+            work_dir = os.path.join(work_root, f"scale_{n_docs}")
+            ingestion, companies = bench_ingestion(work_dir, n_docs, args.words_per_doc)
+            queries = generate_queries(companies, args.queries)
+            query = bench_query_path(queries, args.concurrency, args.profile)
+            results["scales"][str(n_docs)] = {"ingestion": ingestion, "query": query}
+            if args.profile:
+                results["scales"][str(n_docs)]["profile"] = export_profile(f"{results['commit']}_{n_docs}")
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Benchmark results saved to {output}")
+
+def export_profile(name):
+    """Write the query-path profile of one scale next to the results and print its hottest functions."""
+    import profiling
+
+    paths = profiling.store.export(os.path.join(RESULTS_DIR, "profiles", name))
+    summary = profiling.store.summary(10)
+    rows = summary["top_cprofile"] or summary["top_sampled"]
+    for row in rows:
+        share = f"{row['own_ms']:9.1f}ms" if "own_ms" in row else f"{row['self_pct']:8.1f}%"
+        print(f"  🔥 {share}  {row['function']}")
+    print(f"  📁 profile: {', '.join(paths.values())}")
+    profiling.store.reset()
+    return paths
+
+# ==============================
+# COMPARISON
+# ==============================
+def compare(old_path, new_path):
+    """Print per-stage deltas between two results files."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    def delta(a, b):
+        if not a or b is None:
+            return "n/a"
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    print(f"Comparing {old['commit']} → {new['commit']}")
+    for scale in sorted(set(old["scales"]) & set(new["scales"]), key=int):
+        o, n = old["scales"][scale], new["scales"][scale]
+        print(f"\n=== Scale {scale} ===")
+        for stage in n["ingestion"]:
+            if stage in o["ingestion"]:
+                a, b = o["ingestion"][stage]["seconds"], n["ingestion"][stage]["seconds"]
+                print(f"{stage:<8} {a:9.3f}s → {b:9.3f}s  ({delta(a, b)})")
+        a, b = o["query"]["qps"], n["query"]["qps"]
+        print(f"{'qps':<8} {a:>9} → {b:>9}  ({delta(a, b)})")
+        a, b = o["query"].get("avg_prompt_chars"), n["query"].get("avg_prompt_chars")
+        print(f"{'prompt':<8} {a!s:>9} → {b!s:>9}  ({delta(a, b)})")
+        for key in ("p50_ms", "p99_ms"):
+            a = o["query"]["latency"]["total"][key]
+            b = n["query"]["latency"]["total"][key]
+            print(f"{key:<8} {a:>9} → {b:>9}  ({delta(a, b)})")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the ToSDR-RAG ingestion and query paths offline.")
+    parser.add_argument("--scales", type=lambda s: [int(x) for x in s.split(",")], default=[50, 200],
+                        help="comma-separated corpus sizes (number of documents)")
+    parser.add_argument("--words-per-doc", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="mock LLM latency in seconds")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    parser.add_argument("--profile", choices=("sample", "cprofile"),
+                        help="profile every query (writes benchmarks/results/profiles/<commit>_<scale>/)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
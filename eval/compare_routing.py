@@ -0,0 +1,141 @@
+"""
+compare_routing.py
+Compare model routing policies (model_router.POLICIES) offline on the
+retrieval ground-truth queries.
+
+Retrieval and prompt building run once per query; every policy then answers
+the same prompts, so differences come from routing alone. For each policy
+the script reports requests per route, escalation rate, latency percentiles,
+tokens (including prompt-cache hits) and cost, and optionally the relevance
+rate from an LLM judge (`--judge gpt-4o`, reusing llm_eval.judge_answer).
+
+Usage:
+    python eval/compare_routing.py
+    python eval/compare_routing.py --policies large tiered --no-fallback --judge gpt-4o
+    EVAL_COLLECTION=acme python eval/compare_routing.py
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime
+from tqdm import tqdm
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT / "src"))
+
+import rag_pipeline
+from model_router import POLICIES, ROUTES, route_completion
+
+EVAL_FILE = PROJECT_ROOT / "eval" / "retrieval_eval_ground_truth.json"
+RESULTS_FILE = PROJECT_ROOT / "eval" / "results" / "routing_comparison.json"
+EVAL_COLLECTION = os.getenv("EVAL_COLLECTION")  # None: the default collection
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else None
+
+
+def build_prompts(queries):
+    """(query, hits, prompt messages) for every query that would reach the LLM."""
+    prompts, early_exits = [], 0
+    for query in tqdm(queries, desc="Retrieving"):
+        embedding = rag_pipeline.get_embedder(EVAL_COLLECTION).embed_query(query)
+        thresholds = rag_pipeline.get_score_thresholds(EVAL_COLLECTION)
+        hits = rag_pipeline.select_hits(rag_pipeline.retrieve(query, embedding, top_k=thresholds["max_k"],
+                                                              collection=EVAL_COLLECTION), thresholds)
+        if not hits:
+            early_exits += 1  # answered without an LLM call under every policy
+            continue
+        prompts.append((query, hits, rag_pipeline.build_prompt(hits, query, embedding, EVAL_COLLECTION)))
+    return prompts, early_exits
+
+
+def run_policy(policy, prompts, fallback):
+    results = []
+    for query, hits, messages in tqdm(prompts, desc=f"Policy {policy}"):
+        result = route_completion(rag_pipeline.get_chat_client(), messages, query, hits, policy=policy, fallback=fallback)
+        results.append({"query": query, **{k: result[k] for k in
+                        ("answer", "model", "route", "reason", "seconds", "prompt_tokens", "cached_tokens",
+                         "completion_tokens", "cost_usd")}})
+    return results
+
+
+def summarize(results):
+    seconds = [r["seconds"] for r in results]
+    return {
+        "requests": len(results),
+        "routes": {route: sum(r["route"] == route for r in results) for route in ROUTES},
+        "escalation_rate": round(sum(r["route"] == "escalated" for r in results) / len(results), 4) if results else 0.0,
+        "latency_p50_s": round(percentile(seconds, 0.5), 4) if seconds else None,
+        "latency_p95_s": round(percentile(seconds, 0.95), 4) if seconds else None,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+        "cached_tokens": sum(r["cached_tokens"] for r in results),
+        "completion_tokens": sum(r["completion_tokens"] for r in results),
+        "cost_usd": round(sum(r["cost_usd"] for r in results), 6),
+    }
+
+
+def judge(results, judge_model):
+    import llm_eval  # only needed when judging
+    limiter = llm_eval.RateLimiter(llm_eval.REQUESTS_PER_SECOND)
+    relevant = 0
+    for r in tqdm(results, desc=f"Judging with {judge_model}"):
+        judgement, _ = llm_eval.judge_answer(judge_model, r["query"], r["answer"], limiter)
+        r["judgement"] = judgement
+        relevant += judgement.lower().startswith("relevant")
+    return round(relevant / len(results), 4) if results else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model routing policies offline.")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=list(POLICIES))
+    parser.add_argument("--no-fallback", action="store_true", help="never escalate small-model answers")
+    parser.add_argument("--judge", help="judge model for relevance (costs one call per answer and policy)")
+    parser.add_argument("--limit", type=int, help="only use the first N ground-truth queries")
+    args = parser.parse_args()
+
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        eval_data = json.load(f)[:args.limit]
+    print(f"📄 Loaded {len(eval_data)} evaluation queries from {EVAL_FILE}")
+
+    prompts, early_exits = build_prompts([item["query"] for item in eval_data])
+
+    comparison = {}
+    details = {}
+    for policy in args.policies:
+        results = run_policy(policy, prompts, fallback=not args.no_fallback)
+        comparison[policy] = summarize(results)
+        if args.judge:
+            comparison[policy]["relevance_rate"] = judge(results, args.judge)
+        details[policy] = results
+
+    RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "queries": len(eval_data),
+            "early_exits": early_exits,
+            "fallback": not args.no_fallback,
+            "judge": args.judge,
+            "summary": comparison,
+            "results": details,
+        }, f, indent=2, ensure_ascii=False)
+
+    print("\n===============================")
+    for policy, stats in comparison.items():
+        routes = ", ".join(f"{route} {n}" for route, n in stats["routes"].items())
+        line = (f"🧭 {policy:<7} {routes} | p50 {stats['latency_p50_s']}s p95 {stats['latency_p95_s']}s | "
+                f"${stats['cost_usd']:.4f}")
+        if "relevance_rate" in stats:
+            line += f" | relevant {stats['relevance_rate']:.1%}"
+        print(line)
+    print("===============================")
+    print(f"✅ Results saved to {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,168 @@
+"""
+llm_eval.py
+LLM-as-a-judge evaluation of the RAG pipeline.
+
+- RAG answers are generated once through `rag_pipeline.rag` and cached by
+  (query, index version, prompt version, retrieval thresholds, routing
+  policy), so re-runs only pay for the judges.
+- Judge calls fan out concurrently under a shared rate limiter.
+- Every judgement is appended to a JSONL log, so an interrupted run resumes
+  where it stopped.
+- EVAL_COLLECTION picks the collection to evaluate (default: the default collection).
+"""
+
 import sys
-from pathlib import Path
-import json
-from time import sleep
+import os
 import json
-from qdrant_client import QdrantClient
+import time
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-import os
-from openai import AzureOpenAI
 from dotenv import load_dotenv
 load_dotenv()
 
 # ------------------------
 # Paths and Imports
 # ------------------------
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
 # Add src folder to sys.path to import rag_pipeline
-sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.append(str(PROJECT_ROOT / "src"))
 
-# Import your RAG answer generation function
-from rag_pipeline import get_answer  # <-- make sure this matches your function
+from rag_pipeline import rag, PROMPT_VERSION, get_score_thresholds
+from collection_registry import storage_path
+from providers import get_chat_client
+from model_router import MODEL_PRICING, ROUTING_POLICY
+
+EVAL_FILE = PROJECT_ROOT / "eval" / "retrieval_eval_ground_truth.json"
+RESULTS_DIR = PROJECT_ROOT / "eval" / "results"
+ANSWER_CACHE_FILE = RESULTS_DIR / "rag_answer_cache.jsonl"
+JUDGE_LOG_FILE = RESULTS_DIR / "llm_judge_log.jsonl"
+SUMMARY_FILE = RESULTS_DIR / "llm_judge_summary.json"
+EVAL_COLLECTION = os.getenv("EVAL_COLLECTION")  # None: the default collection
 
 # ------------------------
-# Azure OpenAI Config
+# Judge Config
 # ------------------------
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
-EMBED_MODEL = "text-embedding-3-small"
-
 MODELS = ["gpt-4o", "gpt-4o-mini"]  # Azure deployment names
+JUDGE_PROMPT_VERSION = "v1"
+
+# --- Concurrency ---
+MAX_WORKERS = 8           # concurrent judge calls
+REQUESTS_PER_SECOND = 4   # shared across all workers to avoid throttling
+RETRY_LIMIT = 3
 
-client_openai = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_version=AZURE_OPENAI_API_VERSION
-)
 
 # ------------------------
-# Load queries
+# Helpers
 # ------------------------
-with open("../retrieval_eval_ground_truth.json", "r", encoding="utf-8") as f:
-    ground_truth = json.load(f)
+class RateLimiter:
+    """Thread-safe limiter that spaces calls at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def get_index_version(qdrant_path=None) -> str:
+    """
+    Fingerprint the local Qdrant storage (file names, sizes, mtimes) so cached
+    answers are invalidated whenever the index is rebuilt.
+    Can be pinned explicitly with the INDEX_VERSION environment variable.
+    """
+    if os.getenv("INDEX_VERSION"):
+        return os.getenv("INDEX_VERSION")
+    qdrant_path = qdrant_path or storage_path(EVAL_COLLECTION)
+    h = hashlib.sha256()
+    for root, _, files in sorted(os.walk(qdrant_path)):
+        for name in sorted(files):
+            if name == ".lock":
+                continue
+            stat = os.stat(os.path.join(root, name))
+            rel = os.path.relpath(os.path.join(root, name), qdrant_path)
+            h.update(f"{rel}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def answer_cache_key(query: str, index_version: str) -> str:
+    # retrieval thresholds decide which chunks (if any) reach the prompt
+    thresholds = json.dumps(get_score_thresholds(EVAL_COLLECTION), sort_keys=True)
+    raw = f"{query}\x00{index_version}\x00{PROMPT_VERSION}\x00{thresholds}\x00{ROUTING_POLICY}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_jsonl(path):
+    records = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # partially written line from an interrupted run
+    return records
+
+
+def append_jsonl(path, record, lock):
+    with lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def get_cached_answers(ground_truth, index_version):
+    """
+    Return {cache_key: answer} for every query, generating only the
+    answers that are not already cached for this index/prompt version.
+    """
+    cache = {r["key"]: r["answer"] for r in load_jsonl(ANSWER_CACHE_FILE)}
+    lock = threading.Lock()
+    answers = {}
+
+    missing = []
+    for item in ground_truth:
+        key = answer_cache_key(item["query"], index_version)
+        if key in cache:
+            answers[key] = cache[key]
+        else:
+            missing.append((key, item["query"]))
+
+    print(f"⏩ Cached RAG answers: {len(answers)} | to generate: {len(missing)}")
+
+    # Embedded Qdrant allows a single client per storage folder, so answers are
+    # generated sequentially; only the judge calls below run concurrently.
+    for key, query in tqdm(missing, desc="Generating RAG answers"):
+        answer = rag(query, EVAL_COLLECTION)
+        if not answer:
+            print(f"No answer generated for query: {query}")
+            continue
+        answers[key] = answer
+        append_jsonl(ANSWER_CACHE_FILE, {
+            "key": key,
+            "query": query,
+            "index_version": index_version,
+            "prompt_version": PROMPT_VERSION,
+            "answer": answer,
+        }, lock)
+
+    return answers
 
 # ------------------------
 # LLM Judge Function
 # ------------------------
-def judge_answer(model_name, query, answer):
+def judge_answer(model_name, query, answer, limiter):
     """
     Ask the LLM to judge whether the answer is relevant to the query.
-    Returns "Relevant" or "Not Relevant".
+    Returns (judgement, usage) where judgement is "Relevant", "Not Relevant" or "Error".
     """
     prompt = f"""
 You are an evaluation assistant. Your task is to compare the following question and answer.
@@ -57,48 +172,133 @@ Answer: {answer}
 
 Determine if the answer is relevant to the question. Only reply with one of these words: "Relevant" or "Not Relevant".
 """
-    try:
-        response = client_openai.chat.completions.create(
-            deployment_name=model_name,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        judgement = response.choices[0].message.content.strip()
-        return judgement
-    except Exception as e:
-        print(f"Error evaluating model {model_name}: {e}")
-        return "Error"
+    for attempt in range(RETRY_LIMIT):
+        limiter.acquire()
+        try:
+            # Azure OpenAI, or the offline mock with LLM_PROVIDER=mock
+            response = get_chat_client().chat.completions.create(
+                model=model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0
+            )
+            judgement = response.choices[0].message.content.strip()
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+                "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+            }
+            return judgement, usage
+        except Exception as e:
+            print(f"⚠️ Error evaluating model {model_name} (attempt {attempt+1}): {e}")
+            time.sleep(2 ** attempt)
+    return "Error", {"prompt_tokens": 0, "completion_tokens": 0}
 
 # ------------------------
-# Run evaluation
+# Summary
 # ------------------------
-results = {model: [] for model in MODELS}
-
-for item in ground_truth:
-    query = item["query"]
-    
-    # 1️⃣ Generate answer using RAG pipeline
-    answer = get_answer(query)
-    if not answer:
-        print(f"No answer generated for query: {query}")
-        continue
-
-    # 2️⃣ Ask LLM judge for each model
+def summarize(records):
+    """Relevance rate, token usage and cost per judge model."""
+    summary = {}
     for model in MODELS:
-        judgement = judge_answer(model, query, answer)
-        results[model].append({
-            "query": query,
-            "answer": answer,
-            "judgement": judgement
-        })
-        # avoid throttling
-        sleep(0.5)
+        rows = [r for r in records if r["model"] == model]
+        judged = [r for r in rows if r["judgement"] != "Error"]
+        relevant = sum(1 for r in judged if r["judgement"].lower().startswith("relevant"))
+        prompt_tokens = sum(r["prompt_tokens"] for r in rows)
+        completion_tokens = sum(r["completion_tokens"] for r in rows)
+        price_in, price_out = MODEL_PRICING.get(model, (0.0, 0.0))
+        summary[model] = {
+            "judged": len(judged),
+            "errors": len(rows) - len(judged),
+            "relevance_rate": relevant / len(judged) if judged else 0.0,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round((prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000, 6),
+        }
+    return summary
 
 # ------------------------
-# Save results
+# Run evaluation
 # ------------------------
-for model in MODELS:
-    output_file = f"llm_judge_results_{model}.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(results[model], f, ensure_ascii=False, indent=2)
-    print(f"Saved results for {model} to {output_file}")
+def main():
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        ground_truth = json.load(f)
+    print(f"📄 Loaded {len(ground_truth)} evaluation queries from {EVAL_FILE}")
+
+    index_version = get_index_version()
+    print(f"🔖 Index version: {index_version} | prompt version: {PROMPT_VERSION}")
+
+    # 1️⃣ Generate (or reuse) answers using the RAG pipeline
+    answers = get_cached_answers(ground_truth, index_version)
+
+    # 2️⃣ Resume: skip (answer, model) pairs that already have a judgement
+    previous = [
+        r for r in load_jsonl(JUDGE_LOG_FILE)
+        if r.get("judge_prompt_version") == JUDGE_PROMPT_VERSION and r["key"] in answers
+    ]
+    done = {(r["key"], r["model"]) for r in previous if r["judgement"] != "Error"}
+    records = [r for r in previous if (r["key"], r["model"]) in done]
+
+    tasks = []
+    for item in ground_truth:
+        key = answer_cache_key(item["query"], index_version)
+        if key not in answers:
+            continue
+        for model in MODELS:
+            if (key, model) not in done:
+                tasks.append((key, item["query"], model))
+                done.add((key, model))  # guard against duplicate queries
+
+    print(f"⏩ Already judged: {len(records)} | remaining: {len(tasks)}")
+
+    # 3️⃣ Ask LLM judges concurrently
+    limiter = RateLimiter(REQUESTS_PER_SECOND)
+    log_lock = threading.Lock()
+
+    def run_task(key, query, model):
+        answer = answers[key]
+        judgement, usage = judge_answer(model, query, answer, limiter)
+        record = {
+            "key": key,
+            "model": model,
+            "judge_prompt_version": JUDGE_PROMPT_VERSION,
+            "query": query,
+            "answer": answer,
+            "judgement": judgement,
+            **usage,
+        }
+        append_jsonl(JUDGE_LOG_FILE, record, log_lock)
+        return record
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(run_task, *task) for task in tasks]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Judging answers"):
+            records.append(future.result())
+
+    # 4️⃣ Save results
+    for model in MODELS:
+        output_file = RESULTS_DIR / f"llm_judge_results_{model}.json"
+        rows = [
+            {"query": r["query"], "answer": r["answer"], "judgement": r["judgement"]}
+            for r in records if r["model"] == model
+        ]
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"Saved results for {model} to {output_file}")
+
+    summary = summarize(records)
+    with open(SUMMARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print("\n===============================")
+    for model, stats in summary.items():
+        print(f"🤖 {model}: relevance {stats['relevance_rate']:.3f} "
+              f"({stats['judged']} judged, {stats['errors']} errors) | "
+              f"tokens in/out {stats['prompt_tokens']}/{stats['completion_tokens']} | "
+              f"cost ${stats['cost_usd']:.4f}")
+    print("===============================")
+    print(f"✅ LLM evaluation completed! Summary saved to {SUMMARY_FILE}")
+
+
+if __name__ == "__main__":
+    main()
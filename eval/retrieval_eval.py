@@ -1,9 +1,8 @@
+import sys
 import json
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as rest
+from functools import lru_cache
 from tqdm import tqdm
 import os
-from openai import AzureOpenAI
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -11,65 +10,83 @@ load_dotenv()
 # CONFIG
 # ==============================
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-QDRANT_PATH = os.path.join(PROJECT_ROOT, "data/qdrant_data")
 EVAL_FILE = os.path.join(PROJECT_ROOT, "eval/retrieval_eval_ground_truth.json")
-COLLECTION_NAME = "tosdr_docs"
 TOP_K = 5
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
-EMBED_MODEL = "text-embedding-3-small"
 
-# ==============================
-# CONNECT TO EMBEDDED QDRANT
-# ==============================
-client = QdrantClient(path=QDRANT_PATH)
-print(f"✅ Connected to embedded Qdrant at {QDRANT_PATH}")
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+from collection_registry import default_collection, storage_path, collection_embedder
+from text_store import TextStore, text_store_path
 
+COLLECTION_NAME = os.getenv("EVAL_COLLECTION") or default_collection()
+QDRANT_PATH = storage_path(COLLECTION_NAME)
 
 # ==============================
-# CONNECT TO AZURE OPENAI
+# CONNECT TO EMBEDDED QDRANT (on first use)
 # ==============================
-client_openai = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_version=AZURE_OPENAI_API_VERSION
-)
+@lru_cache(maxsize=None)
+def get_client():
+    from qdrant_client import QdrantClient
+    client = QdrantClient(path=QDRANT_PATH)
+    print(f"✅ Connected to embedded Qdrant at {QDRANT_PATH}")
+    return client
+
 
 # ==============================
-# LOAD EVAL DATA
+# OPEN THE TEXT STORE (for the keyword side of hybrid search)
 # ==============================
-with open(EVAL_FILE, "r", encoding="utf-8") as f:
-    eval_data = json.load(f)
-
-print(f"📄 Loaded {len(eval_data)} evaluation queries from {EVAL_FILE}")
+@lru_cache(maxsize=None)
+def get_text_store():
+    text_store = TextStore(text_store_path(QDRANT_PATH, COLLECTION_NAME))
+    print(f"📝 Opened text store with {len(text_store)} chunk texts")
+    return text_store
 
 # ==============================
 # EVALUATION HELPERS
 # ==============================
 def embed_query(query_text: str) -> list[float]:
-    """Generate query embedding via Azure OpenAI."""
-    response = client_openai.embeddings.create(
-        model=EMBED_MODEL,
-        input=query_text
-    )
-    return response.data[0].embedding
+    """Generate query embedding with the collection's embedder (Azure OpenAI, fastembed or offline mock)."""
+    return collection_embedder(COLLECTION_NAME).embed_query(query_text)
 
 
 def compute_hit_rate(results, ground_truths, k=TOP_K):
     """Compute Hit Rate@k given retrieved results and ground truth IDs."""
     hits = 0
     for gt, res in zip(ground_truths, results):
-        topk_ids = [r.payload.get("source_id") for r in res[:k]]
+        topk_ids = []
+        for r in res[:k]:
+            topk_ids.append(r.payload.get("source_id"))
+            topk_ids.extend(r.payload.get("duplicate_ids", []))  # near-duplicates stored under this chunk
         if gt in topk_ids:
             hits += 1
     return hits / len(ground_truths)
 
 
+class TextHit:
+    """Text-only match, shaped like a Qdrant point for the fusion code below."""
+    def __init__(self, chunk_id):
+        self.id = chunk_id
+        self.payload = {"source_id": chunk_id}
+
+
+def text_scroll(match, limit):
+    """
+    Scan chunk texts for matches, like a scroll with a MatchText filter.
+    Chunk text lives in the text store rather than the point payloads; it is
+    streamed from there and lowercased, as `match` compares lowercased terms.
+    """
+    hits = []
+    for chunk_id, text in get_text_store().iter_items():
+        if match(text.lower()):
+            hits.append(TextHit(chunk_id))
+            if len(hits) >= limit:
+                break
+    return hits
+
+
 def run_vector_search(query_text):
     """Run pure vector search using query embedding."""
     query_vector = embed_query(query_text)
-    results = client.search(
+    results = get_client().search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=TOP_K,
@@ -80,7 +97,7 @@ def run_hybrid_search(query_text):
     """Run hybrid (text + vector) search using RRF (Reciprocal Rank Fusion)."""
     # Get vector search results
     query_vector = embed_query(query_text)
-    vector_results = client.search(
+    vector_results = get_client().search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=TOP_K * 3,  # Get more results for fusion
@@ -90,41 +107,18 @@ def run_hybrid_search(query_text):
     query_keywords = query_text.lower().split()
     
     # Strategy 1: Individual keywords (broader match)
-    keyword_filter = rest.Filter(
-        should=[
-            rest.FieldCondition(
-                key="content",
-                match=rest.MatchText(text=keyword)
-            ) for keyword in query_keywords if len(keyword) > 2  # Skip very short words
-        ]
-    )
+    keywords = [keyword for keyword in query_keywords if len(keyword) > 2]  # Skip very short words
     
     # Strategy 2: Phrase search (exact phrase matching)
-    phrase_filter = rest.Filter(
-        must=[
-            rest.FieldCondition(
-                key="content",
-                match=rest.MatchText(text=query_text.lower())
-            )
-        ]
-    )
+    phrase = query_text.lower()
     
     # Get results from both text search strategies
-    text_results_broad = client.scroll(
-        collection_name=COLLECTION_NAME,
-        scroll_filter=keyword_filter,
+    text_results_broad = text_scroll(
+        lambda text: any(keyword in text for keyword in keywords),
         limit=TOP_K * 2,
-        with_payload=True,
-        with_vectors=False
-    )[0] if len(query_keywords) > 0 else []
+    ) if len(query_keywords) > 0 else []
     
-    text_results_phrase = client.scroll(
-        collection_name=COLLECTION_NAME,
-        scroll_filter=phrase_filter,
-        limit=TOP_K,
-        with_payload=True,
-        with_vectors=False
-    )[0]
+    text_results_phrase = text_scroll(lambda text: phrase in text, limit=TOP_K)
     
     # Combine and deduplicate text results
     text_results_dict = {}
@@ -206,36 +200,50 @@ def run_hybrid_search(query_text):
     
     return hybrid_results
 
-# ==============================
-# RUN EVALUATION
-# ==============================
-vector_results = []
-hybrid_results = []
-ground_truth_ids = []
 
-print("\n🚀 Running retrieval evaluation...")
+def main():
+    # ==============================
+    # LOAD EVAL DATA
+    # ==============================
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        eval_data = json.load(f)
 
-for item in tqdm(eval_data):
-    query = item["query"]
-    answer_id = item["answer_id"]
-    ground_truth_ids.append(answer_id)
+    print(f"📄 Loaded {len(eval_data)} evaluation queries from {EVAL_FILE}")
 
-    # --- Vector Search ---
-    vector_res = run_vector_search(query)
-    vector_results.append(vector_res)
+    # ==============================
+    # RUN EVALUATION
+    # ==============================
+    vector_results = []
+    hybrid_results = []
+    ground_truth_ids = []
 
-    # --- Hybrid Search ---
-    hybrid_res = run_hybrid_search(query)
-    hybrid_results.append(hybrid_res)
+    print("\n🚀 Running retrieval evaluation...")
 
-# ==============================
-# COMPUTE METRICS
-# ==============================
-hit_rate_vector = compute_hit_rate(vector_results, ground_truth_ids, k=TOP_K)
-hit_rate_hybrid = compute_hit_rate(hybrid_results, ground_truth_ids, k=TOP_K)
-
-print("\n===============================")
-print(f"🔍 Hit Rate@{TOP_K} (Vector Search): {hit_rate_vector:.3f}")
-print(f"⚡ Hit Rate@{TOP_K} (Hybrid Search): {hit_rate_hybrid:.3f}")
-print("===============================")
-print("✅ Retrieval evaluation completed!")
\ No newline at end of file
+    for item in tqdm(eval_data):
+        query = item["query"]
+        answer_id = item["answer_id"]
+        ground_truth_ids.append(answer_id)
+
+        # --- Vector Search ---
+        vector_res = run_vector_search(query)
+        vector_results.append(vector_res)
+
+        # --- Hybrid Search ---
+        hybrid_res = run_hybrid_search(query)
+        hybrid_results.append(hybrid_res)
+
+    # ==============================
+    # COMPUTE METRICS
+    # ==============================
+    hit_rate_vector = compute_hit_rate(vector_results, ground_truth_ids, k=TOP_K)
+    hit_rate_hybrid = compute_hit_rate(hybrid_results, ground_truth_ids, k=TOP_K)
+
+    print("\n===============================")
+    print(f"🔍 Hit Rate@{TOP_K} (Vector Search): {hit_rate_vector:.3f}")
+    print(f"⚡ Hit Rate@{TOP_K} (Hybrid Search): {hit_rate_hybrid:.3f}")
+    print("===============================")
+    print("✅ Retrieval evaluation completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+tune_thresholds.py
+Tune the score-aware retrieval thresholds of `rag_pipeline.select_hits`
+against the retrieval ground truth.
+
+Each query is embedded and searched once (MAX_CANDIDATES hits); every
+threshold combination is then scored offline on the cached scores:
+- hit rate: the ground-truth chunk is among the selected hits
+- early exits on the ground-truth queries (all answerable, so these are misses)
+- early exits on off-topic queries (these should be refused)
+- average k (context chunks sent to the LLM)
+
+The chosen setting keeps the hit rate within HIT_RATE_TOLERANCE of the fixed
+top-k baseline. Among those settings it refuses the most off-topic queries,
+then prefers the smallest average k. It is written to eval/score_thresholds.json
+for the current embedding model; rag_pipeline loads it at query time.
+
+Usage:
+    python eval/tune_thresholds.py
+    EVAL_COLLECTION=acme python eval/tune_thresholds.py    # another collection (and its embedder)
+"""
+
+import os
+import sys
+import json
+import itertools
+from pathlib import Path
+from datetime import datetime
+from tqdm import tqdm
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT / "src"))
+
+import rag_pipeline
+from rag_pipeline import select_hits, SCORE_THRESHOLDS_FILE, TOP_K
+
+EVAL_FILE = PROJECT_ROOT / "eval" / "retrieval_eval_ground_truth.json"
+
+EVAL_COLLECTION = os.getenv("EVAL_COLLECTION")  # None: the default collection
+
+MAX_CANDIDATES = 10
+HIT_RATE_TOLERANCE = 0.02  # allowed hit-rate loss vs. fixed top-k
+MAX_K_GRID = [3, 5, 8]
+SCORE_GAP_GRID = [0.03, 0.05, 0.08, 0.1, 0.15, 1.0]
+SCORE_QUANTILES = [0.0, 0.01, 0.02, 0.05, 0.1, 0.2]  # of ground-truth top scores, for min_confidence
+
+# Questions the ToS;DR corpus cannot answer
+OFF_TOPIC_QUERIES = [
+    "What is the weather forecast for Paris tomorrow?",
+    "How do I bake sourdough bread?",
+    "Who won the football world cup in 2018?",
+    "What is the capital of Australia?",
+    "Recommend a good science fiction novel.",
+    "How many moons does Jupiter have?",
+    "What is the best way to learn the guitar?",
+    "Translate 'good morning' into Spanish.",
+    "How do I change a flat bicycle tire?",
+    "What are the symptoms of the common cold?",
+]
+
+
+class Scored:
+    """Minimal hit (id + score + duplicates) for offline threshold sweeps."""
+    def __init__(self, hit):
+        self.score = hit.score
+        self.ids = {hit.payload.get("source_id"), *hit.payload.get("duplicate_ids", [])}
+
+
+def search_all(queries):
+    results = []
+    for query in tqdm(queries):
+        embedding = rag_pipeline.get_embedder(EVAL_COLLECTION).embed_query(query)
+        hits = rag_pipeline.retrieve(query, embedding, top_k=MAX_CANDIDATES, collection=EVAL_COLLECTION)
+        results.append([Scored(hit) for hit in hits])
+    return results
+
+
+def evaluate(thresholds, answerable, answer_ids, off_topic):
+    hits, exits, k_total = 0, 0, 0
+    for candidates, answer_id in zip(answerable, answer_ids):
+        selected = select_hits(candidates, thresholds)
+        if not selected:
+            exits += 1
+            continue
+        k_total += len(selected)
+        hits += any(answer_id in hit.ids for hit in selected)
+    refused = sum(not select_hits(candidates, thresholds) for candidates in off_topic)
+    answered = len(answerable) - exits
+    return {
+        "hit_rate": round(hits / len(answerable), 4),
+        "answerable_early_exit_rate": round(exits / len(answerable), 4),
+        "off_topic_refusal_rate": round(refused / len(off_topic), 4),
+        "avg_k": round(k_total / answered, 3) if answered else 0.0,
+    }
+
+
+def quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+def main():
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        eval_data = json.load(f)
+    print(f"📄 Loaded {len(eval_data)} evaluation queries from {EVAL_FILE}")
+
+    print("🚀 Searching ground-truth and off-topic queries...")
+    answerable = search_all([item["query"] for item in eval_data])
+    answer_ids = [item["answer_id"] for item in eval_data]
+    off_topic = search_all(OFF_TOPIC_QUERIES)
+
+    baseline = evaluate({"min_score": 0.0, "min_confidence": 0.0, "score_gap": float("inf"), "max_k": TOP_K},
+                        answerable, answer_ids, off_topic)
+    print(f"📏 Baseline (fixed top-{TOP_K}): hit rate {baseline['hit_rate']:.3f}")
+
+    top_scores = [candidates[0].score for candidates in answerable if candidates]
+    all_scores = [hit.score for candidates in answerable for hit in candidates]
+    confidence_grid = sorted({0.0, *(round(quantile(top_scores, q), 4) for q in SCORE_QUANTILES)})
+    min_score_grid = sorted({0.0, *(round(quantile(all_scores, q), 4) for q in (0.1, 0.25, 0.5))})
+
+    best = None
+    for min_confidence, min_score, score_gap, max_k in itertools.product(
+            confidence_grid, min_score_grid, SCORE_GAP_GRID, MAX_K_GRID):
+        thresholds = {"min_score": min_score, "min_confidence": min_confidence,
+                      "score_gap": score_gap, "max_k": max_k}
+        metrics = evaluate(thresholds, answerable, answer_ids, off_topic)
+        if metrics["hit_rate"] < baseline["hit_rate"] - HIT_RATE_TOLERANCE:
+            continue
+        rank = (metrics["off_topic_refusal_rate"], metrics["hit_rate"], -metrics["avg_k"])
+        if best is None or rank > best[0]:
+            best = (rank, thresholds, metrics)
+
+    _, thresholds, metrics = best  # the all-zero setting always qualifies
+    result = {
+        "embedding_model": rag_pipeline.get_embedder(EVAL_COLLECTION).model_name,
+        **thresholds,
+        "metrics": metrics,
+        "baseline": baseline,
+        "queries": len(eval_data),
+        "tuned_at": datetime.now().isoformat(),
+    }
+    with open(SCORE_THRESHOLDS_FILE, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print("\n===============================")
+    print(f"🎚️ min_confidence={thresholds['min_confidence']} | min_score={thresholds['min_score']} | "
+          f"score_gap={thresholds['score_gap']} | max_k={thresholds['max_k']}")
+    print(f"🔍 Hit rate: {metrics['hit_rate']:.3f} (baseline {baseline['hit_rate']:.3f}) | avg k: {metrics['avg_k']}")
+    print(f"🚫 Off-topic refused: {metrics['off_topic_refusal_rate']:.0%} | "
+          f"answerable refused: {metrics['answerable_early_exit_rate']:.0%}")
+    print("===============================")
+    print(f"✅ Thresholds saved to {SCORE_THRESHOLDS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,15 @@ set -e  # stop if any script fails
 
 echo "Running data ingestion pipeline..."
 
-python src/data_ingestion.py
-python src/data_processing.py
-python src/chunking.py
-python src/embedding_ingestion.py
-python src/upload_qdrant.py
+# All stages run in one process with overlapping stages and checkpoints
+# (see src/ingestion_pipeline.py). Re-running resumes an interrupted ingestion.
+# COLLECTION=<name> ingests another collection from collections.json.
+python src/ingestion_pipeline.py ${COLLECTION:+--collection "$COLLECTION"} "$@"
+
+# Serving nodes start from the snapshot instead of re-running ingestion
+if [ "${EXPORT_SNAPSHOT:-0}" = "1" ]; then
+    echo "Exporting index snapshot..."
+    python src/index_snapshot.py export ${COLLECTION:+--collection "$COLLECTION"}
+fi
 
 echo "Ingestion complete!"
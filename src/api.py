@@ -0,0 +1,193 @@
+"""
+api.py
+JSON API for internal services, next to the HTML form (registered under /api).
+
+- POST /api/search  {"query", "limit"?, "offset"?, "include_text"?, "collection"?}
+    retrieval only: ranked chunk ids with scores and sources, paginated with
+    offset/limit (`next_offset` is null on the last page)
+- POST /api/answer  {"query", "collection"?}
+    the RAG answer with its model route and the hits it was built from
+- POST /api/batch   {"queries": [...], "mode": "answer" | "search", "limit"?, "include_text"?, "collection"?}
+    many queries at once: identical queries are answered once, all distinct
+    queries are embedded in a single batched call, and retrieval and LLM
+    calls then run concurrently on BATCH_WORKERS threads
+
+`collection` selects one of the configured collections (collection_registry.py;
+default: the default collection); unknown collections are a 404.
+Every response carries per-stage timings in milliseconds (`timings_ms`).
+Responses are serialized with orjson when it is installed.
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Response, request
+
+import rag_pipeline
+from collection_registry import collection_names, default_collection, registry
+from singleflight import SingleFlight, normalize_query
+
+try:
+    import orjson
+except ImportError:  # optional dependency; falls back to the standard library
+    orjson = None
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+MAX_BATCH_QUERIES = int(os.getenv("API_MAX_BATCH_QUERIES", "64"))
+BATCH_WORKERS = int(os.getenv("API_BATCH_WORKERS", "8"))
+MODES = ("answer", "search")
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Identical concurrent API answers share one RAG call (see singleflight.py)
+api_flight = SingleFlight(lock_dir=os.getenv("SINGLEFLIGHT_DIR"))
+
+
+class ApiError(Exception):
+    """Invalid request; reported as a JSON error with `status`."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def json_response(data, status: int = 200) -> Response:
+    body = orjson.dumps(data) if orjson is not None else json.dumps(data, ensure_ascii=False)
+    return Response(body, status=status, mimetype="application/json")
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(error):
+    return json_response({"error": error.message}, error.status)
+
+# -----------------------------
+# Request parsing
+# -----------------------------
+def _body() -> dict:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError("Expected a JSON object body")
+    return data
+
+
+def _query(value) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ApiError("'query' must be a non-empty string")
+    return value
+
+
+def _collection(data) -> str:
+    name = data.get("collection", default_collection())
+    if not isinstance(name, str) or name not in collection_names():
+        raise ApiError(f"Unknown collection {name!r}", 404)
+    return name
+
+
+def _int(data, key, default, low, high) -> int:
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise ApiError(f"'{key}' must be an integer between {low} and {high}")
+    return value
+
+# -----------------------------
+# Handlers (shared by the single and batch endpoints)
+# -----------------------------
+def search(query: str, query_embedding, limit: int, offset: int, include_text: bool, collection: str) -> dict:
+    start = time.perf_counter()
+    hits = rag_pipeline.retrieve(query, query_embedding, top_k=limit, offset=offset, collection=collection)
+    search_ms = (time.perf_counter() - start) * 1000
+    results = [rag_pipeline.describe_hit(hit) for hit in hits]
+    if include_text:
+        with registry.acquire(collection) as handle:
+            for hit, result in zip(hits, results):
+                text = hit.payload.get("content")  # older indexes keep the text in the payload
+                result["text"] = text if text is not None else (
+                    handle.text_store.get(result["chunk_id"]) if handle.text_store else None)
+    return {
+        "query": query,
+        "collection": collection,
+        "results": results,
+        "offset": offset,
+        "next_offset": offset + len(results) if len(results) == limit else None,
+        "timings_ms": {"search": round(search_ms, 2),
+                       "fetch": round((time.perf_counter() - start) * 1000 - search_ms, 2)},
+    }
+
+
+def answer(query: str, collection: str, query_embedding=None) -> dict:
+    # namespaced: with SINGLEFLIGHT_DIR the form's flight shares the lock directory
+    result = api_flight.do(f"api:{collection}:{normalize_query(query)}",
+                           lambda: rag_pipeline.answer(query, query_embedding, collection))
+    return {"query": query, "collection": collection, **result}
+
+# -----------------------------
+# Endpoints
+# -----------------------------
+@api.route("/search", methods=["POST"])
+def search_endpoint():
+    data = _body()
+    query = _query(data.get("query"))
+    limit = _int(data, "limit", DEFAULT_SEARCH_LIMIT, 1, MAX_SEARCH_LIMIT)
+    offset = _int(data, "offset", 0, 0, 10_000)
+    collection = _collection(data)
+    start = time.perf_counter()
+    embedding = rag_pipeline.get_embedder(collection).embed_query(query)
+    embed_ms = (time.perf_counter() - start) * 1000
+    result = search(query, embedding, limit, offset, bool(data.get("include_text")), collection)
+    result["timings_ms"] = {"embed": round(embed_ms, 2), **result["timings_ms"],
+                            "total": round((time.perf_counter() - start) * 1000, 2)}
+    return json_response(result)
+
+
+@api.route("/answer", methods=["POST"])
+def answer_endpoint():
+    data = _body()
+    return json_response(answer(_query(data.get("query")), _collection(data)))
+
+
+@api.route("/batch", methods=["POST"])
+def batch_endpoint():
+    data = _body()
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ApiError("'queries' must be a non-empty list of strings")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ApiError(f"At most {MAX_BATCH_QUERIES} queries per batch", 413)
+    queries = [_query(query) for query in queries]
+    mode = data.get("mode", "answer")
+    if mode not in MODES:
+        raise ApiError(f"'mode' must be one of {', '.join(MODES)}")
+    limit = _int(data, "limit", DEFAULT_SEARCH_LIMIT, 1, MAX_SEARCH_LIMIT)
+    include_text = bool(data.get("include_text"))
+    collection = _collection(data)
+
+    start = time.perf_counter()
+    # Identical questions (ignoring case and whitespace) are computed once
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), query)
+    keys = list(unique)
+    embeddings = rag_pipeline.get_embedder(collection).embed_queries([unique[key] for key in keys])
+    embed_ms = (time.perf_counter() - start) * 1000
+
+    def run(key, embedding):
+        if mode == "search":
+            return search(unique[key], embedding, limit, 0, include_text, collection)
+        return answer(unique[key], collection, embedding)
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(keys))) as executor:
+        results = dict(zip(keys, executor.map(run, keys, embeddings)))
+
+    return json_response({
+        "mode": mode,
+        "collection": collection,
+        "count": len(queries),
+        "unique": len(keys),
+        # per-query timings exclude the shared embedding call
+        "results": [{**results[normalize_query(query)], "query": query} for query in queries],
+        "timings_ms": {"embed": round(embed_ms, 2),
+                       "total": round((time.perf_counter() - start) * 1000, 2)},
+    })
@@ -1,26 +1,46 @@
 from flask import Flask, render_template, request, jsonify
-from rag_pipeline import rag  # your RAG pipeline
+from rag_pipeline import rag, get_query_stats  # your RAG pipeline
+from singleflight import SingleFlight, normalize_query
+from model_router import get_routing_stats
+from index_snapshot import NoSnapshotError, import_all
+from collection_registry import collection_names, default_collection, registry
+from api import api, api_flight
+import profiling
 import os
 import json
 import datetime
 
 template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
 app = Flask(__name__, template_folder=template_dir)
+app.register_blueprint(api)  # JSON endpoints under /api (api.py)
+profiling.init_app(app)  # opt-in request profiling and /profile endpoints (profiling.py)
 
-# Create feedback log directory if it doesn't exist
 log_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "logs"))
-os.makedirs(log_dir, exist_ok=True)
 feedback_log_file = os.path.join(log_dir, "feedback.jsonl")
 
+# Identical concurrent queries share one RAG call. Set SINGLEFLIGHT_DIR to a
+# local directory to coalesce across worker processes as well.
+rag_flight = SingleFlight(lock_dir=os.getenv("SINGLEFLIGHT_DIR"))
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     answer = None
     query = ""
-    if request.method == "POST":
+    collection = request.values.get("collection") or default_collection()
+    if collection not in collection_names():
+        answer = f"Unknown collection '{collection}'."
+    elif request.method == "POST":
         query = request.form.get("query", "")
         if query.strip():
-            answer = rag(query)
-    return render_template("index.html", query=query, answer=answer)
+            answer = rag_flight.do(f"{collection}:{normalize_query(query)}", lambda: rag(query, collection))
+    return render_template("index.html", query=query, answer=answer,
+                           collection=collection, collections=collection_names())
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Query-path counters: LLM calls made and saved by early exits, adaptive k, model routes, coalesced requests, loaded collections."""
+    return jsonify({**get_query_stats(), "routing": get_routing_stats(), "coalescing": dict(rag_flight.stats),
+                    "api_coalescing": dict(api_flight.stats), "collections": registry.stats()})
 
 @app.route("/feedback", methods=["POST"])
 def submit_feedback():
@@ -33,12 +53,14 @@ def submit_feedback():
         # Create feedback entry
         feedback_entry = {
             "timestamp": datetime.datetime.now().isoformat(),
+            "collection": data.get("collection") or default_collection(),
             "query": query,
             "answer": answer,
             "rating": rating
         }
         
-        # Log feedback to file
+        # Log feedback to file (creating the log directory on first use)
+        os.makedirs(log_dir, exist_ok=True)
         with open(feedback_log_file, "a", encoding="utf-8") as f:
             f.write(json.dumps(feedback_entry) + "\n")
         
@@ -47,5 +69,22 @@ def submit_feedback():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def load_index_snapshots(path=None):
+    """
+    Startup step: import the newest snapshot of each configured collection from
+    INDEX_SNAPSHOT (index_snapshot.py), so serving nodes can start without
+    running ingestion. Already loaded snapshots are skipped. Without any
+    snapshot the app serves the index already in its Qdrant storage.
+    """
+    path = path or os.getenv("INDEX_SNAPSHOT")
+    if not path:
+        return
+    try:
+        import_all(path)
+    except NoSnapshotError as e:
+        print(f"⚠️ {e}; serving the existing index. Build a snapshot with "
+              "`EXPORT_SNAPSHOT=1 bash shell_scripts/run_ingestion.sh` or `python src/index_snapshot.py export`.")
+
 if __name__ == "__main__":
+    load_index_snapshots()
     app.run(debug=True)
\ No newline at end of file
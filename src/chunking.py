@@ -1,5 +1,6 @@
 import json
 import os
+import re
 from textwrap import wrap
 
 INPUT_FILE = "data/processed/tosdr_docs.jsonl"
@@ -21,34 +22,60 @@ def chunk_text(text, chunk_size=WORDS_PER_CHUNK, overlap=OVERLAP):
         start += chunk_size - overlap  # slide window with overlap
     return chunks
 
-def chunk_documents():
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+_CHUNK_SUFFIX = re.compile(r"_chunk(\d+)$")
+
+def parse_doc_metadata(chunk_id):
+    """
+    Structured fields encoded in ToS;DR ids, e.g.
+    "Fitbit_PrivacyPolicy_chunk3" → company "Fitbit", doc_type "PrivacyPolicy", chunk_index 3.
+    Unchunked documents get chunk_index 1.
+    """
+    match = _CHUNK_SUFFIX.search(chunk_id)
+    base = chunk_id[:match.start()] if match else chunk_id
+    company, _, doc_type = base.rpartition("_")
+    if not company:
+        company, doc_type = doc_type, ""
+    return {
+        "company": company,
+        "doc_type": doc_type,
+        "chunk_index": int(match.group(1)) if match else 1,
+    }
+
+def chunk_document(doc, chunk_size=WORDS_PER_CHUNK, overlap=OVERLAP):
+    """Return the chunk records for one document (the document itself if it is short enough)."""
+    content = doc["content"]
+
+    # Only chunk if needed
+    words = content.split()
+    if len(words) <= chunk_size:
+        return [{**doc, **parse_doc_metadata(doc["id"])}]
+
+    chunks = []
+    for i, chunk in enumerate(chunk_text(content, chunk_size, overlap)):
+        chunk_id = f"{doc['id']}_chunk{i+1}"
+        chunks.append({
+            "id": chunk_id,
+            "source": doc["source"],
+            **parse_doc_metadata(chunk_id),
+            "content": chunk
+        })
+    return chunks
+
+def chunk_documents(input_file=INPUT_FILE, output_file=OUTPUT_FILE):
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
     chunked_docs = []
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as infile, \
-         open(OUTPUT_FILE, "w", encoding="utf-8") as outfile:
+    with open(input_file, "r", encoding="utf-8") as infile, \
+         open(output_file, "w", encoding="utf-8") as outfile:
         
         for line in infile:
             doc = json.loads(line)
-            content = doc["content"]
-
-            # Only chunk if needed
-            words = content.split()
-            if len(words) > WORDS_PER_CHUNK:
-                chunks = chunk_text(content)
-                for i, chunk in enumerate(chunks):
-                    chunked_doc = {
-                        "id": f"{doc['id']}_chunk{i+1}",
-                        "source": doc["source"],
-                        "content": chunk
-                    }
-                    outfile.write(json.dumps(chunked_doc) + "\n")
-                    chunked_docs.append(chunked_doc)
-            else:
-                outfile.write(json.dumps(doc) + "\n")
-                chunked_docs.append(doc)
-
-    print(f"✅ Chunked and saved {len(chunked_docs)} documents → {OUTPUT_FILE}")
+            for chunked_doc in chunk_document(doc):
+                outfile.write(json.dumps(chunked_doc) + "\n")
+                chunked_docs.append(chunked_doc)
+
+    print(f"✅ Chunked and saved {len(chunked_docs)} documents → {output_file}")
+    return len(chunked_docs)
 
 if __name__ == "__main__":
     chunk_documents()
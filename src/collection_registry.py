@@ -0,0 +1,328 @@
+"""
+collection_registry.py
+The collections served by this deployment, their settings, and lazily loaded
+per-collection handles with LRU unloading under a memory budget.
+
+Collections are listed in collections.json (COLLECTIONS_FILE):
+
+    {
+      "default": "tosdr_docs",
+      "memory_budget_mb": 4096,
+      "collections": {
+        "tosdr_docs": {},
+        "acme": {"embedding_provider": "fastembed", "embedding_model": "BAAI/bge-small-en-v1.5",
+                 "words_per_chunk": 400, "overlap": 50}
+      }
+    }
+
+Per-collection settings (all optional):
+- embedding_provider / embedding_model: embedder used to ingest and query
+  (default: EMBEDDING_PROVIDER and its default model)
+- quantization: must stay null. Embedded Qdrant silently drops
+  quantization_config, so a quantized collection would not be quantized
+- words_per_chunk / overlap: chunker settings used at ingestion
+- path: embedded Qdrant folder; raw_dir: text files to ingest
+
+The default collection keeps the original layout (QDRANT_STORAGE_PATH,
+data/raw/text, data/processed, data/checkpoints). Every other collection
+lives under COLLECTIONS_DIR/<name>/ with its own Qdrant folder: embedded
+Qdrant loads every collection of a folder into memory when it is opened, so a
+folder per collection is what lets them be loaded and unloaded one by one.
+Without collections.json only the default collection is served, as before.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+from chunking import WORDS_PER_CHUNK, OVERLAP
+from data_processing import RAW_DIR
+from providers import get_embedder
+from index_metadata import check_embedder_matches, read_index_metadata
+from company_filter import build_company_aliases
+from text_store import TextStore, text_store_path
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+COLLECTIONS_FILE = os.getenv("COLLECTIONS_FILE", os.path.join(PROJECT_ROOT, "collections.json"))
+COLLECTIONS_DIR = os.getenv("COLLECTIONS_DIR", os.path.join(PROJECT_ROOT, "data/collections"))
+QDRANT_PATH = os.getenv("QDRANT_STORAGE_PATH", os.path.join(PROJECT_ROOT, "data/qdrant_data"))
+DEFAULT_COLLECTION = "tosdr_docs"
+DEFAULT_MEMORY_BUDGET_MB = 4096
+SENTENCE_CONTEXT = os.getenv("SENTENCE_CONTEXT", "1") != "0"  # send the best passages instead of whole chunks
+
+DEFAULT_SETTINGS = {
+    "embedding_provider": None,
+    "embedding_model": None,
+    "quantization": None,
+    "words_per_chunk": WORDS_PER_CHUNK,
+    "overlap": OVERLAP,
+    "path": None,
+    "raw_dir": None,
+}
+POINT_OVERHEAD_BYTES = 512  # payload, id and index entries per point, beyond the vector
+
+
+class UnknownCollectionError(KeyError):
+    """The requested collection is not configured."""
+
+# -----------------------------
+# Configuration
+# -----------------------------
+@lru_cache(maxsize=None)
+def load_config() -> dict:
+    """collections.json with defaults filled in; only the default collection when the file is missing."""
+    config = {}
+    if os.path.exists(COLLECTIONS_FILE):
+        with open(COLLECTIONS_FILE, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    default = config.get("default", DEFAULT_COLLECTION)
+    collections = {name: {**DEFAULT_SETTINGS, **(settings or {})}
+                   for name, settings in config.get("collections", {}).items()}
+    collections.setdefault(default, dict(DEFAULT_SETTINGS))
+    for name, settings in collections.items():
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings for collection '{name}': {', '.join(sorted(unknown))}")
+        if settings["quantization"] is not None:
+            raise ValueError(f"Collection '{name}': quantization is not supported by embedded Qdrant "
+                             "(it ignores quantization_config); remove the setting")
+    paths = [settings["path"] for settings in collections.values() if settings["path"]]
+    if len(paths) != len(set(paths)):
+        raise ValueError("Collections cannot share a Qdrant folder ('path')")
+    budget_mb = float(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", config.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)))
+    return {"default": default, "memory_budget_mb": budget_mb, "collections": collections}
+
+
+def default_collection() -> str:
+    return load_config()["default"]
+
+
+def collection_names():
+    return sorted(load_config()["collections"])
+
+
+def get_settings(name: str = None) -> dict:
+    name = name or default_collection()
+    settings = load_config()["collections"].get(name)
+    if settings is None:
+        raise UnknownCollectionError(name)
+    return settings
+
+
+def collection_paths(name: str = None) -> dict:
+    """Where a collection's raw files, intermediate JSONL, checkpoints and Qdrant folder live."""
+    name = name or default_collection()
+    settings = get_settings(name)
+    if name == default_collection():
+        paths = {"qdrant": QDRANT_PATH, "raw": RAW_DIR,
+                 "processed": "data/processed", "checkpoints": "data/checkpoints"}
+    else:
+        base = os.path.join(COLLECTIONS_DIR, name)
+        paths = {"qdrant": os.path.join(base, "qdrant"), "raw": os.path.join(base, "raw"),
+                 "processed": os.path.join(base, "processed"), "checkpoints": os.path.join(base, "checkpoints")}
+    paths["qdrant"] = settings["path"] or paths["qdrant"]
+    paths["raw"] = settings["raw_dir"] or paths["raw"]
+    return paths
+
+
+def storage_path(name: str = None) -> str:
+    return collection_paths(name)["qdrant"]
+
+
+def collection_embedder(name: str = None):
+    """The embedder a collection is ingested and queried with (shared across collections using the same one)."""
+    settings = get_settings(name)
+    return get_embedder(settings["embedding_provider"], settings["embedding_model"])
+
+# -----------------------------
+# Collection handles
+# -----------------------------
+class CollectionHandle:
+    """
+    Everything the query path needs for one collection: the embedded Qdrant
+    client, the text store, the passage index and the company aliases.
+    Opened together on first use and closed together when unloaded.
+    Fails fast if the index was built with a different embedding model.
+    """
+
+    def __init__(self, name: str):
+        from qdrant_client import QdrantClient  # heavy import, deferred to the first search
+        self.name = name
+        self.settings = get_settings(name)
+        self.path = storage_path(name)
+        self.embedder = collection_embedder(name)
+        check_embedder_matches(self.path, name, self.embedder)
+        self.client = QdrantClient(path=self.path)
+        path = text_store_path(self.path, name)
+        self.text_store = TextStore(path) if os.path.exists(path) else None  # None: text kept in the payload
+        self.sentence_index = self._load_sentence_index()
+        metadata = read_index_metadata(self.path).get(name, {})
+        self.company_aliases = build_company_aliases(metadata.get("companies", []))
+        self.points = self.client.count(collection_name=name).count if self.client.collection_exists(name) else 0
+        self.memory_bytes = self.points * (self.embedder.dim * 4 + POINT_OVERHEAD_BYTES) + self._mapped_bytes(path)
+        self.users = 0
+        self.retired = False
+        self.closed = threading.Event()
+
+    def _mapped_bytes(self, text_store_dir):
+        """On-disk size of the memory-mapped text store and loaded passage index (their pages count too)."""
+        directories = [text_store_dir]
+        if self.sentence_index is not None:
+            from sentence_index import sentence_index_path
+            directories.append(sentence_index_path(self.path, self.name))
+        total = 0
+        for directory in directories:
+            for root, _, names in os.walk(directory):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        return total
+
+    def _load_sentence_index(self):
+        """Passage index (sentence_index.py), or None when disabled, not built, or built with another model."""
+        if not SENTENCE_CONTEXT:
+            return None
+        from sentence_index import SentenceIndex, sentence_index_path  # numpy, deferred to the first load
+        try:
+            index = SentenceIndex(sentence_index_path(self.path, self.name))
+        except FileNotFoundError:
+            return None
+        if index.embedding_model != self.embedder.model_name:
+            print(f"⚠️ Sentence index of '{self.name}' was built with {index.embedding_model}; sending whole chunks.")
+            return None
+        return index
+
+    def close(self):
+        self.client.close()
+        if self.text_store is not None:
+            self.text_store.close()
+        self.closed.set()
+
+
+class CollectionRegistry:
+    """
+    Loaded collection handles, most recently used last. Handles are opened on
+    first use; when the loaded collections exceed the memory budget, the least
+    recently used ones are unloaded (closed once their last request is done).
+
+    A thread must not acquire a collection again while it still holds an
+    unloaded handle of it: the reload would wait for that very handle to
+    close. `acquire` raises RuntimeError instead of blocking forever.
+    """
+
+    def __init__(self, memory_budget_mb: float = None):
+        self.memory_budget_mb = memory_budget_mb
+        self.lock = threading.Lock()
+        self.handles = OrderedDict()
+        self.load_locks = {}
+        self.retired = {}  # unloaded handles still in use, by name
+        self.counts = {"loads": 0, "hits": 0, "unloads": 0}
+        self.local = threading.local()  # handles held by the current thread
+
+    @property
+    def budget_bytes(self) -> float:
+        budget_mb = self.memory_budget_mb if self.memory_budget_mb is not None else load_config()["memory_budget_mb"]
+        return budget_mb * 1024 * 1024
+
+    @contextmanager
+    def acquire(self, name: str = None):
+        """Use a collection's handle; it is not closed while the block runs."""
+        handle = self._get(name or default_collection())
+        held = self._held()
+        held.append(handle)
+        try:
+            yield handle
+        finally:
+            held.remove(handle)
+            self._release(handle)
+
+    def _held(self):
+        if not hasattr(self.local, "handles"):
+            self.local.handles = []
+        return self.local.handles
+
+    def _use(self, name):
+        handle = self.handles.get(name)
+        if handle is not None:
+            self.handles.move_to_end(name)
+            handle.users += 1
+            self.counts["hits"] += 1
+        return handle
+
+    def _get(self, name):
+        get_settings(name)  # unknown names fail before anything is opened
+        with self.lock:
+            handle = self._use(name)
+            if handle is not None:
+                return handle
+            load_lock = self.load_locks.setdefault(name, threading.Lock())
+        # loading can take a while; other collections stay available meanwhile
+        with load_lock:
+            with self.lock:
+                handle = self._use(name)
+                if handle is not None:
+                    return handle
+                retired = self.retired.get(name)
+            if retired is not None:
+                if retired in self._held():
+                    raise RuntimeError(f"Collection '{name}' was unloaded while this thread still uses it; "
+                                       "release it before acquiring it again")
+                retired.closed.wait()  # embedded Qdrant allows one client per folder
+            handle = CollectionHandle(name)
+            with self.lock:
+                handle.users += 1
+                self.handles[name] = handle
+                self.counts["loads"] += 1
+                self._unload_over_budget()
+            return handle
+
+    def _unload_over_budget(self):
+        """Unload least recently used collections until the rest fit the budget (lock held)."""
+        total = sum(handle.memory_bytes for handle in self.handles.values())
+        for name in list(self.handles)[:-1]:  # the newest handle always stays
+            if total <= self.budget_bytes:
+                break
+            handle = self.handles.pop(name)
+            total -= handle.memory_bytes
+            handle.retired = True
+            self.counts["unloads"] += 1
+            print(f"♻️ Unloading collection '{name}' ({handle.memory_bytes / 2**20:.1f} MB)")
+            if handle.users:
+                self.retired[name] = handle
+            else:
+                handle.close()
+
+    def _release(self, handle):
+        with self.lock:
+            handle.users -= 1
+            close = handle.retired and handle.users == 0
+            if close and self.retired.get(handle.name) is handle:
+                del self.retired[handle.name]
+        if close:
+            handle.close()
+
+    def close_all(self):
+        """Unload every idle collection (e.g. before the storage is rebuilt)."""
+        with self.lock:
+            for name in list(self.handles):
+                handle = self.handles.pop(name)
+                handle.retired = True
+                if handle.users:
+                    self.retired[name] = handle
+                else:
+                    handle.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            loaded = {name: {"memory_mb": round(handle.memory_bytes / 2**20, 2), "points": handle.points,
+                             "in_use": handle.users}
+                      for name, handle in self.handles.items()}
+            counts = dict(self.counts)
+        return {"configured": collection_names(), "loaded": loaded,
+                "memory_mb": round(sum(entry["memory_mb"] for entry in loaded.values()), 2),
+                "budget_mb": round(self.budget_bytes / 2**20, 2), **counts}
+
+
+# One registry per process, shared by all requests
+registry = CollectionRegistry()
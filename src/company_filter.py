@@ -0,0 +1,56 @@
+"""
+company_filter.py
+Detect which companies a question is about, so retrieval can be pre-filtered
+on the `company` payload index instead of searching every vendor's chunks.
+The index only speeds searches up on a Qdrant server; embedded Qdrant ignores
+it, which is why rag_pipeline leaves filtering off unless COMPANY_FILTER=1.
+"""
+
+import re
+from typing import Dict, List, Set
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+MIN_ALIAS_LENGTH = 3  # shorter aliases match too many ordinary words
+MAX_NGRAM = 3         # "microsoft services" → "microsoftservices"
+
+
+def _normalize(text: str) -> str:
+    return "".join(_WORD_RE.findall(text.lower()))
+
+
+def build_company_aliases(companies) -> Dict[str, Set[str]]:
+    """
+    Map normalized full company names ("microsoftservices") to the companies.
+    Only full names are aliases: the first word of a CamelCase name is often an
+    ordinary word ("you" → YouTube, "data" → DataCamp, "what" → WhatsApp), and a
+    wrong filter silently narrows the results. Multi-word names still match
+    when the query spells them out ("new york times" → NewYorkTimes).
+    """
+    aliases: Dict[str, Set[str]] = {}
+    for company in companies:
+        alias = _normalize(company)
+        if len(alias) >= MIN_ALIAS_LENGTH:
+            aliases.setdefault(alias, set()).add(company)
+    return aliases
+
+
+def detect_companies(query: str, aliases: Dict[str, Set[str]]) -> List[str]:
+    """Companies named in the query (word n-grams matched against aliases), sorted."""
+    words = _WORD_RE.findall(query.lower())
+    found: Set[str] = set()
+    for n in range(1, MAX_NGRAM + 1):
+        for i in range(len(words) - n + 1):
+            gram = "".join(words[i:i + n])
+            if gram in aliases:
+                found |= aliases[gram]
+    return sorted(found)
+
+
+def company_filter(companies: List[str]):
+    """Qdrant filter restricting a search to the given companies (None for no filter)."""
+    if not companies:
+        return None
+    from qdrant_client import models
+    return models.Filter(
+        must=[models.FieldCondition(key="company", match=models.MatchAny(any=list(companies)))]
+    )
@@ -1,34 +1,217 @@
-import kagglehub
+"""
+data_ingestion.py
+Fetches the ToS;DR dataset into data/raw/ through a content-addressed cache.
+
+- Every raw file is stored once, read-only, under RAW_CACHE_DIR as
+  objects/<sha256[:2]>/<sha256> (reflinked from the source where the
+  filesystem supports it, copied otherwise) and hard-linked into data/raw/
+  (reflinked or copied when linking is not possible).
+- data/raw/manifest.json records each file's sha256, size and mtime. A re-run
+  checks the files in parallel against it (size and mtime first; `--verify`
+  re-hashes everything) and only fetches what is missing or changed, so a
+  populated node finishes almost instantly.
+- With TOSDR_MIRROR_DIR (or `--mirror`) the files come from a local directory
+  instead of KaggleHub, e.g. another node's data/raw or a shared volume, so
+  ingestion works offline.
+
+Usage:
+    python src/data_ingestion.py [--verify] [--mirror /mnt/tosdr] [--workers 8]
+"""
+
+import os
+import json
 import shutil
+import hashlib
+import argparse
 from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; reflinks are skipped
+    fcntl = None
+
+DATASET = "sonu1607/tosdr-terms-of-service-corpus"
+TARGET_DIR = "data/raw"
+MANIFEST_NAME = "manifest.json"
+RAW_CACHE_DIR = os.getenv("TOSDR_CACHE_DIR", "data/cache/raw")  # keep on the same filesystem as data/raw
+MIRROR_DIR = os.getenv("TOSDR_MIRROR_DIR")
+WORKERS = 8           # files checked or fetched concurrently (hashing releases the GIL)
+HASH_BLOCK = 1 << 20
+FICLONE = 0x40049409  # Linux ioctl for reflink copies (btrfs, xfs)
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_files(root: Path):
+    """Relative paths of the dataset files under root (the manifest itself excluded)."""
+    return sorted(
+        path.relative_to(root).as_posix() for path in root.rglob("*")
+        if path.is_file() and path.relative_to(root).as_posix() != MANIFEST_NAME
+    )
+
+
+def read_manifest(root: Path) -> dict:
+    path = root / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def write_manifest(root: Path, files: dict, source: str):
+    tmp_path = root / (MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"dataset": DATASET, "source": source, "updated_at": datetime.now().isoformat(),
+                   "files": files}, f, indent=2)
+    os.replace(tmp_path, root / MANIFEST_NAME)
+
+
+def file_entry(path: Path, sha256: str) -> dict:
+    stat = path.stat()
+    return {"sha256": sha256, "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_current(path: Path, entry: dict, verify: bool = False) -> bool:
+    """Whether path still holds the manifest's content (size/mtime check, or a full re-hash with verify)."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size != entry["bytes"]:
+        return False
+    if not verify and stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    return file_sha256(path) == entry["sha256"]
+
+# -----------------------------
+# Content-addressed cache
+# -----------------------------
+def object_path(sha256: str, cache_dir=RAW_CACHE_DIR) -> Path:
+    return Path(cache_dir) / "objects" / sha256[:2] / sha256
 
-def download_tosdr_dataset():
+
+def _reflink(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+def place(src: Path, dst: Path, link: bool = True) -> str:
     """
-    Downloads the ToS;DR dataset using kagglehub and stores it under data/raw/.
-    If the dataset already exists, it skips downloading to ensure reproducibility.
+    Make dst a hard link of src (with `link`), else a reflink, else a copy;
+    returns the method used.
     """
-    target_dir = Path("data/raw")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if link and dst.exists() and os.path.samefile(src, dst):
+        return "link"  # renaming a link over its own file would be a no-op
+    tmp = dst.with_name(dst.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    method = "copy"
+    if link:
+        try:
+            os.link(src, tmp)
+            method = "link"
+        except OSError:
+            pass
+    if method == "copy" and _reflink(src, tmp):
+        method = "reflink"
+    if method == "copy":
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)  # never leaves a half-written file at dst
+    return method
+
+
+def store_object(src: Path, sha256: str, cache_dir=RAW_CACHE_DIR) -> Path:
+    """
+    Add a file to the cache under its checksum. The cache owns its copies
+    (never links to the source), so editing the source cannot change them.
+    """
+    obj = object_path(sha256, cache_dir)
+    if obj.exists() and file_sha256(obj) != sha256:
+        obj.unlink()  # edited in place through a link in data/raw; cache it again
+    if not obj.exists():
+        place(src, obj, link=False)
+        obj.chmod(0o444)  # shared by every link in data/raw
+    return obj
+
+# -----------------------------
+# Download
+# -----------------------------
+def fetch_source(mirror_dir=None) -> Path:
+    """Directory holding the dataset files: the local mirror, or KaggleHub's download."""
+    if mirror_dir:
+        print(f"📂 Using local mirror {mirror_dir}")
+        return Path(mirror_dir)
+    import kagglehub  # only needed when the dataset is actually downloaded
+
+    print("📦 Downloading ToS;DR dataset from KaggleHub...")
+    return Path(kagglehub.dataset_download(DATASET))
+
+
+def download_tosdr_dataset(target_dir=TARGET_DIR, mirror_dir=MIRROR_DIR, cache_dir=RAW_CACHE_DIR,
+                           verify: bool = False, workers: int = WORKERS):
+    """
+    Make data/raw/ match the dataset, fetching only missing or changed files.
+    Returns the target directory.
+    """
+    target_dir = Path(target_dir)
     target_dir.mkdir(parents=True, exist_ok=True)
 
-    # Check if data already exists (any .csv or .json files)
-    existing_files = list(target_dir.glob("*"))
-    if any(f.suffix in [".csv", ".json"] for f in existing_files):
-        print(f"✅ Dataset already exists in {target_dir.resolve()}, skipping download.")
+    # 1️⃣ Check what is already in place against the manifest
+    manifest = read_manifest(target_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        current = dict(zip(manifest, executor.map(
+            lambda rel: is_current(target_dir / rel, manifest[rel], verify), manifest)))
+    if manifest and all(current.values()):
+        print(f"✅ Dataset already in {target_dir.resolve()} ({len(manifest)} files verified), skipping download.")
         return target_dir
 
-    print("📦 Downloading ToS;DR dataset from KaggleHub...")
-    dataset_path = Path(kagglehub.dataset_download("sonu1607/tosdr-terms-of-service-corpus"))
+    # 2️⃣ Fetch and place only what is missing or changed
+    source_dir = fetch_source(mirror_dir)
+    source_manifest = read_manifest(source_dir)  # a mirror that is another node's data/raw has one
+    files = list_files(source_dir)
 
-    # Copy all files (recursively) to data/raw
-    for item in dataset_path.iterdir():
-        dest = target_dir / item.name
-        if item.is_file():
-            shutil.copy(item, dest)
-        elif item.is_dir():
-            shutil.copytree(item, dest, dirs_exist_ok=True)
+    def sync(rel):
+        src = source_dir / rel
+        entry = source_manifest.get(rel)
+        sha256 = entry["sha256"] if entry and is_current(src, entry) else file_sha256(src)
+        dst = target_dir / rel
+        if current.get(rel) and manifest[rel]["sha256"] == sha256:
+            return rel, manifest[rel], "kept"
+        method = place(store_object(src, sha256, cache_dir), dst)
+        return rel, file_entry(dst, sha256), method
 
-    print(f"✅ Dataset successfully stored in: {target_dir.resolve()}")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(sync, files))
+
+    counts = {}
+    for _, _, method in results:
+        counts[method] = counts.get(method, 0) + 1
+    write_manifest(target_dir, {rel: entry for rel, entry, _ in results},
+                   source=str(mirror_dir) if mirror_dir else f"kagglehub:{DATASET}")
+    summary = ", ".join(f"{n} {method}" for method, n in sorted(counts.items()))
+    print(f"✅ Dataset successfully stored in: {target_dir.resolve()} ({summary})")
     return target_dir
 
+
 if __name__ == "__main__":
-    download_tosdr_dataset()
+    parser = argparse.ArgumentParser(description="Fetch the ToS;DR dataset into data/raw through the raw cache.")
+    parser.add_argument("--verify", action="store_true", help="re-hash every file instead of trusting size and mtime")
+    parser.add_argument("--mirror", default=MIRROR_DIR, help="local directory to copy the dataset from (offline)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    download_tosdr_dataset(mirror_dir=args.mirror, verify=args.verify, workers=args.workers)
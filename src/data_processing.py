@@ -4,25 +4,31 @@ import json
 RAW_DIR = "data/raw/text"
 OUTPUT_FILE = "data/processed/tosdr_docs.jsonl"
 
-os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-
-def process_text_files():
-    docs = []
-    for filename in os.listdir(RAW_DIR):
+def iter_text_files(raw_dir=RAW_DIR, skip_ids=()):
+    """Yield one normalized document per .txt file, skipping ids in skip_ids."""
+    for filename in sorted(os.listdir(raw_dir)):
         if filename.endswith(".txt"):
-            with open(os.path.join(RAW_DIR, filename), "r", encoding="utf-8") as f:
+            doc_id = filename.replace(".txt", "")
+            if doc_id in skip_ids:
+                continue
+            with open(os.path.join(raw_dir, filename), "r", encoding="utf-8") as f:
                 text = f.read().strip()
-            docs.append({
-                "id": filename.replace(".txt", ""),
+            yield {
+                "id": doc_id,
                 "source": filename,
                 "content": text
-            })
+            }
+
+def process_text_files(raw_dir=RAW_DIR, output_file=OUTPUT_FILE):
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    docs = list(iter_text_files(raw_dir))
     
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
+    with open(output_file, "w", encoding="utf-8") as out:
         for doc in docs:
             out.write(json.dumps(doc) + "\n")
 
-    print(f"✅ Processed {len(docs)} files → {OUTPUT_FILE}")
+    print(f"✅ Processed {len(docs)} files → {output_file}")
+    return len(docs)
 
 if __name__ == "__main__":
     process_text_files()
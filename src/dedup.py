@@ -0,0 +1,224 @@
+"""
+dedup.py
+Near-duplicate chunk detection between chunking and embedding.
+
+ToS;DR contains many near-identical boilerplate policies, and chunk overlap
+adds more redundancy. Each chunk gets a MinHash signature over word 5-gram
+shingles (one-permutation hashing, so each shingle is hashed once), and
+banded LSH finds candidate matches. A chunk whose estimated Jaccard
+similarity with an earlier chunk reaches the threshold is mapped to that
+canonical chunk instead of being embedded and stored again.
+
+Canonical records gain `duplicate_ids`, `sources` and `companies` fields listing
+every chunk they stand for.
+
+Usage:
+    python src/dedup.py   # tosdr_docs_chunked.jsonl → tosdr_docs_deduped.jsonl + dedup_report.json
+"""
+
+import os
+import json
+import hashlib
+import threading
+from chunking import parse_doc_metadata
+
+INPUT_FILE = "data/processed/tosdr_docs_chunked.jsonl"
+OUTPUT_FILE = "data/processed/tosdr_docs_deduped.jsonl"
+REPORT_FILE = "data/processed/dedup_report.json"
+
+# --- Parameters ---
+SHINGLE_SIZE = 5           # words per shingle
+NUM_PERM = 128             # signature length
+BANDS = 16                 # LSH bands (NUM_PERM / BANDS rows each → candidate threshold ≈ 0.71)
+JACCARD_THRESHOLD = 0.8    # estimated similarity at which a chunk counts as a duplicate
+
+_EMPTY_BIN_OFFSET = 1 << 64  # keeps densified values distinct from real ones
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    words = text.lower().split()
+    if len(words) <= k:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def minhash_signature(text, num_perm=NUM_PERM):
+    """
+    One-permutation MinHash: each shingle hash picks a bin and competes for its
+    minimum. Empty bins borrow the next non-empty bin's value (rotation
+    densification), so short texts still get comparable signatures.
+    """
+    bins = [None] * num_perm
+    for shingle in shingles(text):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        b, value = h % num_perm, h // num_perm
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+
+    if all(v is None for v in bins):
+        return (0,) * num_perm
+    signature = []
+    for i in range(num_perm):
+        distance = 0
+        while bins[(i + distance) % num_perm] is None:
+            distance += 1
+        signature.append(bins[(i + distance) % num_perm] + distance * _EMPTY_BIN_OFFSET)
+    return tuple(signature)
+
+
+def estimated_jaccard(sig_a, sig_b):
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+class Deduplicator:
+    """
+    Streaming LSH deduplicator. `check()` returns the canonical chunk id for a
+    near-duplicate, or None if the chunk is new (and becomes canonical itself).
+
+    With `state_path`, decisions are appended to a JSONL file and replayed on
+    start, so a resumed ingestion keeps matching against earlier chunks.
+    """
+
+    def __init__(self, threshold=JACCARD_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, state_path=None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.lock = threading.Lock()
+        self.signatures = {}   # canonical id → signature
+        self.sources = {}      # canonical id → source document
+        self.buckets = {}      # (band, band hash) → [canonical ids]
+        self.canonical_of = {} # duplicate id → canonical id
+        self.duplicates = {}   # canonical id → [(duplicate id, source)]
+        self.stats = {"chunks_seen": 0, "duplicates": 0, "words_seen": 0, "words_removed": 0}
+        self.state_path = state_path
+        if state_path and os.path.exists(state_path):
+            self._replay(state_path)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            yield band, hash(rows)
+
+    def _add_canonical(self, chunk_id, source, signature):
+        self.signatures[chunk_id] = signature
+        self.sources[chunk_id] = source
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(chunk_id)
+
+    def _add_duplicate(self, chunk_id, source, canonical_id):
+        self.canonical_of[chunk_id] = canonical_id
+        self.duplicates.setdefault(canonical_id, []).append((chunk_id, source))
+
+    def _replay(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # truncated line from an interrupted run
+                if "canonical" in record:
+                    self._add_duplicate(record["id"], record["source"], record["canonical"])
+                else:
+                    self._add_canonical(record["id"], record["source"], tuple(record["signature"]))
+
+    def _persist(self, record):
+        if self.state_path:
+            with open(self.state_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def check(self, chunk):
+        """Register a chunk record; return its canonical id if it is a near-duplicate, else None."""
+        chunk_id, text = chunk["id"], chunk["content"]
+        if not text.strip():
+            return None  # blank chunks are skipped at embedding time anyway
+        n_words = len(text.split())
+        with self.lock:
+            self.stats["chunks_seen"] += 1
+            self.stats["words_seen"] += n_words
+            # Re-processed chunks (resumed runs) keep their earlier decision
+            if chunk_id in self.signatures:
+                return None
+            if chunk_id in self.canonical_of:
+                self.stats["duplicates"] += 1
+                self.stats["words_removed"] += n_words
+                return self.canonical_of[chunk_id]
+
+        signature = minhash_signature(text, self.num_perm)
+
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self.buckets.get(key, ()))
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                score = estimated_jaccard(signature, self.signatures[candidate])
+                if score > best_score:
+                    best, best_score = candidate, score
+
+            if best is not None and best_score >= self.threshold:
+                self._add_duplicate(chunk_id, chunk["source"], best)
+                self._persist({"id": chunk_id, "source": chunk["source"], "canonical": best})
+                self.stats["duplicates"] += 1
+                self.stats["words_removed"] += n_words
+                return best
+
+            self._add_canonical(chunk_id, chunk["source"], signature)
+            self._persist({"id": chunk_id, "source": chunk["source"], "signature": list(signature)})
+            return None
+
+    def duplicate_info(self, canonical_id):
+        """Payload fields for a canonical chunk, or None if it has no duplicates."""
+        duplicates = self.duplicates.get(canonical_id)
+        if not duplicates:
+            return None
+        ids = [dup_id for dup_id, _ in duplicates]
+        return {
+            "duplicate_ids": ids,
+            "sources": sorted({self.sources[canonical_id], *(dup_source for _, dup_source in duplicates)}),
+            "companies": sorted({parse_doc_metadata(i)["company"] for i in [canonical_id, *ids]}),
+        }
+
+    def report(self):
+        seen = self.stats["chunks_seen"]
+        return {
+            **self.stats,
+            "canonical_chunks": seen - self.stats["duplicates"],
+            "duplicate_rate": round(self.stats["duplicates"] / seen, 4) if seen else 0.0,
+            "threshold": self.threshold,
+        }
+
+
+def dedup_chunks(input_file=INPUT_FILE, output_file=OUTPUT_FILE, report_file=REPORT_FILE):
+    """Batch mode: write canonical chunks (with their duplicates listed) and a report."""
+    deduper = Deduplicator()
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            deduper.check(json.loads(line))
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(input_file, "r", encoding="utf-8") as infile, \
+         open(output_file, "w", encoding="utf-8") as outfile:
+        for line in infile:
+            chunk = json.loads(line)
+            if chunk["id"] in deduper.canonical_of:
+                continue
+            info = deduper.duplicate_info(chunk["id"])
+            if info:
+                chunk.update(info)
+            outfile.write(json.dumps(chunk) + "\n")
+
+    report = deduper.report()
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✅ Kept {report['canonical_chunks']} of {report['chunks_seen']} chunks "
+          f"({report['duplicates']} near-duplicates removed, {report['duplicate_rate']:.1%}, "
+          f"{report['words_removed']:,} words not embedded) → {output_file}")
+    return report['canonical_chunks']
+
+
+if __name__ == "__main__":
+    dedup_chunks()
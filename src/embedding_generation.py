@@ -3,25 +3,20 @@ import json
 import time
 from tqdm import tqdm
 from dotenv import load_dotenv
-from openai import AzureOpenAI
 from itertools import islice
+from collection_registry import collection_embedder
+from index_metadata import record_model
 
 # --- Load environment variables ---
 load_dotenv()
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
-EMBED_MODEL = "text-embedding-3-small"
-
-# --- Azure OpenAI client ---
-client = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_version=AZURE_OPENAI_API_VERSION
-)
+
+# --- Embedding provider (Azure OpenAI by default; EMBEDDING_PROVIDER=fastembed or mock run locally) ---
+# The default collection's embedder (collection_registry.py), so a collection with
+# its own provider/model is embedded with the model it is queried with.
+# Created on first use, so importing this module does no work.
 
 # --- File paths ---
-input_file = "data/processed/tosdr_docs_chunked.jsonl"
+input_file = "data/processed/tosdr_docs_deduped.jsonl"  # canonical chunks from dedup.py
 output_file = "data/processed/tosdr_docs_embedded.jsonl"
 
 # --- Parameters ---
@@ -36,28 +31,44 @@ def batched(iterable, n):
         yield batch
 
 # --- Helper: read processed IDs from existing output file ---
-def get_processed_ids(output_path):
+def get_processed_ids(output_path, model=None):
+    """IDs already embedded (by `model`, if given; other models' vectors are not reusable)."""
     processed = set()
     if os.path.exists(output_path):
         with open(output_path, "r", encoding="utf-8") as f:
             for line in f:
                 try:
                     doc = json.loads(line)
-                    processed.add(doc["id"])
+                    if model is None or record_model(doc) == model:
+                        processed.add(doc["id"])
                 except json.JSONDecodeError:
                     continue
     return processed
 
+# --- Helper: embed one batch with retries for transient errors ---
+def embed_batch(inputs, retry_limit=RETRY_LIMIT, embedder=None):
+    """Return embeddings for `inputs` (with `embedder`, default the default collection's), or None if every attempt failed."""
+    embedder = embedder or collection_embedder()
+    for attempt in range(retry_limit):
+        try:
+            return embedder.embed_documents(inputs)
+        except Exception as e:
+            print(f"⚠️ Error on attempt {attempt+1}: {e}")
+            time.sleep(2 ** attempt)
+    return None
+
 # --- Embedding logic ---
-def embed_documents_batched():
+def embed_documents_batched(input_path=input_file, output_path=output_file,
+                            batch_size=BATCH_SIZE, sleep_between=SLEEP_BETWEEN, embedder=None):
+    embedder = embedder or collection_embedder()
     # Load input data
-    with open(input_file, "r", encoding="utf-8") as infile:
+    with open(input_path, "r", encoding="utf-8") as infile:
         all_lines = infile.readlines()
     
     print(f"📄 Total chunks in input: {len(all_lines)}")
 
     # Load processed IDs if resuming
-    processed_ids = get_processed_ids(output_file)
+    processed_ids = get_processed_ids(output_path, model=embedder.model_name)
     print(f"⏩ Already processed: {len(processed_ids)} chunks")
 
     # Filter unprocessed lines
@@ -66,68 +77,56 @@ def embed_documents_batched():
 
     if not remaining_lines:
         print("✅ All documents already processed!")
-        return
+        return 0
     
     # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
+    embedded = 0
     # Open file in append mode so we don’t overwrite progress
-    with open(output_file, "a", encoding="utf-8") as outfile:
-        for batch in tqdm(list(batched(remaining_lines, BATCH_SIZE)), desc="Embedding in batches"):
+    with open(output_path, "a", encoding="utf-8") as outfile:
+        for batch in tqdm(list(batched(remaining_lines, batch_size)), desc="Embedding in batches"):
             docs = [json.loads(line) for line in batch]
-            inputs = [doc["content"].strip() for doc in docs if doc["content"].strip()]
+            docs = [doc for doc in docs if doc["content"].strip()]
+            inputs = [doc["content"].strip() for doc in docs]
 
             if not inputs:
                 continue
 
-            # Retry logic for transient errors
-            for attempt in range(RETRY_LIMIT):
-                try:
-                    response = client.embeddings.create(
-                        model=EMBED_MODEL,
-                        input=inputs
-                    )
-                    break
-                except Exception as e:
-                    print(f"⚠️ Error on attempt {attempt+1}: {e}")
-                    time.sleep(2 ** attempt)
-            else:
+            embeddings = embed_batch(inputs, embedder=embedder)
+            if embeddings is None:
                 print("❌ Skipping batch after multiple failures")
                 continue
 
             # Save embeddings incrementally
-            embeddings = [r.embedding for r in response.data]
             for doc, emb in zip(docs, embeddings):
                 embedded_doc = {
                     "id": doc["id"],
                     "source": doc["source"],
-                    "content": doc["content"],
+                    "model": embedder.model_name,
                     "embedding": emb
                 }
                 outfile.write(json.dumps(embedded_doc) + "\n")
+                embedded += 1
 
             outfile.flush()  # flush every batch
-            time.sleep(SLEEP_BETWEEN)
+            if sleep_between:
+                time.sleep(sleep_between)
 
-    print(f"\n✅ All embeddings saved to {output_file}")
+    print(f"\n✅ All embeddings saved to {output_path}")
+    return embedded
 
-def regenerate_missing_embeddings():
+def regenerate_missing_embeddings(embedder=None):
     # Re-generate only missing embeddings
     # === File paths ===
-    input_file = "data/processed/tosdr_docs_chunked.jsonl"
+    input_file = "data/processed/tosdr_docs_deduped.jsonl"  # canonical chunks from dedup.py
     output_file = "data/processed/tosdr_docs_embedded.jsonl"
 
     # === Load existing embedded IDs (if any) ===
-    existing_ids = set()
     if os.path.exists(output_file):
         print(f"Loading existing embeddings from {output_file}...")
-        with open(output_file, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    existing_ids.add(data["id"])
-                except json.JSONDecodeError:
-                    continue
+    embedder = embedder or collection_embedder()
+    existing_ids = get_processed_ids(output_file, model=embedder.model_name)
 
     print(f"Found {len(existing_ids):,} already embedded documents.")
 
@@ -149,19 +148,16 @@ def regenerate_missing_embeddings():
         exit()
 
     # === Generate embeddings for missing ones ===
+    # (documents go through the passage path, like the main loop; never embed_query)
     with open(output_file, "a", encoding="utf-8") as out_f:
         for doc in tqdm(missing_docs, desc="Embedding missing docs"):
             try:
-                response = client.embeddings.create(
-                    model=EMBED_MODEL,
-                    input=doc["content"]
-                )
-                embedding = response.data[0].embedding
+                embedding = embedder.embed_documents([doc["content"]])[0]
 
                 out_record = {
                     "id": doc["id"],
                     "source": doc["source"],
-                    "content": doc["content"],
+                    "model": embedder.model_name,
                     "embedding": embedding
                 }
 
@@ -0,0 +1,65 @@
+"""
+index_metadata.py
+Records which embedding model (and dimension) built each Qdrant collection,
+so the query path can refuse to search an index with a different model.
+
+Stored as `index_metadata.json` next to the embedded Qdrant storage.
+"""
+
+import os
+import json
+from datetime import datetime
+from providers import EMBED_MODEL
+
+METADATA_FILE = "index_metadata.json"
+
+
+def record_model(record: dict) -> str:
+    """Embedding model of an embedded JSONL record (older records predate the field)."""
+    return record.get("model", EMBED_MODEL)
+
+
+def metadata_path(qdrant_path: str) -> str:
+    return os.path.join(qdrant_path, METADATA_FILE)
+
+
+def read_index_metadata(qdrant_path: str) -> dict:
+    """Return {collection_name: metadata} (empty if the index predates metadata)."""
+    path = metadata_path(qdrant_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_metadata(qdrant_path: str, collection_name: str, embedding_model: str,
+                         embedding_dim: int, **extra):
+    """Record the embedding model and dimension (plus any extra settings) for a collection."""
+    os.makedirs(qdrant_path, exist_ok=True)
+    metadata = read_index_metadata(qdrant_path)
+    metadata[collection_name] = {
+        "embedding_model": embedding_model,
+        "embedding_dim": embedding_dim,
+        "updated_at": datetime.now().isoformat(),
+        **extra,
+    }
+    tmp_path = metadata_path(qdrant_path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, metadata_path(qdrant_path))
+
+
+def check_embedder_matches(qdrant_path: str, collection_name: str, embedder):
+    """
+    Raise ValueError if the collection was built with a different embedding
+    model or dimension than `embedder`. Collections without metadata pass.
+    """
+    meta = read_index_metadata(qdrant_path).get(collection_name)
+    if not meta:
+        return
+    if meta["embedding_model"] != embedder.model_name or meta["embedding_dim"] != embedder.dim:
+        raise ValueError(
+            f"Collection '{collection_name}' was built with {meta['embedding_model']} "
+            f"({meta['embedding_dim']} dims) but the query embedder is {embedder.model_name} "
+            f"({embedder.dim} dims). Set EMBEDDING_PROVIDER/FASTEMBED_MODEL to match or re-run ingestion."
+        )
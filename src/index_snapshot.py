@@ -0,0 +1,364 @@
+"""
+index_snapshot.py
+Export the built index as a versioned, checksummed snapshot and import it on
+serving nodes, so they can start without running ingestion.
+
+A snapshot is a directory `<collection>-<timestamp>/` holding:
+- manifest.json   format version, snapshot id, embedding model and dimension,
+                  chunker settings, index metadata (companies, ...) and the
+                  sha256 and size of every file
+- vectors.npy     float32 [points, dim], written and read through mmap
+- payloads.jsonl  one {"id", "payload"} line per point, in vector row order
+- text_store/     the chunk text store (text_store.py), copied as-is
+- sentence_index/ the passage index (sentence_index.py), when built
+
+Importing verifies the checksums (in parallel), upserts the points into the
+collection's embedded Qdrant folder (collection_registry.py), and hard-links the text store and
+passage index into place (copying across filesystems). Only the text store
+and passage index are used straight from the snapshot through mmap: embedded
+Qdrant has no on-disk format that could be mapped in, so its points are
+re-upserted, which is the slow part of an import. The snapshot id is
+recorded in the index metadata, so restarting a node on the same snapshot
+skips the import entirely. The app imports `INDEX_SNAPSHOT` when it starts
+serving (app_flask.load_index_snapshots): the newest snapshot of every
+configured collection found there.
+
+Usage:
+    python src/index_snapshot.py export [--output-dir data/snapshots] [--collection acme]
+    python src/index_snapshot.py import [data/snapshots] [--collection acme] [--force]
+    python src/index_snapshot.py verify data/snapshots/tosdr_docs-20250101T000000
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; concurrent imports are not serialized
+    fcntl = None
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "data/snapshots")
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.jsonl"
+TEXT_STORE_DIR = "text_store"
+SENTENCE_INDEX_DIR = "sentence_index"
+FORMAT_VERSION = 1
+SCROLL_BATCH = 1000   # points read per Qdrant scroll on export
+UPSERT_BATCH = 1000   # points written per Qdrant upsert on import
+HASH_WORKERS = 8      # files hashed concurrently (hashlib releases the GIL)
+HASH_BLOCK = 1 << 20
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, incomplete or does not match its manifest."""
+
+
+class NoSnapshotError(SnapshotError):
+    """No snapshot was found where one was expected (e.g. before the first export)."""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_files(snapshot_dir):
+    """Relative paths of every file in a snapshot except the manifest."""
+    files = []
+    for root, _, names in os.walk(snapshot_dir):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), snapshot_dir)
+            if rel != MANIFEST_FILE:
+                files.append(rel.replace(os.sep, "/"))
+    return sorted(files)
+
+
+def _checksums(snapshot_dir, files):
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        digests = executor.map(lambda rel: file_sha256(os.path.join(snapshot_dir, rel)), files)
+        return {rel: {"sha256": digest, "bytes": os.path.getsize(os.path.join(snapshot_dir, rel))}
+                for rel, digest in zip(files, digests)}
+
+
+def _link_or_copy_tree(src, dst):
+    """Hard-link every file of src into dst (files are only ever read), copying across filesystems."""
+    shutil.rmtree(dst, ignore_errors=True)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    def link_or_copy(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+    shutil.copytree(src, dst, copy_function=link_or_copy)
+
+# -----------------------------
+# Export
+# -----------------------------
+def export_snapshot(qdrant_path: str, collection_name: str, output_dir: str = SNAPSHOT_DIR) -> str:
+    """Write a snapshot of the collection under output_dir and return its directory."""
+    import numpy as np
+    from qdrant_client import QdrantClient
+    from chunking import WORDS_PER_CHUNK, OVERLAP
+    from index_metadata import read_index_metadata
+    from text_store import text_store_path
+    from sentence_index import sentence_index_path
+
+    metadata = read_index_metadata(qdrant_path).get(collection_name)
+    if not metadata:
+        raise SnapshotError(f"No index metadata for '{collection_name}' in {qdrant_path}; run ingestion first")
+    text_dir = text_store_path(qdrant_path, collection_name)
+    if not os.path.exists(text_dir):
+        raise SnapshotError(f"No text store at {text_dir}; run ingestion first")
+
+    snapshot_id = f"{collection_name}-{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+    snapshot_dir = os.path.join(output_dir, snapshot_id)
+    tmp_dir = snapshot_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # 1️⃣ Points: vectors stream into a memory-mapped .npy, payloads into JSONL
+    client = QdrantClient(path=qdrant_path)
+    try:
+        total = client.count(collection_name=collection_name).count
+        dim = metadata["embedding_dim"]
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, VECTORS_FILE), mode="w+",
+                                            dtype=np.float32, shape=(total, dim))
+        row, offset = 0, None
+        with open(os.path.join(tmp_dir, PAYLOADS_FILE), "w", encoding="utf-8") as f:
+            while True:
+                points, offset = client.scroll(collection_name=collection_name, limit=SCROLL_BATCH,
+                                               offset=offset, with_payload=True, with_vectors=True)
+                if row + len(points) > total:
+                    raise SnapshotError("Collection grew during export; stop ingestion and retry")
+                for point in points:
+                    vectors[row] = point.vector
+                    f.write(json.dumps({"id": str(point.id), "payload": point.payload}) + "\n")
+                    row += 1
+                if offset is None:
+                    break
+        vectors.flush()
+        del vectors
+    finally:
+        client.close()
+    if row != total:
+        raise SnapshotError(f"Exported {row} points but the collection reports {total}")
+
+    # 2️⃣ Chunk texts and passage index, copied as-is (both are already read through mmap)
+    shutil.copytree(text_dir, os.path.join(tmp_dir, TEXT_STORE_DIR))
+    sentences_dir = sentence_index_path(qdrant_path, collection_name)
+    if os.path.exists(sentences_dir):
+        shutil.copytree(sentences_dir, os.path.join(tmp_dir, SENTENCE_INDEX_DIR))
+
+    # 3️⃣ Manifest, written last: a snapshot without one is incomplete
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "snapshot_id": snapshot_id,
+        "collection": collection_name,
+        "created_at": datetime.now().isoformat(),
+        "points": total,
+        "embedding_model": metadata["embedding_model"],
+        "embedding_dim": metadata["embedding_dim"],
+        "chunker": {"words_per_chunk": metadata.get("words_per_chunk", WORDS_PER_CHUNK),
+                    "overlap": metadata.get("overlap", OVERLAP)},
+        "index_metadata": metadata,
+        "files": _checksums(tmp_dir, _snapshot_files(tmp_dir)),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, snapshot_dir)
+    return snapshot_dir
+
+# -----------------------------
+# Import
+# -----------------------------
+def resolve_snapshot(path: str, collection: str = None) -> str:
+    """
+    A snapshot directory, or the newest complete snapshot inside a directory
+    of snapshots (only snapshots of `collection` when given).
+    """
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return path
+    candidates = sorted(
+        name for name in (os.listdir(path) if os.path.isdir(path) else [])
+        if os.path.exists(os.path.join(path, name, MANIFEST_FILE))
+        and (collection is None or read_manifest(os.path.join(path, name))["collection"] == collection)
+    )
+    if not candidates:
+        raise NoSnapshotError(f"No snapshot{f' of {collection}' if collection else ''} found at {path}")
+    return os.path.join(path, candidates[-1])  # ids end in a sortable timestamp
+
+
+def read_manifest(snapshot_dir: str) -> dict:
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')} in {snapshot_dir}")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir: str) -> dict:
+    """Check every file against the manifest; returns the manifest or raises SnapshotError."""
+    manifest = read_manifest(snapshot_dir)
+    expected = manifest["files"]
+    actual_files = _snapshot_files(snapshot_dir)
+    missing = sorted(set(expected) - set(actual_files))
+    if missing:
+        raise SnapshotError(f"Snapshot {snapshot_dir} is missing {', '.join(missing)}")
+    actual = _checksums(snapshot_dir, sorted(expected))
+    corrupted = [rel for rel in expected if actual[rel] != expected[rel]]
+    if corrupted:
+        raise SnapshotError(f"Checksum mismatch in {snapshot_dir}: {', '.join(corrupted)}")
+    return manifest
+
+
+def _import(snapshot_dir, qdrant_path, force):
+    import numpy as np
+    from qdrant_client import QdrantClient, models
+    import upload_qdrant
+    from index_metadata import read_index_metadata, write_index_metadata
+    from text_store import text_store_path
+    from sentence_index import sentence_index_path
+
+    manifest = read_manifest(snapshot_dir)
+    collection_name = manifest["collection"]
+    current = read_index_metadata(qdrant_path).get(collection_name, {})
+    if not force and current.get("snapshot") == manifest["snapshot_id"]:
+        print(f"⏩ Snapshot {manifest['snapshot_id']} is already loaded, skipping import.")
+        return manifest
+
+    start = time.perf_counter()
+    verify_snapshot(snapshot_dir)
+    print(f"🔐 Verified {len(manifest['files'])} files in {time.perf_counter() - start:.1f}s")
+
+    vectors = np.load(os.path.join(snapshot_dir, VECTORS_FILE), mmap_mode="r")
+    client = QdrantClient(path=qdrant_path)
+    try:
+        upload_qdrant.ensure_collection(client, recreate=True, dim=manifest["embedding_dim"],
+                                        collection_name=collection_name)
+        with open(os.path.join(snapshot_dir, PAYLOADS_FILE), "r", encoding="utf-8") as f:
+            batch, row = [], 0
+            for line in f:
+                record = json.loads(line)
+                batch.append(models.PointStruct(id=record["id"], vector=vectors[row].tolist(),
+                                                payload=record["payload"]))
+                row += 1
+                if len(batch) >= UPSERT_BATCH:
+                    client.upsert(collection_name=collection_name, points=batch)
+                    batch = []
+            if batch:
+                client.upsert(collection_name=collection_name, points=batch)
+    finally:
+        client.close()
+    if row != manifest["points"]:
+        raise SnapshotError(f"Snapshot has {row} payloads for {manifest['points']} points")
+
+    _link_or_copy_tree(os.path.join(snapshot_dir, TEXT_STORE_DIR), text_store_path(qdrant_path, collection_name))
+    sentences_dir = sentence_index_path(qdrant_path, collection_name)
+    if os.path.exists(os.path.join(snapshot_dir, SENTENCE_INDEX_DIR)):
+        _link_or_copy_tree(os.path.join(snapshot_dir, SENTENCE_INDEX_DIR), sentences_dir)
+    else:
+        shutil.rmtree(sentences_dir, ignore_errors=True)  # would not match the imported chunks
+
+    extra = {key: value for key, value in manifest["index_metadata"].items()
+             if key not in ("embedding_model", "embedding_dim", "updated_at", "snapshot")}
+    write_index_metadata(qdrant_path, collection_name, manifest["embedding_model"],
+                         manifest["embedding_dim"], **extra, snapshot=manifest["snapshot_id"])
+    print(f"✅ Imported snapshot {manifest['snapshot_id']} ({row} points) in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def import_snapshot(path: str, qdrant_path: str = None, force: bool = False, collection: str = None) -> dict:
+    """
+    Load a snapshot (or the newest one, of `collection` when given, in a
+    directory of snapshots) into the embedded Qdrant at qdrant_path (default:
+    the collection's folder). Only configured collections can be imported.
+    Worker processes starting together take turns on a lock file; all but the
+    first find the snapshot loaded and skip.
+    """
+    from collection_registry import UnknownCollectionError, storage_path
+
+    snapshot_dir = resolve_snapshot(path, collection)
+    collection_name = read_manifest(snapshot_dir)["collection"]
+    try:
+        default_path = storage_path(collection_name)
+    except UnknownCollectionError:
+        raise SnapshotError(f"Snapshot is for collection '{collection_name}', which is not configured")
+    qdrant_path = qdrant_path or default_path
+    os.makedirs(qdrant_path, exist_ok=True)
+    with open(os.path.join(qdrant_path, ".snapshot_import.lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            return _import(snapshot_dir, qdrant_path, force)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def import_all(path: str, force: bool = False) -> list:
+    """Import the snapshot at `path`, or the newest snapshot of every configured collection found in it."""
+    from collection_registry import collection_names
+
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return [import_snapshot(path, force=force)]
+    manifests = []
+    for name in collection_names():
+        try:
+            snapshot_dir = resolve_snapshot(path, name)
+        except NoSnapshotError:
+            continue  # not every collection has to be snapshotted
+        manifests.append(import_snapshot(snapshot_dir, force=force))
+    if not manifests:
+        raise NoSnapshotError(f"No snapshot of a configured collection found at {path}")
+    return manifests
+
+
+def main():
+    from collection_registry import default_collection, storage_path
+
+    parser = argparse.ArgumentParser(description="Export, import or verify index snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="snapshot the ingested collection")
+    export_cmd.add_argument("--output-dir", default=SNAPSHOT_DIR)
+    export_cmd.add_argument("--collection", help="collection to export (default: the default collection)")
+    import_cmd = commands.add_parser("import", help="load a snapshot into the local Qdrant storage")
+    import_cmd.add_argument("snapshot", nargs="?", default=SNAPSHOT_DIR,
+                            help="snapshot directory, or a directory of snapshots (newest wins)")
+    import_cmd.add_argument("--collection", help="only import this collection's newest snapshot")
+    import_cmd.add_argument("--force", action="store_true", help="re-import even if already loaded")
+    verify_cmd = commands.add_parser("verify", help="check a snapshot against its manifest")
+    verify_cmd.add_argument("snapshot")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            start = time.perf_counter()
+            collection = args.collection or default_collection()
+            snapshot_dir = export_snapshot(storage_path(collection), collection, args.output_dir)
+            print(f"✅ Snapshot written to {snapshot_dir} in {time.perf_counter() - start:.1f}s")
+        elif args.command == "import" and args.collection:
+            import_snapshot(args.snapshot, force=args.force, collection=args.collection)
+        elif args.command == "import":
+            import_all(args.snapshot, force=args.force)
+        else:
+            manifest = verify_snapshot(resolve_snapshot(args.snapshot))
+            print(f"✅ Snapshot {manifest['snapshot_id']} is intact ({len(manifest['files'])} files)")
+    except SnapshotError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
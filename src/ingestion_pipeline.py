@@ -0,0 +1,503 @@
+"""
+ingestion_pipeline.py
+Single-process ingestion orchestrator.
+
+Runs data_ingestion → data_processing → chunking → dedup →
+embedding_generation → upload_qdrant as connected stages with bounded queues
+between them, so processing, chunking, embedding and uploading overlap
+instead of waiting on each other's JSONL files. Once all chunks are stored,
+the passage index (sentence_index.py) is built in bulk from the text store.
+
+Every collection (collection_registry.py) is ingested separately with
+`--collection`, using its own raw directory, chunker settings, embedder,
+checkpoints and Qdrant folder. Only the default collection
+downloads the ToS;DR dataset; other collections ingest the .txt files
+already in their raw directory.
+
+Checkpoints (under data/checkpoints/, or the collection's checkpoints
+directory) make the run resumable:
+- download:        raw files are checked against data/raw/manifest.json and
+                   only missing or changed ones are fetched (data_ingestion.py);
+                   a marker records the last completed download
+- process / chunk: documents whose chunks are all uploaded are skipped
+- dedup:           MinHash signatures and duplicate decisions are appended to
+                   dedup_state.jsonl and replayed, so resumed runs still match
+                   against chunks from earlier runs
+- embed:           embeddings are appended to tosdr_docs_embedded.jsonl and
+                   reused on restart, so nothing is embedded (or billed) twice
+- upload:          completed document ids, appended as they finish (after
+                   their points and chunk texts are written)
+
+Usage:
+    python src/ingestion_pipeline.py [--fresh] [--skip-download] [--embed-workers 2] [--no-dedup]
+                                     [--no-sentence-index] [--collection acme]
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from qdrant_client import QdrantClient
+
+import data_ingestion
+import data_processing
+import chunking
+import dedup
+import embedding_generation
+import upload_qdrant
+import sentence_index
+from index_metadata import record_model
+from collection_registry import default_collection, get_settings, collection_paths, collection_embedder
+from text_store import TextStoreWriter, text_store_path
+
+# File names inside the collection's checkpoint directory (data/checkpoints for the default collection)
+DOWNLOAD_MARKER = "download.json"
+COMPLETED_DOCS_FILE = "completed_docs.txt"
+REPORT_FILE = "ingestion_report.json"
+DEDUP_STATE_FILE = "dedup_state.jsonl"
+EMBEDDED_FILE = os.path.basename(embedding_generation.output_file)  # inside the processed directory
+
+# --- Parameters ---
+QUEUE_SIZE = 256        # max items buffered between two stages
+EMBED_BATCH_SIZE = 16   # chunks per embedding request
+UPLOAD_BATCH_SIZE = 100 # points per Qdrant upsert
+BATCH_WAIT = 0.05       # seconds to wait for a batch to fill before flushing it
+REPORT_INTERVAL = 10    # seconds between progress reports
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+# -----------------------------
+# Checkpoint helpers
+# -----------------------------
+class DocumentTracker:
+    """Tracks how many chunks of each document are still in flight; records finished documents."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.completed = {line.strip() for line in f if line.strip()}
+
+    def expect(self, doc_id, n_chunks):
+        with self.lock:
+            self.pending[doc_id] = n_chunks
+        if n_chunks == 0:
+            self._complete(doc_id)
+
+    def chunk_done(self, doc_id):
+        with self.lock:
+            self.pending[doc_id] -= 1
+            finished = self.pending[doc_id] == 0
+        if finished:
+            self._complete(doc_id)
+
+    def _complete(self, doc_id):
+        with self.lock:
+            self.pending.pop(doc_id, None)
+            self.completed.add(doc_id)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(doc_id + "\n")
+
+
+class EmbeddingStore:
+    """
+    Append-only embedding cache backed by the embedded JSONL file.
+    Only byte offsets are kept in memory; vectors are read back on demand.
+    """
+
+    def __init__(self, model, path):
+        self.path = path
+        self.model = model
+        self.offsets = {}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        # vectors from another embedding model are not reusable
+                        if record_model(record) == model:
+                            self.offsets[record["id"]] = offset
+                    except (json.JSONDecodeError, KeyError):
+                        pass  # truncated line from an interrupted run
+                    offset += len(line)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.offsets
+
+    def get(self, chunk_id):
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[chunk_id])
+            return json.loads(f.readline())
+
+    def add_many(self, records):
+        with self.lock, open(self.path, "ab") as f:
+            for record in records:
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                self.offsets[record["id"]] = f.tell()
+                f.write(line)
+
+# -----------------------------
+# Stage runner
+# -----------------------------
+class Stage:
+    """
+    One pipeline stage: `workers` threads pull batches from `inbox`, apply `fn`
+    and push the results to `outbox`. A stage without an inbox is a source and
+    iterates `fn()` instead.
+    """
+
+    def __init__(self, pipeline, name, fn, inbox=None, outbox=None, workers=1, batch_size=1):
+        self.pipeline = pipeline
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.active_workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self.threads = []
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def backlog(self):
+        return self.inbox.qsize() if self.inbox is not None else 0
+
+    def _next_batch(self):
+        """Block for one item, then top the batch up for at most BATCH_WAIT seconds."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = 0.5 if not batch else max(0.0, deadline - time.perf_counter())
+            try:
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                if batch or self.pipeline.stop.is_set():
+                    return batch, False
+                continue
+            if item is _DONE:
+                self.inbox.put(_DONE)  # let sibling workers see it too
+                return batch, True
+            batch.append(item)
+            if deadline is None:
+                deadline = time.perf_counter() + BATCH_WAIT
+        return batch, False
+
+    def _emit(self, outputs):
+        with self.lock:
+            self.items_out += len(outputs)
+        if self.outbox is not None:
+            for item in outputs:
+                self.pipeline.put(self.outbox, item)
+
+    def _run(self):
+        try:
+            if self.inbox is None:
+                for item in self.fn():
+                    if self.pipeline.stop.is_set():
+                        break
+                    self._emit([item])
+            else:
+                finished = False
+                while not finished and not self.pipeline.stop.is_set():
+                    batch, finished = self._next_batch()
+                    if not batch:
+                        continue
+                    start = time.perf_counter()
+                    outputs = self.fn(batch)
+                    with self.lock:
+                        self.busy_seconds += time.perf_counter() - start
+                        self.items_in += len(batch)
+                    self._emit(outputs)
+        except Exception as e:
+            self.pipeline.fail(self.name, e)
+        finally:
+            with self.lock:
+                self.active_workers -= 1
+                last = self.active_workers == 0
+            if last:
+                self.finished_at = time.perf_counter()
+                if self.outbox is not None:
+                    self.pipeline.put(self.outbox, _DONE)
+
+    def report(self):
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "seconds": round(elapsed, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throughput_per_s": round(self.items_out / elapsed, 2) if elapsed > 0 else None,
+            "backlog": self.backlog(),
+        }
+
+
+class IngestionPipeline:
+    def __init__(self, fresh=False, skip_download=False, embed_workers=1, queue_size=QUEUE_SIZE, dedup=True,
+                 sentences=True, collection=None):
+        self.collection = collection or default_collection()
+        self.settings = get_settings(self.collection)
+        paths = collection_paths(self.collection)
+        self.raw_dir = paths["raw"]
+        self.qdrant_path = paths["qdrant"]
+        self.checkpoint_dir = paths["checkpoints"]
+        self.embedded_file = os.path.join(paths["processed"], EMBEDDED_FILE)
+        self.fresh = fresh
+        self.use_dedup = dedup
+        self.use_sentences = sentences
+        self.skip_download = skip_download
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.errors = []
+        self.companies = set()
+
+    # --- plumbing ---
+    def put(self, q, item):
+        """Bounded put that gives up once the pipeline is stopping."""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def fail(self, stage_name, error):
+        print(f"❌ Stage '{stage_name}' failed: {error}")
+        self.errors.append((stage_name, error))
+        self.stop.set()
+
+    def checkpoint(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    # --- stages ---
+    def download(self):
+        """
+        Batch stage: nothing downstream can start before the raw corpus exists.
+        On a populated node this is only a parallel check of data/raw against its manifest.
+        """
+        if self.skip_download:
+            print("⏩ Skipping download.")
+            return
+        if self.collection != default_collection():
+            print(f"⏩ Collection '{self.collection}' ingests the files in {self.raw_dir}; nothing to download.")
+            return
+        raw_dir = data_ingestion.download_tosdr_dataset()
+        with open(self.checkpoint(DOWNLOAD_MARKER), "w", encoding="utf-8") as f:
+            json.dump({"done": True, "path": str(raw_dir), "timestamp": time.time()}, f)
+
+    def iter_documents(self):
+        return data_processing.iter_text_files(self.raw_dir, skip_ids=self.tracker.completed)
+
+    def chunk(self, docs):
+        out = []
+        for doc in docs:
+            chunks = chunking.chunk_document(doc, self.settings["words_per_chunk"], self.settings["overlap"])
+            self.tracker.expect(doc["id"], len(chunks))
+            out.extend((doc["id"], chunk) for chunk in chunks)
+        return out
+
+    def dedup(self, items):
+        out = []
+        for doc_id, chunk in items:
+            if self.deduper.check(chunk) is None:
+                out.append((doc_id, chunk))
+            else:
+                self.tracker.chunk_done(doc_id)  # stored once, under its canonical chunk
+        return out
+
+    def embed(self, items):
+        cached, to_embed = [], []
+        for doc_id, chunk in items:
+            if not chunk["content"].strip():
+                self.tracker.chunk_done(doc_id)  # nothing to embed
+            elif chunk["id"] in self.embeddings:
+                cached.append((doc_id, chunk, self.embeddings.get(chunk["id"])))
+            else:
+                to_embed.append((doc_id, chunk))
+
+        if to_embed:
+            vectors = embedding_generation.embed_batch([chunk["content"].strip() for _, chunk in to_embed],
+                                                       embedder=self.embedder)
+            if vectors is None:
+                raise RuntimeError("embedding failed after retries; re-run to resume")
+            records = [
+                {"id": chunk["id"], "source": chunk["source"],
+                 "model": self.embeddings.model, "embedding": emb}
+                for (_, chunk), emb in zip(to_embed, vectors)
+            ]
+            self.embeddings.add_many(records)
+            cached.extend((doc_id, chunk, record) for (doc_id, chunk), record in zip(to_embed, records))
+        return cached
+
+    def upload(self, items):
+        points = [upload_qdrant.build_point(record) for _, _, record in items]
+        self.companies.update(point.payload["company"] for point in points)
+        self.qdrant.upsert(collection_name=self.collection, points=points)
+        for _, chunk, _ in items:
+            self.texts.add(chunk["id"], chunk["content"])
+        self.texts.flush()  # text must be durable before the documents are checkpointed
+        for doc_id, _, _ in items:
+            self.tracker.chunk_done(doc_id)
+        return [record["id"] for _, _, record in items]
+
+    def apply_duplicates(self):
+        """
+        List near-duplicates on their canonical points. Done once all uploads
+        are in, since a duplicate can be found before its canonical chunk has
+        been embedded.
+        """
+        for canonical_id in self.deduper.duplicates:
+            info = self.deduper.duplicate_info(canonical_id)
+            self.qdrant.set_payload(
+                collection_name=self.collection,
+                payload=upload_qdrant.duplicate_payload(info),
+                points=[upload_qdrant.make_uuid_from_str(canonical_id)],
+            )
+            self.companies.update(info["companies"])
+
+    # --- run ---
+    def _monitor(self, stages):
+        last = {stage.name: 0 for stage in stages}
+        while not self.stop.wait(REPORT_INTERVAL):
+            parts = []
+            for stage in stages:
+                rate = (stage.items_out - last[stage.name]) / REPORT_INTERVAL
+                last[stage.name] = stage.items_out
+                parts.append(f"{stage.name}: {stage.items_out} ({rate:.1f}/s, backlog {stage.backlog()})")
+            print("📊 " + " | ".join(parts))
+
+    def run(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        if self.fresh:
+            for name in (DOWNLOAD_MARKER, COMPLETED_DOCS_FILE, DEDUP_STATE_FILE):
+                if os.path.exists(self.checkpoint(name)):
+                    os.remove(self.checkpoint(name))
+
+        start = time.perf_counter()
+        print(f"📚 Ingesting collection '{self.collection}' into {self.qdrant_path}")
+        self.download()
+
+        self.tracker = DocumentTracker(self.checkpoint(COMPLETED_DOCS_FILE))
+        self.embedder = embedder = collection_embedder(self.collection)
+        self.embeddings = EmbeddingStore(embedder.model_name, self.embedded_file)
+        self.deduper = dedup.Deduplicator(state_path=self.checkpoint(DEDUP_STATE_FILE))
+        print(f"⏩ Completed documents: {len(self.tracker.completed)} | cached embeddings: {len(self.embeddings.offsets)}")
+
+        self.qdrant = QdrantClient(path=self.qdrant_path)
+        # A resumed run keeps the points (and chunk texts) uploaded so far
+        recreate = self.fresh or not self.tracker.completed
+        upload_qdrant.ensure_collection(self.qdrant, recreate=recreate, dim=embedder.dim,
+                                        collection_name=self.collection)
+        self.texts = TextStoreWriter(text_store_path(self.qdrant_path, self.collection), append=not recreate)
+
+        docs_q = queue.Queue(self.queue_size)
+        chunks_q = queue.Queue(self.queue_size)
+        unique_q = queue.Queue(self.queue_size) if self.use_dedup else chunks_q
+        embedded_q = queue.Queue(self.queue_size)
+        stages = [
+            Stage(self, "process", self.iter_documents, outbox=docs_q),
+            Stage(self, "chunk", self.chunk, inbox=docs_q, outbox=chunks_q),
+            Stage(self, "embed", self.embed, inbox=unique_q, outbox=embedded_q,
+                  workers=self.embed_workers, batch_size=EMBED_BATCH_SIZE),
+            Stage(self, "upload", self.upload, inbox=embedded_q, batch_size=UPLOAD_BATCH_SIZE),
+        ]
+        if self.use_dedup:
+            stages.insert(2, Stage(self, "dedup", self.dedup, inbox=chunks_q, outbox=unique_q,
+                                   batch_size=EMBED_BATCH_SIZE))
+
+        monitor = threading.Thread(target=self._monitor, args=(stages,), daemon=True)
+        monitor.start()
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            for thread in stage.threads:
+                thread.join()
+        self.stop.set()
+        self.texts.close()
+        if not self.errors:
+            self.apply_duplicates()
+        self.qdrant.close()
+        sentences = None
+        if self.use_sentences and not self.errors:
+            sentences = sentence_index.build_for_collection(self.qdrant_path, self.collection, embedder)
+        upload_qdrant.record_index_metadata(
+            self.qdrant_path, embedder.model_name, embedder.dim, self.companies, merge=not recreate,
+            collection_name=self.collection,
+        )
+
+        report = {
+            "collection": self.collection,
+            "seconds": round(time.perf_counter() - start, 3),
+            "completed_documents": len(self.tracker.completed),
+            "errors": [f"{name}: {error}" for name, error in self.errors],
+            "stages": {stage.name: stage.report() for stage in stages},
+            "dedup": self.deduper.report() if self.use_dedup else None,
+            "sentence_index": sentences,
+        }
+        report_file = self.checkpoint(REPORT_FILE)
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        print("\n===============================")
+        for name, stats in report["stages"].items():
+            print(f"⏱️ {name:<8} {stats['items_out']:>7} items in {stats['seconds']:8.2f}s "
+                  f"({stats['throughput_per_s']}/s, busy {stats['busy_seconds']}s)")
+        if self.use_dedup:
+            stats = report["dedup"]
+            print(f"🧬 dedup    {stats['duplicates']} of {stats['chunks_seen']} chunks were near-duplicates "
+                  f"({stats['duplicate_rate']:.1%}, {stats['words_removed']:,} words not embedded)")
+        print("===============================")
+
+        if self.errors:
+            print(f"❌ Ingestion stopped early; re-run to resume. Report: {report_file}")
+            return False
+        print(f"✅ Ingestion complete! Report: {report_file}")
+        return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the ToSDR ingestion pipeline in a single process.")
+    parser.add_argument("--fresh", action="store_true", help="ignore checkpoints and recreate the collection")
+    parser.add_argument("--skip-download", action="store_true", help="use the raw corpus already under data/raw")
+    parser.add_argument("--embed-workers", type=int, default=1, help="concurrent embedding requests")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="max items buffered between stages")
+    parser.add_argument("--no-dedup", action="store_true", help="embed near-duplicate chunks too")
+    parser.add_argument("--no-sentence-index", action="store_true",
+                        help="skip the passage index (prompts then carry whole chunks)")
+    parser.add_argument("--collection", help="collection to ingest (see collections.json; default: the default collection)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    pipeline = IngestionPipeline(
+        fresh=args.fresh,
+        skip_download=args.skip_download,
+        embed_workers=args.embed_workers,
+        queue_size=args.queue_size,
+        dedup=not args.no_dedup,
+        sentences=not args.no_sentence_index,
+        collection=args.collection,
+    )
+    sys.exit(0 if pipeline.run() else 1)
@@ -0,0 +1,189 @@
+"""
+model_router.py
+Pick the chat model per request from cheap signals, and escalate when the
+small model's answer fails a fast check.
+
+Policies (ROUTING_POLICY):
+- large:  every request goes to LARGE_MODEL (the previous behaviour)
+- small:  every request goes to SMALL_MODEL
+- tiered: SMALL_MODEL for simple requests, LARGE_MODEL when the query is long
+          or comparative, the context is large, or (with SMALL_MIN_SCORE set)
+          retrieval confidence is low
+
+The default stays "large", so deployments keep their model until tiered
+routing has been compared on their data (eval/compare_routing.py).
+
+With ROUTING_FALLBACK on, a small-model answer that is empty, truncated or
+uncertain is re-asked to LARGE_MODEL. Latency, tokens (including the prompt
+tokens the provider served from its prompt cache) and cost are tracked per
+route: small, large, and escalated (small first, then large).
+"""
+
+import os
+import re
+import time
+import threading
+
+SMALL_MODEL = os.getenv("SMALL_MODEL", "gpt-4o-mini")  # Azure deployment names
+LARGE_MODEL = os.getenv("LARGE_MODEL", "gpt-4o")
+ROUTING_POLICY = os.getenv("ROUTING_POLICY", "large")
+ROUTING_FALLBACK = os.getenv("ROUTING_FALLBACK", "1") != "0"
+POLICIES = ("large", "small", "tiered")
+ROUTES = ("small", "large", "escalated")
+
+# USD per 1M tokens (input, output)
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+CACHED_INPUT_DISCOUNT = 0.5  # cached prompt tokens are billed at half the input price
+
+# --- Tiered routing signals ---
+MAX_SIMPLE_QUERY_WORDS = 20      # longer questions go to the large model
+MAX_SMALL_CONTEXT_TOKENS = int(os.getenv("SMALL_MAX_CONTEXT_TOKENS", "6000"))  # about four full 1000-word chunks
+# Top hit score needed for the small model. Similarity scales differ per embedding
+# model, so there is no default: unset, retrieval confidence does not affect routing.
+SMALL_MIN_SCORE = float(os.environ["SMALL_MIN_SCORE"]) if os.getenv("SMALL_MIN_SCORE") else None
+_COMPLEX_RE = re.compile(r"\b(compare|comparison|difference|differences|versus|vs\.?|both|which of)\b", re.I)
+
+# --- Fallback check ---
+MIN_ANSWER_CHARS = 40
+_UNCERTAIN_RE = re.compile(
+    r"\b(i (do not|don't) know|i'?m not sure|(cannot|can't|unable to) (determine|answer|tell)"
+    r"|(not enough|insufficient) information)\b",
+    re.I,
+)
+
+
+def estimate_tokens(messages) -> int:
+    """Rough token count of chat messages (about 4 characters per token); good enough for routing."""
+    return sum(len(m["content"]) for m in messages) // 4 + 1
+
+
+def choose_model(query: str, hits, messages, policy: str = None):
+    """Return (model, reason) for one request."""
+    policy = policy or ROUTING_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown ROUTING_POLICY '{policy}' (expected one of {', '.join(POLICIES)})")
+    if policy == "large":
+        return LARGE_MODEL, "policy"
+    if policy == "small":
+        return SMALL_MODEL, "policy"
+
+    if len(query.split()) > MAX_SIMPLE_QUERY_WORDS:
+        return LARGE_MODEL, "long query"
+    if _COMPLEX_RE.search(query):
+        return LARGE_MODEL, "comparative query"
+    if SMALL_MIN_SCORE is not None and hits and hits[0].score < SMALL_MIN_SCORE:
+        return LARGE_MODEL, "low retrieval confidence"
+    if estimate_tokens(messages) > MAX_SMALL_CONTEXT_TOKENS:
+        return LARGE_MODEL, "large context"
+    return SMALL_MODEL, "simple"
+
+
+def needs_escalation(answer: str, finish_reason: str) -> bool:
+    """Fast check on a small-model answer: truncated, filtered, too short or uncertain."""
+    if finish_reason in ("length", "content_filter"):
+        return True
+    answer = (answer or "").strip()
+    return len(answer) < MIN_ANSWER_CHARS or bool(_UNCERTAIN_RE.search(answer))
+
+
+def completion_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    price_in, price_out = MODEL_PRICING.get(model, (0.0, 0.0))
+    input_cost = (prompt_tokens - cached_tokens) * price_in + cached_tokens * price_in * CACHED_INPUT_DISCOUNT
+    return (input_cost + completion_tokens * price_out) / 1_000_000
+
+# -----------------------------
+# Per-route statistics
+# -----------------------------
+_stats_lock = threading.Lock()
+_stats = {route: {"requests": 0, "seconds": 0.0, "prompt_tokens": 0, "cached_tokens": 0,
+                  "completion_tokens": 0, "cost_usd": 0.0} for route in ROUTES}
+
+
+def _record(result):
+    with _stats_lock:
+        stats = _stats[result["route"]]
+        stats["requests"] += 1
+        stats["seconds"] += result["seconds"]
+        stats["prompt_tokens"] += result["prompt_tokens"]
+        stats["cached_tokens"] += result["cached_tokens"]
+        stats["completion_tokens"] += result["completion_tokens"]
+        stats["cost_usd"] += result["cost_usd"]
+
+
+def get_routing_stats():
+    """Requests, average latency, tokens, prompt-cache hit rate and cost per route."""
+    with _stats_lock:
+        routes = {route: dict(stats) for route, stats in _stats.items()}
+    for stats in routes.values():
+        stats["avg_seconds"] = round(stats["seconds"] / stats["requests"], 4) if stats["requests"] else None
+        stats["cache_hit_rate"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else None
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["cost_usd"] = round(stats["cost_usd"], 6)
+    total = sum(stats["requests"] for stats in routes.values())
+    return {
+        "policy": ROUTING_POLICY,
+        "fallback": ROUTING_FALLBACK,
+        "models": {"small": SMALL_MODEL, "large": LARGE_MODEL},
+        "routes": routes,
+        "escalation_rate": round(routes["escalated"]["requests"] / total, 4) if total else 0.0,
+    }
+
+# -----------------------------
+# Routed completion
+# -----------------------------
+def cached_prompt_tokens(usage) -> int:
+    """
+    Prompt tokens served from the provider's prompt cache. The pinned openai
+    SDK (1.39) does not type `prompt_tokens_details`, so it arrives as a plain
+    dict; newer SDKs and the mock return an object.
+    """
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def _complete(client, model, messages):
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages
+    )
+    usage = response.usage
+    prompt_tokens = usage.prompt_tokens if usage else 0
+    completion_tokens = usage.completion_tokens if usage else 0
+    cached_tokens = cached_prompt_tokens(usage)
+    return {
+        "answer": response.choices[0].message.content,
+        "finish_reason": response.choices[0].finish_reason,
+        "seconds": time.perf_counter() - start,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": completion_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+    }
+
+
+def route_completion(client, messages, query: str, hits, policy: str = None, fallback: bool = None):
+    """
+    Answer the prompt `messages` with the routed model. Returns a dict with
+    the answer, model, route, reason, seconds, tokens and cost (summed over
+    both calls when the small model's answer was escalated).
+    """
+    fallback = ROUTING_FALLBACK if fallback is None else fallback
+    model, reason = choose_model(query, hits, messages, policy)
+    result = _complete(client, model, messages)
+    result.update(model=model, reason=reason, route="large" if model == LARGE_MODEL else "small")
+
+    if result["route"] == "small" and fallback and needs_escalation(result["answer"], result["finish_reason"]):
+        retry = _complete(client, LARGE_MODEL, messages)
+        for key in ("seconds", "prompt_tokens", "cached_tokens", "completion_tokens", "cost_usd"):
+            retry[key] += result[key]
+        retry.update(model=LARGE_MODEL, reason=f"{reason}; escalated", route="escalated")
+        result = retry
+
+    _record(result)
+    return result
@@ -0,0 +1,332 @@
+"""
+profiling.py
+Opt-in request profiling for the query path (rag(), build_prompt, the
+in-process Qdrant local-mode search, ...).
+
+Two profilers:
+- "sample": a background thread reads the profiled request's Python stack
+  every PROFILE_INTERVAL_MS (sys._current_frames) and counts collapsed stacks.
+  Low overhead; the output is the `func (file:line);...  count` format of
+  py-spy --format raw, which flamegraph.pl, speedscope and inferno read.
+- "cprofile": deterministic cProfile of the request thread, aggregated into
+  one pstats profile (exported as .prof for snakeviz / pstats). Exact call
+  counts, but slows the profiled request down noticeably.
+Both only see the thread that handles the request (not e.g. /api/batch workers).
+
+A request is profiled when:
+- PROFILE_ALLOW_HEADER=1 and it carries the PROFILE_HEADER header
+  (X-Profile: sample | cprofile | 1), or
+- PROFILE_MODE is "sample" or "cprofile" and it is picked at
+  PROFILE_SAMPLE_RATE (fraction of requests, default 1.0).
+By default neither applies: a request costs one lookup, no thread is started
+and nothing is recorded. The header is off by default because any client
+could otherwise slow its requests down with cProfile.
+
+Profiles are aggregated in memory (`store`). With PROFILE_ENDPOINTS=1 (off
+by default, as they expose internal call stacks and write files), GET
+/profile lists the top functions and recent profiled requests, GET
+/profile/flamegraph returns the collapsed stacks, and POST /profile/export
+writes .collapsed/.prof/top files to PROFILE_DIR, keeping the newest
+MAX_EXPORTS. `profiled(name)` profiles any block outside Flask (benchmarks).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import cProfile
+import pstats
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODES = ("sample", "cprofile")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "off").lower()       # off | sample | cprofile
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))  # fraction of requests profiled
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))    # stack sampling interval
+PROFILE_HEADER = "X-Profile"
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "0") == "1"
+PROFILE_ENDPOINTS = os.getenv("PROFILE_ENDPOINTS", "0") == "1"  # serve /profile*; keep off on public deployments
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(PROJECT_ROOT, "logs", "profiles"))
+TOP_N = 20
+RECENT_REQUESTS = 50   # per-request summaries kept for GET /profile
+MAX_EXPORTS = 20       # exports kept in PROFILE_DIR; older ones are deleted
+MAX_STACK_DEPTH = 128
+
+if PROFILE_MODE not in MODES + ("off",):
+    raise ValueError(f"Unknown PROFILE_MODE: {PROFILE_MODE}")
+
+# -----------------------------
+# Stack sampler
+# -----------------------------
+_labels = {}  # code object → "func (file:line)"
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(PROJECT_ROOT):
+            filename = os.path.relpath(filename, PROJECT_ROOT)
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+def collapse(frame) -> str:
+    """Collapsed stack of a frame, outermost call first."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    One daemon thread samples every registered thread's stack each interval.
+    It starts with the first profiled request and sleeps while none is active.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.lock = threading.Lock()
+        self.active = {}  # thread id → Counter of collapsed stacks
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id: int) -> Counter:
+        samples = Counter()
+        with self.lock:
+            self.active[thread_id] = samples
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return samples
+
+    def stop(self, thread_id: int) -> Counter:
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.wakeup.clear()
+            self.wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, samples in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse(frame)] += 1
+
+# -----------------------------
+# Aggregated profiles
+# -----------------------------
+def top_sampled(stacks: Counter, n: int = TOP_N):
+    """Hottest functions of sampled stacks: self samples (on top of the stack) and total (anywhere on it)."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for function in set(frames):
+            total[function] += count
+    samples = sum(stacks.values())
+    return [{"function": function, "self_pct": round(own[function] / samples * 100, 2),
+             "total_pct": round(total[function] / samples * 100, 2), "samples": total[function]}
+            for function, _ in own.most_common(n)]
+
+
+def top_cprofile(stats: pstats.Stats, n: int = TOP_N):
+    """Functions with the most own time in an aggregated cProfile."""
+    if stats is None:
+        return []
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:n]
+    return [{"function": f"{name} ({filename}:{line})", "calls": calls,
+             "own_ms": round(tottime * 1000, 3), "cumulative_ms": round(cumtime * 1000, 3)}
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+
+class ProfileStore:
+    """Profiles of all profiled requests, aggregated, plus a short per-request history."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stacks = Counter()
+            self.stats = None
+            self.requests = 0
+            self.recent = deque(maxlen=RECENT_REQUESTS)
+
+    def add(self, name: str, mode: str, seconds: float, samples: Counter = None, profile=None):
+        entry = {"name": name, "mode": mode, "ms": round(seconds * 1000, 2),
+                 "at": datetime.now().isoformat(timespec="seconds")}
+        stats = None
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            entry["top"] = [row["function"] for row in top_cprofile(stats, 3)]
+        elif samples:
+            entry["samples"] = sum(samples.values())
+            entry["top"] = [row["function"] for row in top_sampled(samples, 3)]
+        with self.lock:
+            self.requests += 1
+            self.recent.append(entry)
+            if samples:
+                self.stacks.update(samples)
+            if stats is not None:
+                if self.stats is None:
+                    self.stats = stats
+                else:
+                    self.stats.add(stats)
+
+    def collapsed(self) -> str:
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, n: int = TOP_N) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "samples": sum(self.stacks.values()),
+                    "top_sampled": top_sampled(self.stacks, n), "top_cprofile": top_cprofile(self.stats, n),
+                    "recent": list(self.recent)}
+
+    def export(self, directory: str = PROFILE_DIR) -> dict:
+        """Write the aggregated profiles to `directory`; returns the written paths."""
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        paths = {}
+        collapsed = self.collapsed()
+        if collapsed:
+            paths["collapsed"] = os.path.join(directory, f"profile-{stamp}.collapsed")
+            with open(paths["collapsed"], "w", encoding="utf-8") as f:
+                f.write(collapsed)
+        with self.lock:
+            if self.stats is not None:
+                paths["prof"] = os.path.join(directory, f"profile-{stamp}.prof")
+                self.stats.dump_stats(paths["prof"])
+        paths["top"] = os.path.join(directory, f"profile-{stamp}.top.json")
+        with open(paths["top"], "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        _prune_exports(directory)
+        return paths
+
+
+def _prune_exports(directory: str, keep: int = MAX_EXPORTS):
+    """Delete all but the newest `keep` exports (their files share a profile-<stamp> prefix)."""
+    stamps = sorted({name.split(".", 1)[0] for name in os.listdir(directory) if name.startswith("profile-")})
+    for stamp in stamps[:-keep]:
+        for name in os.listdir(directory):
+            if name.split(".", 1)[0] == stamp:
+                os.remove(os.path.join(directory, name))
+
+
+sampler = StackSampler()
+store = ProfileStore()
+_cprofile_lock = threading.Lock()  # one cProfile at a time (Python 3.12+ allows only one)
+
+# -----------------------------
+# Profiling a block
+# -----------------------------
+def choose_mode(header_value: str = None):
+    """Profiler for a request ("sample", "cprofile") or None when it is not profiled."""
+    if header_value and PROFILE_ALLOW_HEADER:
+        value = header_value.strip().lower()
+        if value in MODES:
+            return value
+        if value in ("1", "true", "yes"):
+            return PROFILE_MODE if PROFILE_MODE in MODES else "sample"
+    if PROFILE_MODE in MODES and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_MODE
+    return None
+
+
+def start(mode: str):
+    """Start profiling the current thread; returns a token for `stop`."""
+    if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+        profile = cProfile.Profile()
+        profile.enable()
+        return ("cprofile", profile, time.perf_counter())
+    # sampling is also the fallback while another request holds cProfile
+    return ("sample", sampler.start(threading.get_ident()), time.perf_counter())
+
+
+def stop(token, name: str):
+    """Stop profiling and add the profile to `store`."""
+    mode, profiler, started = token
+    seconds = time.perf_counter() - started
+    if mode == "cprofile":
+        profiler.disable()
+        _cprofile_lock.release()
+        store.add(name, mode, seconds, profile=profiler)
+    else:
+        samples = sampler.stop(threading.get_ident())
+        store.add(name, mode, seconds, samples=samples)
+
+
+@contextmanager
+def profiled(name: str, mode: str = None):
+    """Profile a block with `mode` (default PROFILE_MODE); does nothing when profiling is off."""
+    mode = mode or (PROFILE_MODE if PROFILE_MODE in MODES else None)
+    if mode is None:
+        yield
+        return
+    token = start(mode)
+    try:
+        yield
+    finally:
+        stop(token, name)
+
+# -----------------------------
+# Flask integration
+# -----------------------------
+def init_app(app):
+    """Profile requests chosen by `choose_mode`; serve the /profile endpoints when PROFILE_ENDPOINTS=1."""
+    from flask import Response, g, jsonify, request
+
+    if not PROFILE_ALLOW_HEADER and PROFILE_MODE not in MODES:
+        return  # nothing can be profiled; add no per-request hooks
+
+    @app.before_request
+    def _start_profile():
+        if request.path.startswith("/profile"):
+            return
+        mode = choose_mode(request.headers.get(PROFILE_HEADER))
+        if mode is not None:
+            g.profile_token = start(mode)
+
+    @app.teardown_request
+    def _stop_profile(exc=None):
+        token = g.pop("profile_token", None)
+        if token is not None:
+            stop(token, f"{request.method} {request.path}")
+
+    if not PROFILE_ENDPOINTS:
+        return
+
+    @app.route("/profile", methods=["GET"])
+    def profile_summary():
+        """Top functions of the profiled requests and the most recent ones."""
+        n = request.args.get("top", TOP_N, type=int)
+        return jsonify({"mode": PROFILE_MODE, "sample_rate": PROFILE_SAMPLE_RATE, **store.summary(n)})
+
+    @app.route("/profile/flamegraph", methods=["GET"])
+    def profile_flamegraph():
+        """Collapsed stacks, e.g. `curl .../profile/flamegraph | flamegraph.pl > profile.svg`."""
+        return Response(store.collapsed(), mimetype="text/plain")
+
+    @app.route("/profile/export", methods=["POST"])
+    def profile_export():
+        paths = store.export()
+        if request.args.get("reset"):
+            store.reset()
+        return jsonify(paths)
@@ -0,0 +1,291 @@
+"""
+providers.py
+Pluggable embedding and chat providers.
+
+The backend is chosen with environment variables:
+- LLM_PROVIDER=azure (default) talks to Azure OpenAI.
+- LLM_PROVIDER=mock uses a deterministic, fully offline stand-in so the ingest
+  and query paths can be benchmarked without network access.
+- EMBEDDING_PROVIDER overrides the embedding backend only (defaults to LLM_PROVIDER).
+  EMBEDDING_PROVIDER=fastembed runs a local ONNX model on CPU (no network, no billing).
+- Collections with their own embedding settings (collection_registry.py) pass
+  the provider and model to `get_embedder` explicitly.
+
+Embedders expose `embed_documents(texts)` / `embed_query(text)` /
+`embed_queries(texts)` (many queries in one call); chat clients
+mirror the `client.chat.completions.create(...)` surface of the OpenAI SDK.
+"""
+
+import os
+import re
+import time
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import List
+from dotenv import load_dotenv
+load_dotenv()
+
+EMBED_MODEL = "text-embedding-3-small"
+EMBEDDING_SIZE = 1536  # 1536 for OpenAI's text-embedding-3-small
+AZURE_EMBEDDING_SIZES = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072,
+                         "text-embedding-ada-002": 1536}
+
+# --- Local fastembed/ONNX settings ---
+FASTEMBED_MODEL = os.getenv("FASTEMBED_MODEL", "BAAI/bge-small-en-v1.5")
+FASTEMBED_THREADS = int(os.getenv("FASTEMBED_THREADS", "0")) or None       # ONNX intra-op threads (None = all cores)
+FASTEMBED_BATCH_SIZE = int(os.getenv("FASTEMBED_BATCH_SIZE", "64"))
+FASTEMBED_PARALLEL = int(os.getenv("FASTEMBED_PARALLEL", "1"))            # worker processes for bulk ingestion (0 = all cores)
+
+# --- Mock backend settings ---
+MOCK_CHAT_LATENCY = float(os.getenv("MOCK_CHAT_LATENCY", "0.0"))          # seconds before the first token
+MOCK_CHAT_TOKENS_PER_SEC = float(os.getenv("MOCK_CHAT_TOKENS_PER_SEC", "0"))  # 0 = no per-token delay
+MOCK_EMBED_LATENCY = float(os.getenv("MOCK_EMBED_LATENCY", "0.0"))        # seconds per embedding call
+# Emulated provider prompt cache: prefixes of at least 1024 tokens, matched in 128-token steps
+MOCK_CACHE_MIN_TOKENS = 1024
+MOCK_CACHE_INCREMENT = 128
+MOCK_CACHE_ENTRIES = 10000
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def get_provider_name() -> str:
+    return os.getenv("LLM_PROVIDER", "azure").lower()
+
+
+def get_embedding_provider_name() -> str:
+    return os.getenv("EMBEDDING_PROVIDER", get_provider_name()).lower()
+
+# -----------------------------
+# Azure OpenAI
+# -----------------------------
+@lru_cache(maxsize=None)
+def get_azure_client():
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION")
+    )
+
+
+class AzureEmbedder:
+    """Embeddings from an Azure OpenAI deployment."""
+
+    def __init__(self, client, model: str = EMBED_MODEL, dim: int = EMBEDDING_SIZE):
+        self.client = client
+        self.model_name = model
+        self.dim = dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model_name, input=texts)
+        return [r.embedding for r in response.data]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)  # one request for the whole batch
+
+# -----------------------------
+# Local fastembed (ONNX, CPU)
+# -----------------------------
+class FastEmbedEmbedder:
+    """
+    Local embeddings with fastembed/ONNX.
+    Bulk ingestion uses batched (optionally multi-process) inference; queries
+    use a single in-process call so serving latency stays low.
+    The model is loaded on first use, so reading `model_name`/`dim` is cheap.
+    """
+
+    def __init__(self, model: str = FASTEMBED_MODEL, threads=FASTEMBED_THREADS,
+                 batch_size: int = FASTEMBED_BATCH_SIZE, parallel: int = FASTEMBED_PARALLEL):
+        from fastembed import TextEmbedding
+        supported = {m["model"]: m["dim"] for m in TextEmbedding.list_supported_models()}
+        if model not in supported:
+            raise ValueError(f"Unsupported fastembed model: {model}")
+        self.model_name = model
+        self.dim = supported[model]
+        self.threads = threads
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from fastembed import TextEmbedding
+                    self._model = TextEmbedding(model_name=self.model_name, threads=self.threads)
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # parallel > 1 (or 0) fans batches out to worker processes, which only
+        # pays off for large inputs
+        parallel = self.parallel if len(texts) > self.batch_size and self.parallel != 1 else None
+        vectors = self.model.embed(texts, batch_size=self.batch_size, parallel=parallel)
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return next(iter(self.model.query_embed(text))).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [v.tolist() for v in self.model.query_embed(texts, batch_size=self.batch_size)]
+
+# -----------------------------
+# Offline mock
+# -----------------------------
+class HashEmbedder:
+    """
+    Deterministic feature-hashing embedder (word unigrams + bigrams), L2-normalized.
+    Texts that share words get similar vectors, so retrieval over a mock index
+    still behaves plausibly.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_SIZE, latency: float = MOCK_EMBED_LATENCY):
+        self.model_name = f"mock-hash-{dim}"
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vec[index] += sign
+        norm = math.sqrt(sum(v * v for v in vec))
+        if norm == 0:
+            # Empty text still needs a valid unit vector for cosine distance
+            vec[0] = 1.0
+            return vec
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+def _mock_answer(messages) -> str:
+    """Short deterministic answer citing the sources found in the prompt."""
+    prompt = messages[-1]["content"] if messages else ""
+    sources = re.findall(r"SOURCE: (\S+)", prompt)
+    question = re.search(r"QUESTION: (.*)", prompt)
+    question = question.group(1).strip() if question else prompt.strip()[:200]
+    cited = ", ".join(dict.fromkeys(sources)) or "no sources"
+    return f"[mock answer] {question} (based on: {cited})"
+
+
+class _MockCompletions:
+    def __init__(self, latency: float, tokens_per_sec: float, responder):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.responder = responder
+        self.prefixes = OrderedDict()  # prefix hash → None, oldest first
+        self.lock = threading.Lock()
+
+    def _cached_tokens(self, model, tokens):
+        """Length of the longest previously seen prefix, like a provider-side prompt cache."""
+        digest = hashlib.blake2b(model.encode("utf-8"), digest_size=16)
+        cached, start, hit = 0, 0, True
+        with self.lock:
+            for end in range(MOCK_CACHE_MIN_TOKENS, len(tokens) + 1, MOCK_CACHE_INCREMENT):
+                digest.update(" ".join(tokens[start:end]).encode("utf-8"))
+                start = end
+                key = digest.copy().digest()
+                if hit and key in self.prefixes:
+                    cached = end
+                    self.prefixes.move_to_end(key)
+                else:
+                    hit = False
+                    self.prefixes[key] = None
+            while len(self.prefixes) > MOCK_CACHE_ENTRIES:
+                self.prefixes.popitem(last=False)
+        return cached
+
+    def create(self, model: str, messages, stream: bool = False, **kwargs):
+        content = self.responder(messages)
+        words = content.split(" ")
+        tokens = [token for m in messages for token in [m.get("role", "")] + _TOKEN_RE.findall(m.get("content", ""))]
+        prompt_tokens = len(tokens) - len(messages)  # role markers only separate messages
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(words),
+            total_tokens=prompt_tokens + len(words),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=min(self._cached_tokens(model, tokens), prompt_tokens)),
+        )
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return self._stream(model, words)
+        if self.tokens_per_sec:
+            time.sleep(len(words) / self.tokens_per_sec)
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=usage,
+        )
+
+    def _stream(self, model, words):
+        for i, word in enumerate(words):
+            if self.tokens_per_sec:
+                time.sleep(1.0 / self.tokens_per_sec)
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+
+class MockChatClient:
+    """Offline chat client with configurable latency and streaming."""
+
+    def __init__(self, latency: float = MOCK_CHAT_LATENCY,
+                 tokens_per_sec: float = MOCK_CHAT_TOKENS_PER_SEC, responder=_mock_answer):
+        self.chat = SimpleNamespace(completions=_MockCompletions(latency, tokens_per_sec, responder))
+
+# -----------------------------
+# Factories
+# -----------------------------
+@lru_cache(maxsize=None)
+def get_chat_client():
+    """Chat client for the configured provider (cached per process)."""
+    provider = get_provider_name()
+    if provider == "mock":
+        return MockChatClient()
+    if provider == "azure":
+        return get_azure_client()
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+
+def get_embedder(provider: str = None, model: str = None):
+    """
+    Embedder for `provider`/`model`, defaulting to the configured provider and
+    its default model (cached per process, one instance per combination).
+    Mock models are named mock-hash-<dim>.
+    """
+    return _get_embedder((provider or get_embedding_provider_name()).lower(), model)
+
+
+@lru_cache(maxsize=None)
+def _get_embedder(provider: str, model: str):
+    if provider == "mock":
+        return HashEmbedder(int(model.rsplit("-", 1)[1])) if model else HashEmbedder()
+    if provider == "fastembed":
+        return FastEmbedEmbedder(model) if model else FastEmbedEmbedder()
+    if provider == "azure":
+        model = model or EMBED_MODEL
+        return AzureEmbedder(get_azure_client(), model, AZURE_EMBEDDING_SIZES.get(model, EMBEDDING_SIZE))
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
@@ -1,116 +1,288 @@
 from typing import List
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
-from openai import AzureOpenAI
+from functools import lru_cache, partial
+import json
+import time
+import threading
 import os
 from dotenv import load_dotenv
+from providers import get_chat_client
+from company_filter import detect_companies, company_filter
+from collection_registry import collection_embedder, registry
+from model_router import LARGE_MODEL, route_completion
 load_dotenv()
 
 # -----------------------------
 # Configuration
 # -----------------------------
 
-TOP_K = 3  # number of top relevant documents to retrieve
-embed_model = "text-embedding-3-small"
-gpt_model = "gpt-4o"
+TOP_K = 3  # number of top relevant documents to retrieve (fixed-k callers such as the benchmarks)
+gpt_model = LARGE_MODEL  # fixed-model calls (call_llm); rag() routes per request (model_router.py)
+PROMPT_VERSION = "v3"  # bump whenever build_prompt changes so cached eval answers are invalidated
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-QDRANT_PATH = os.path.join(PROJECT_ROOT, "data/qdrant_data")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+# Pre-filter on companies named in the query. Off by default: embedded Qdrant
+# (QdrantClient(path=...)) ignores payload indexes, so a filtered search scans
+# the payloads and is slower than an unfiltered one. Only worth enabling when
+# the collection is served by a Qdrant server.
+COMPANY_FILTER = os.getenv("COMPANY_FILTER", "0") == "1"
 
-client_openai = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_version=AZURE_OPENAI_API_VERSION
-)
+# Score-aware retrieval (see select_hits). Tuned per embedding model by
+# eval/tune_thresholds.py; environment variables (MIN_SCORE, MIN_CONFIDENCE,
+# SCORE_GAP, MAX_K) override the tuned values. Untuned, nothing is dropped,
+# at most TOP_K hits are kept as before, and the score gap can only lower k.
+SCORE_THRESHOLDS_FILE = os.getenv("SCORE_THRESHOLDS_FILE", os.path.join(PROJECT_ROOT, "eval", "score_thresholds.json"))
+DEFAULT_THRESHOLDS = {
+    "min_score": 0.0,       # hits scoring below this are dropped
+    "min_confidence": 0.0,  # below this top score, answer without calling the LLM
+    "score_gap": 0.1,       # stop adding hits after a drop larger than this
+    "max_k": TOP_K,         # upper bound on adaptive k (tuning may raise it)
+}
+NO_RELEVANT_ANSWER = "No relevant policy found for this question in the ToS;DR documents."
+
+# Identical for every request, so it forms a stable, cacheable prompt prefix
+SYSTEM_PROMPT = """You are an intelligent assistant that helps users answer questions about Terms of Service and Privacy Policies.
+
+Answer the QUESTION based on the relevant documents retrieved from the TOSDR database.
+Use only the facts from the content when answering the QUESTION."""
+
+# Azure OpenAI by default; LLM_PROVIDER=mock runs fully offline (see providers.py).
+# Clients are created on first use (get_chat_client / get_embedder), so importing
+# this module stays cheap and works without credentials.
+
+# -----------------------------
+# Collections
+# -----------------------------
+# Each collection's Qdrant client, text store, passage index and company
+# aliases are opened together on first use and unloaded (least recently used
+# first) when the loaded collections exceed the memory budget; see
+# collection_registry.py. `collection=None` is the default collection.
+
+def get_embedder(collection: str = None):
+    """Embedder of a collection (queries must be embedded like its documents)."""
+    return collection_embedder(collection)
+
+def get_score_thresholds(collection: str = None):
+    """Thresholds tuned for the collection's embedding model, with environment overrides."""
+    return _score_thresholds(get_embedder(collection).model_name)
+
+@lru_cache(maxsize=None)
+def _score_thresholds(embedding_model: str):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if os.path.exists(SCORE_THRESHOLDS_FILE):
+        with open(SCORE_THRESHOLDS_FILE, "r", encoding="utf-8") as f:
+            tuned = json.load(f)
+        # scores are not comparable across embedding models
+        if tuned.get("embedding_model") == embedding_model:
+            thresholds.update({key: tuned[key] for key in DEFAULT_THRESHOLDS if key in tuned})
+    for key, default in DEFAULT_THRESHOLDS.items():
+        value = os.getenv(key.upper())
+        if value:
+            thresholds[key] = type(default)(value)
+    return thresholds
 
 # -----------------------------
 # Function: Search Qdrant
 # -----------------------------
-def search_documents(query_embedding: List[float], top_k: int = TOP_K):
+def search_documents(query_embedding: List[float], top_k: int = TOP_K, companies: List[str] = None,
+                     offset: int = 0, collection: str = None):
     """
-    Search Qdrant collection for top_k most similar documents.
+    Search Qdrant collection for top_k most similar documents (after skipping
+    `offset` for pagination), restricted to `companies` (via the company
+    payload index) when given.
     Returns a list of hits with payload.
     """
 
-    client_qdrant = QdrantClient(path=QDRANT_PATH)
+    with registry.acquire(collection) as handle:
+        hits = handle.client.search(
+            collection_name=handle.name,
+            query_vector=query_embedding,
+            query_filter=company_filter(companies),
+            limit=top_k,
+            offset=offset,
+            with_payload=True
+        )
+    return hits
 
-    hits = client_qdrant.search(
-        collection_name="tosdr_docs",
-        query_vector=query_embedding,
-        limit=top_k,
-        with_payload=True
-    )
+def retrieve(query: str, query_embedding: List[float], top_k: int = TOP_K, offset: int = 0,
+             collection: str = None):
+    """
+    Pre-filtered search when the query names known companies, falling back
+    to searching everything if the filter leaves no hits at all.
+    """
+    with registry.acquire(collection) as handle:
+        companies = detect_companies(query, handle.company_aliases) if COMPANY_FILTER else []
+    search = partial(search_documents, query_embedding, collection=collection)
+    hits = search(top_k=top_k, companies=companies, offset=offset)
+    # past the first page, an empty page only means "filtered results exhausted"
+    if companies and not hits and (offset == 0 or not search(top_k=1, companies=companies)):
+        hits = search(top_k=top_k, offset=offset)
     return hits
 
+def describe_hit(hit) -> dict:
+    """JSON-friendly summary of a hit: chunk id, score, source and companies."""
+    payload = hit.payload
+    return {
+        "chunk_id": payload.get("source_id"),
+        "score": round(hit.score, 4),
+        "source": payload.get("source"),
+        "company": payload.get("company"),
+        "duplicate_ids": payload.get("duplicate_ids", []),
+    }
+
+def select_hits(hits, thresholds=None):
+    """
+    Adaptive k: keep hits from the top down until one scores below min_score
+    or falls more than score_gap below the previous hit. Returns [] when the
+    best hit is below min_confidence, i.e. nothing relevant was found.
+    """
+    thresholds = thresholds or get_score_thresholds()
+    if not hits or hits[0].score < thresholds["min_confidence"]:
+        return []
+    selected = [hits[0]]
+    for prev, hit in zip(hits, hits[1:thresholds["max_k"]]):
+        if hit.score < thresholds["min_score"] or prev.score - hit.score > thresholds["score_gap"]:
+            break
+        selected.append(hit)
+    return selected
+
+# -----------------------------
+# Query statistics
+# -----------------------------
+_stats_lock = threading.Lock()
+_stats = {
+    "queries": 0,
+    "llm_calls": 0,
+    "early_exits": 0,     # answered without an LLM call
+    "hits_retrieved": 0,  # candidates returned by the search
+    "hits_used": 0,       # hits that made it into a prompt
+    "llm_seconds": 0.0,
+    "early_exit_seconds": 0.0,
+    "context_chars": 0,   # characters of retrieved context sent to the LLM
+}
+
+def _record(**counts):
+    with _stats_lock:
+        for key, value in counts.items():
+            _stats[key] += value
+
+def get_query_stats():
+    """Counters of the query path, with the LLM calls and latency saved by early exits."""
+    with _stats_lock:
+        stats = dict(_stats)
+    avg_llm = stats["llm_seconds"] / stats["llm_calls"] if stats["llm_calls"] else 0.0
+    stats.update({
+        "llm_calls_saved": stats["early_exits"],
+        "avg_llm_seconds": round(avg_llm, 4),
+        "avg_early_exit_seconds": round(stats["early_exit_seconds"] / stats["early_exits"], 4) if stats["early_exits"] else None,
+        # each early exit skips one LLM call, estimated at the average observed call
+        "est_seconds_saved": round(stats["early_exits"] * avg_llm, 3),
+        "avg_k": round(stats["hits_used"] / stats["llm_calls"], 3) if stats["llm_calls"] else None,
+        "avg_context_chars": round(stats["context_chars"] / stats["llm_calls"]) if stats["llm_calls"] else None,
+        "thresholds": get_score_thresholds(),
+    })
+    stats["llm_seconds"] = round(stats["llm_seconds"], 3)
+    stats["early_exit_seconds"] = round(stats["early_exit_seconds"], 3)
+    return stats
+
 # -----------------------------
 # Function: Build Prompt
 # -----------------------------
-def build_prompt(hits: List[PointStruct], query: str) -> str:
+def build_prompt(hits: List, query: str, query_embedding: List[float] = None, collection: str = None) -> List[dict]:
     """
-    Build a RAG prompt template using top hits.
+    Build the chat messages for the top hits, laid out for provider-side
+    prompt caching: the fixed system message first, then the context blocks
+    sorted by chunk id (so the same hit set always yields the same prefix),
+    and the question last.
+    Chunk text is read from the text store only for these final hits. With
+    `query_embedding` and a sentence index, each block carries only the
+    chunk's best-matching passages; the block still cites the chunk's source.
     """
+    hits = sorted(hits, key=lambda hit: hit.payload.get("source_id", ""))
     context_sections = []
-    for hit in hits:
-        source = hit.payload.get("source", "unknown")
-        content = hit.payload.get("content", "")
-        section = f"SOURCE: {source}\nCONTENT: {content}"
-        context_sections.append(section)
+    with registry.acquire(collection) as handle:
+        text_store = handle.text_store
+        sentence_index = handle.sentence_index if query_embedding is not None else None
+        spans = (sentence_index.select_spans(query_embedding, [hit.payload.get("source_id") for hit in hits])
+                 if sentence_index is not None else {})
+        for hit in hits:
+            source = hit.payload.get("source", "unknown")
+            content = hit.payload.get("content")  # older indexes keep the text in the payload
+            if content is None:
+                content = (text_store.get(hit.payload.get("source_id")) if text_store else None) or ""
+            if hit.payload.get("source_id") in spans:
+                content = sentence_index.extract(content, spans[hit.payload["source_id"]])
+            section = f"SOURCE: {source}\nCONTENT: {content}"
+            context_sections.append(section)
     
     context = "\n\n".join(context_sections)
-    
-    prompt = f"""
-You are an intelligent assistant that helps users answer questions about Terms of Service and Privacy Policies.
-
-Answer the QUESTION based on the relevant documents retrieved from the TOSDR database.
-Use only the facts from the content when answering the QUESTION.
-
-{context}
 
-QUESTION: {query}
-"""
-    return prompt
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{context}\n\nQUESTION: {query}"},
+    ]
 
 # -----------------------------
 # Function: Call LLM
 # -----------------------------
-def call_llm(client_openai: AzureOpenAI, prompt: str) -> str:
+def call_llm(client_openai, messages: List[dict]) -> str:
     """
-    Call Azure OpenAI to generate an answer from the prompt.
+    Call the chat provider (Azure OpenAI or the offline mock) to generate an answer from the prompt messages.
     """
     response = client_openai.chat.completions.create(
         model=gpt_model, 
-        messages=[{"role": "user", "content": prompt}]
+        messages=messages
     )
     return response.choices[0].message.content
 
 # -----------------------------
 # Function: Orchestrator
 # -----------------------------
-def rag(query: str) -> str:
+def answer(query: str, query_embedding: List[float] = None, collection: str = None) -> dict:
     """
-    Full RAG pipeline: embed query, search, build prompt, call LLM.
+    Full RAG pipeline: embed query, search, build prompt, call the routed LLM.
+    Low-confidence retrievals return NO_RELEVANT_ANSWER without an LLM call.
+    Returns the answer with the model route, the hits used and per-stage
+    timings in ms. Pass `query_embedding` when it was computed in a batch
+    (with the collection's embedder).
     """
+    start = time.perf_counter()
+    thresholds = get_score_thresholds(collection)
+    timings = {}
+
     # Step 1: Embed the query
-    embedding_resp = client_openai.embeddings.create(
-        model=embed_model,
-        input=query
-    )
-    query_embedding = embedding_resp.data[0].embedding
+    if query_embedding is None:
+        query_embedding = get_embedder(collection).embed_query(query)
+    timings["embed"] = time.perf_counter() - start
 
-    # Step 2: Search top documents
-    hits = search_documents(query_embedding, top_k=TOP_K)
+    # Step 2: Search top documents (filtered to the companies named in the query)
+    candidates = retrieve(query, query_embedding, top_k=thresholds["max_k"], collection=collection)
+    hits = select_hits(candidates, thresholds)
+    timings["search"] = time.perf_counter() - start - timings["embed"]
 
     if not hits:
-        return "No relevant documents found."
+        _record(queries=1, early_exits=1, hits_retrieved=len(candidates),
+                early_exit_seconds=time.perf_counter() - start)
+        timings["total"] = time.perf_counter() - start
+        return {"answer": NO_RELEVANT_ANSWER, "early_exit": True, "model": None, "route": None,
+                "hits": [], "timings_ms": {k: round(v * 1000, 2) for k, v in timings.items()}}
+
+    # Step 3: Build prompt (system message + best passages of each chunk, sorted by chunk id + question)
+    prompt_start = time.perf_counter()
+    messages = build_prompt(hits, query, query_embedding, collection)
+    timings["prompt"] = time.perf_counter() - prompt_start
 
-    # Step 3: Build prompt
-    prompt = build_prompt(hits, query)
+    # Step 4: Call the routed LLM (small model for simple requests, escalating when needed)
+    result = route_completion(get_chat_client(), messages, query, hits)
+    timings["llm"] = result["seconds"]
+    timings["total"] = time.perf_counter() - start
+    _record(queries=1, llm_calls=1, hits_retrieved=len(candidates), hits_used=len(hits),
+            llm_seconds=result["seconds"], context_chars=len(messages[-1]["content"]) - len(query))
+    return {"answer": result["answer"], "early_exit": False, "model": result["model"], "route": result["route"],
+            "hits": [describe_hit(hit) for hit in hits],
+            "timings_ms": {k: round(v * 1000, 2) for k, v in timings.items()}}
 
-    # Step 4: Call LLM
-    answer = call_llm(client_openai, prompt)
-    return answer
+def rag(query: str, collection: str = None) -> str:
+    """The answer text of `answer(query)`."""
+    return answer(query, collection=collection)["answer"]
 
 if __name__ == "__main__":
 
@@ -0,0 +1,261 @@
+"""
+sentence_index.py
+Passage-level embedding index inside the retrieved chunks.
+
+Chunks are up to WORDS_PER_CHUNK words, while a question is usually answered by
+one or two sentences. At ingestion every chunk in the text store is split into
+passages (runs of whole sentences, about PASSAGE_WORDS words each) that are
+embedded in bulk. At query time `select_spans` scores only the passages of the
+final hits against the query embedding (one matrix-vector product) and keeps
+the best few per chunk, so the prompt carries those spans instead of the whole
+chunks. Citations still name the parent chunk's source.
+
+Layout of an index directory (next to the text store):
+- vectors.npy  float32 [passages, dim], L2-normalized
+- spans.npy    int32 [passages, 2], character span (start, end) in the chunk text
+- offsets.npy  int64 [chunks + 1], passages of chunk i are rows offsets[i]:offsets[i+1]
+- meta.json    embedding model and dimension, passage size, chunk ids in row order
+               and a content hash per chunk (passages are only reused for unchanged text)
+
+The .npy files are memory-mapped, so loading is instant and the OS page cache
+is shared by worker processes.
+
+Usage:
+    python src/sentence_index.py [collection]    # (re)build with the collection's embedder
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+from tqdm import tqdm
+
+SENTENCE_INDEX_DIR = "sentence_index"
+META_FILE = "meta.json"
+PASSAGE_WORDS = 60     # sentences are merged until a passage reaches this many words
+EMBED_BATCH_SIZE = 64  # passages per embedding request
+SPANS_PER_CHUNK = int(os.getenv("SPANS_PER_CHUNK", "2"))  # passages kept from each retrieved chunk
+SPAN_SEPARATOR = " … "
+FORMAT_VERSION = 1
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+|\n\s*\n")
+
+
+def sentence_index_path(qdrant_path: str, collection_name: str) -> str:
+    """Sentence index directory that belongs to a collection of the embedded Qdrant at qdrant_path."""
+    return os.path.join(qdrant_path, SENTENCE_INDEX_DIR, collection_name)
+
+
+def split_passages(text: str, passage_words: int = PASSAGE_WORDS):
+    """Character spans [(start, end), ...] of consecutive sentence groups covering `text`."""
+    spans, start, words = [], None, 0
+    position = 0
+    for boundary in list(_SENTENCE_END_RE.finditer(text)) + [None]:
+        end = boundary.start() if boundary else len(text)
+        sentence = text[position:end]
+        if sentence.strip():
+            if start is None:
+                start = position + (len(sentence) - len(sentence.lstrip()))
+            words += len(sentence.split())
+            if words >= passage_words or boundary is None:
+                spans.append((start, end))
+                start, words = None, 0
+        position = boundary.end() if boundary else len(text)
+    if start is not None:
+        spans.append((start, len(text.rstrip())))
+    return spans
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash stored per chunk; a chunk's passages are reused only while it matches."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _load_reusable(path, model_name):
+    """
+    The existing index at `path` if it was built with the same model and
+    passage size (read through mmap), else None.
+    """
+    try:
+        index = SentenceIndex(path)
+    except (FileNotFoundError, ValueError):
+        return None
+    if index.embedding_model != model_name or index.passage_words != PASSAGE_WORDS:
+        return None
+    return index
+
+
+def _reusable_rows(index, chunk_id, text, digest):
+    """Rows (lo, hi) of a chunk in the old index if its text is unchanged, else None."""
+    if index is None or index.hashes.get(chunk_id) != digest:
+        return None  # new chunk, changed text (re-ingestion, chunker change), or an index without hashes
+    lo, hi = index.rows[chunk_id]
+    if hi > lo and index.spans[hi - 1][1] > len(text):
+        return None
+    return lo, hi
+
+
+def build_sentence_index(text_store, path: str, embedder, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Split every chunk of `text_store` into passages and embed them in bulk.
+    Passages of chunks already in an index at `path` (same model, same text)
+    are reused, so re-running after an incremental ingestion only embeds new
+    or changed chunks.
+    Two passes over the store keep memory flat: the first lays out the rows
+    (spans only), the second writes vectors straight into a memory-mapped
+    .npy, one embedding batch at a time. Returns the number of passages.
+    """
+    reusable = _load_reusable(path, embedder.model_name)
+
+    # 1️⃣ Layout: passage spans of every chunk and where its rows start
+    chunk_ids, hashes, reused, spans, offsets = [], [], [], [], [0]
+    new_chunks, new_passages = 0, 0
+    for chunk_id, text in text_store.iter_items():
+        chunk_ids.append(chunk_id)
+        hashes.append(chunk_hash(text))
+        rows = _reusable_rows(reusable, chunk_id, text, hashes[-1])
+        reused.append(rows)
+        if rows is not None:
+            chunk_spans = reusable.spans[rows[0]:rows[1]]
+        else:
+            chunk_spans = np.array(split_passages(text), dtype=np.int32).reshape(-1, 2)
+            new_chunks += 1
+            new_passages += len(chunk_spans)
+        spans.append(chunk_spans)
+        offsets.append(offsets[-1] + len(chunk_spans))
+    spans = np.concatenate(spans) if spans else np.zeros((0, 2), dtype=np.int32)
+    print(f"🧩 Sentence index: {new_passages} new passages to embed, "
+          f"{len(chunk_ids) - new_chunks} chunks reused")
+
+    # Write to a sibling directory and swap it in, so readers never see a partial index
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                        dtype=np.float32, shape=(offsets[-1], embedder.dim))
+
+    # 2️⃣ Vectors: copy reused rows, embed new passages batch by batch into their rows
+    batch_rows, batch_texts = [], []
+
+    def flush():
+        if batch_texts:
+            vectors[batch_rows] = _normalize(np.asarray(embedder.embed_documents(batch_texts), dtype=np.float32))
+            progress.update(len(batch_texts))
+            batch_rows.clear()
+            batch_texts.clear()
+
+    with tqdm(total=new_passages, desc="Embedding passages") as progress:
+        for chunk_no, (chunk_id, text) in enumerate(text_store.iter_items()):
+            row = offsets[chunk_no]
+            if reused[chunk_no] is not None:
+                lo, hi = reused[chunk_no]
+                vectors[row:row + hi - lo] = reusable.vectors[lo:hi]
+                continue
+            for i, (start, end) in enumerate(spans[row:offsets[chunk_no + 1]]):
+                batch_rows.append(row + i)
+                batch_texts.append(text[start:end])
+                if len(batch_texts) >= batch_size:
+                    flush()
+        flush()
+    vectors.flush()
+    del vectors
+    del reusable  # release the old index's mmaps before it is replaced
+
+    np.save(os.path.join(tmp_path, "spans.npy"), spans)
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": FORMAT_VERSION, "embedding_model": embedder.model_name,
+                   "embedding_dim": embedder.dim, "passage_words": PASSAGE_WORDS,
+                   "built_at": time.time(), "chunk_ids": chunk_ids, "chunk_hashes": hashes}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return offsets[-1]
+
+
+class SentenceIndex:
+    """Read-only, memory-mapped passage index; safe to share across threads."""
+
+    def __init__(self, path: str):
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No sentence index at {path}")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported sentence index version {meta.get('version')} at {path}")
+        self.embedding_model = meta["embedding_model"]
+        self.embedding_dim = meta["embedding_dim"]
+        self.passage_words = meta.get("passage_words")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.spans = np.load(os.path.join(path, "spans.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.rows = {chunk_id: (int(offsets[i]), int(offsets[i + 1]))
+                     for i, chunk_id in enumerate(meta["chunk_ids"])}
+        self.hashes = dict(zip(meta["chunk_ids"], meta.get("chunk_hashes", [])))  # empty for older indexes
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.rows
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def select_spans(self, query_embedding, chunk_ids, spans_per_chunk: int = SPANS_PER_CHUNK):
+        """
+        Best-matching passages of each chunk for the query, as
+        {chunk_id: [(start, end), ...]} in reading order. Chunks missing from
+        the index are left out (callers fall back to the full text).
+        """
+        ranges = [(chunk_id, *self.rows[chunk_id]) for chunk_id in chunk_ids if chunk_id in self.rows]
+        if not ranges:
+            return {}
+        rows = np.concatenate([np.arange(lo, hi) for _, lo, hi in ranges])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self.vectors[rows] @ (query / max(np.linalg.norm(query), 1e-12))
+
+        selected, start = {}, 0
+        for chunk_id, lo, hi in ranges:
+            chunk_scores = scores[start:start + hi - lo]
+            best = np.argsort(-chunk_scores, kind="stable")[:spans_per_chunk]
+            selected[chunk_id] = [tuple(int(x) for x in self.spans[lo + i]) for i in np.sort(best)]
+            start += hi - lo
+        return selected
+
+    @staticmethod
+    def extract(text: str, spans) -> str:
+        """The selected passages of a chunk, joined in reading order."""
+        return SPAN_SEPARATOR.join(text[start:end] for start, end in spans)
+
+
+def build_for_collection(qdrant_path: str, collection_name: str, embedder) -> dict:
+    """Build (or refresh) the index of a collection from its text store; returns a small report."""
+    from text_store import TextStore, text_store_path
+
+    start = time.perf_counter()
+    store = TextStore(text_store_path(qdrant_path, collection_name))
+    try:
+        path = sentence_index_path(qdrant_path, collection_name)
+        count = build_sentence_index(store, path, embedder)
+    finally:
+        store.close()
+    seconds = time.perf_counter() - start
+    print(f"✅ Sentence index with {count} passages written to {path} in {seconds:.1f}s")
+    return {"passages": count, "chunks": len(store), "seconds": round(seconds, 3)}
+
+
+def main():
+    from collection_registry import default_collection, storage_path, collection_embedder
+    collection = sys.argv[1] if len(sys.argv) > 1 else default_collection()
+    build_for_collection(storage_path(collection), collection, collection_embedder(collection))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+singleflight.py
+Request coalescing: concurrent calls for the same key share one computation.
+
+When a popular question spikes, every identical request would otherwise run
+its own embed → search → LLM call. With `SingleFlight.do(key, fn)` the first
+caller (the leader) runs `fn` and everyone who arrives with the same key while
+it is in flight waits for and receives the leader's result (or exception).
+
+Threads of one process coalesce in memory. With `lock_dir`, worker processes
+(e.g. gunicorn workers) coalesce too: the leader holds an flock on a per-key
+lock file and publishes its result to a small JSON result store next to it;
+processes that block on the lock read that result instead of recomputing.
+Results must be JSON-serializable for the cross-process path. Result files
+and idle lock files older than RESULT_MAX_AGE are pruned.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process coalescing is disabled
+    fcntl = None
+
+RESULT_MAX_AGE = 3600  # seconds before stale result and lock files are pruned
+PRUNE_INTERVAL = 300   # seconds between prune passes
+
+
+def normalize_query(query: str) -> str:
+    """Coalescing key for a user query: case- and whitespace-insensitive."""
+    return " ".join(query.lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: str = None):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"calls": 0, "shared": 0}
+        if lock_dir and fcntl is None:
+            print("⚠️ fcntl is unavailable; coalescing requests within this process only.")
+            lock_dir = None
+        self.lock_dir = lock_dir
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.last_prune = 0.0
+
+    def do(self, key: str, fn):
+        """Run `fn()` once for all concurrent callers with the same key and return its result."""
+        with self.lock:
+            self.stats["calls"] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._across_processes(key, fn) if self.lock_dir else fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    # --- cross-process ---
+    def _paths(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{digest}.lock"), os.path.join(self.lock_dir, f"{digest}.json")
+
+    def _across_processes(self, key, fn):
+        lock_path, result_path = self._paths(key)
+        lock_file, waiting_since = self._lock(lock_path)
+        with lock_file:
+            if waiting_since is not None:
+                # Another process was computing this key: reuse its result
+                found, result = self._read_result(result_path, newer_than=waiting_since)
+                if found:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    with self.lock:
+                        self.stats["shared"] += 1
+                    return result
+                # the other process failed; compute it ourselves while holding the lock
+
+            try:
+                result = fn()
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                self._prune()
+
+    @staticmethod
+    def _lock(lock_path):
+        """
+        Open and lock a key's lock file; returns (file, time we started waiting
+        or None if it was free). A lock file pruned while we waited on it no
+        longer guards the key, so we lock the file now at lock_path instead.
+        """
+        waiting_since = None
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waiting_since = waiting_since or time.time()
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                os.utime(lock_path)  # recently used keys are not pruned
+                return lock_file, waiting_since
+            lock_file.close()
+
+    @staticmethod
+    def _read_result(path, newer_than):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False, None
+        if record["created"] < newer_than:
+            return False, None  # left over from an earlier, unrelated request
+        return True, record["result"]
+
+    def _write_result(self, path, result):
+        fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "result": result}, f)
+        os.replace(tmp_path, path)  # readers never see a partial file
+
+    def _prune(self):
+        """Delete result files nobody can be waiting for any more, and idle lock files of old keys."""
+        now = time.time()
+        if now - self.last_prune < PRUNE_INTERVAL:
+            return
+        self.last_prune = now
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if now - os.path.getmtime(path) <= RESULT_MAX_AGE:
+                    continue
+                if name.endswith(".json"):
+                    os.remove(path)
+                elif name.endswith(".lock"):
+                    self._remove_idle_lock(path)
+            except OSError:
+                pass  # pruned concurrently by another process
+
+    @staticmethod
+    def _remove_idle_lock(path):
+        """Unlink a lock file only while holding it, so no process is computing its key."""
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # in use
+            os.remove(path)
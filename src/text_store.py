@@ -0,0 +1,209 @@
+"""
+text_store.py
+Offset-indexed chunk text store, read through mmap.
+
+Qdrant points only carry small ids and metadata; the chunk text lives here and
+is read for the final top-k hits only.
+
+Layout of a store directory:
+- texts.bin    concatenated blocks of UTF-8 text (zstd-compressed when
+               `zstandard` is installed, raw otherwise)
+- index.jsonl  a header line, then one line per block:
+               {"block": [offset, length], "entries": [[chunk_id, offset_in_block, length], ...]}
+
+Both files are append-only and an index line is written only after its block,
+so an interrupted writer never leaves the store inconsistent.
+"""
+
+import os
+import json
+import mmap
+import shutil
+import threading
+from functools import lru_cache
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+TEXT_STORE_DIR = "text_store"
+DATA_FILE = "texts.bin"
+INDEX_FILE = "index.jsonl"
+BLOCK_SIZE = 64 * 1024  # uncompressed bytes per block
+FORMAT_VERSION = 1
+
+
+def text_store_path(qdrant_path: str, collection_name: str) -> str:
+    """Text store directory that belongs to a collection of the embedded Qdrant at qdrant_path."""
+    return os.path.join(qdrant_path, TEXT_STORE_DIR, collection_name)
+
+
+def _unshare(path):
+    """
+    Give a hard-linked file (e.g. imported from an index snapshot) its own
+    copy, so writing to it never modifies the other links.
+    """
+    if os.path.exists(path) and os.stat(path).st_nlink > 1:
+        tmp_path = path + ".tmp"
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, path)
+
+
+def _read_index(path):
+    """Return (header, [block lines]) ignoring a truncated trailing line."""
+    header, blocks = None, []
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return header, blocks
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if header is None:
+                header = record
+            else:
+                blocks.append(record)
+    return header, blocks
+
+
+class TextStoreWriter:
+    """
+    Appends chunk texts to a store. Call `flush()` to make everything added so
+    far durable (e.g. before checkpointing), and `close()` when done.
+    """
+
+    def __init__(self, path: str, compression: str = "auto", block_size: int = BLOCK_SIZE, append: bool = False):
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "none"
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requested but the 'zstandard' package is not installed")
+
+        os.makedirs(path, exist_ok=True)
+        data_path = os.path.join(path, DATA_FILE)
+        index_path = os.path.join(path, INDEX_FILE)
+        header, blocks = _read_index(path) if append else (None, [])
+        for file_path in (data_path, index_path):
+            if header is not None:
+                _unshare(file_path)
+            elif os.path.exists(file_path):
+                os.remove(file_path)  # a new file rather than truncating one that may be linked
+
+        if header is not None:
+            compression = header["compression"]  # keep the existing store's format
+            end = blocks[-1]["block"][0] + blocks[-1]["block"][1] if blocks else 0
+            self.data = open(data_path, "r+b" if os.path.exists(data_path) else "w+b")
+            self.data.truncate(end)  # drop a block whose index line was never written
+            self.data.seek(end)
+            self.index = open(index_path, "a", encoding="utf-8")
+        else:
+            self.data = open(data_path, "w+b")
+            self.index = open(index_path, "w", encoding="utf-8")
+            self.index.write(json.dumps({"version": FORMAT_VERSION, "compression": compression}) + "\n")
+
+        self.compression = compression
+        self.block_size = block_size
+        self.compressor = zstandard.ZstdCompressor(level=3) if compression == "zstd" else None
+        self.buffer = bytearray()
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def add(self, chunk_id: str, text: str):
+        encoded = text.encode("utf-8")
+        with self.lock:
+            self.entries.append([chunk_id, len(self.buffer), len(encoded)])
+            self.buffer += encoded
+            if len(self.buffer) >= self.block_size:
+                self._write_block()
+
+    def _write_block(self):
+        if not self.entries:
+            return
+        payload = bytes(self.buffer)
+        if self.compressor is not None:
+            payload = self.compressor.compress(payload)
+        offset = self.data.tell()
+        self.data.write(payload)
+        self.data.flush()
+        self.index.write(json.dumps({"block": [offset, len(payload)], "entries": self.entries}) + "\n")
+        self.index.flush()
+        self.buffer = bytearray()
+        self.entries = []
+
+    def flush(self):
+        with self.lock:
+            self._write_block()
+
+    def close(self):
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextStore:
+    """Read-only, memory-mapped view of a store; safe to share across threads."""
+
+    def __init__(self, path: str, cache_blocks: int = 256):
+        header, blocks = _read_index(path)
+        if header is None:
+            raise FileNotFoundError(f"No text store at {path}")
+        self.compression = header["compression"]
+        if self.compression == "zstd" and zstandard is None:
+            raise RuntimeError("This text store is zstd-compressed; install the 'zstandard' package")
+
+        self.blocks = []
+        self.entries = {}
+        for block_no, block in enumerate(blocks):
+            self.blocks.append(tuple(block["block"]))
+            for chunk_id, offset, length in block["entries"]:
+                self.entries[chunk_id] = (block_no, offset, length)
+
+        self.file = open(os.path.join(path, DATA_FILE), "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._block = lru_cache(maxsize=cache_blocks)(self._load_block)
+
+    def _load_block(self, block_no: int) -> bytes:
+        offset, length = self.blocks[block_no]
+        # zstd frames carry their content size, so a fresh decompressor per call is enough
+        return zstandard.ZstdDecompressor().decompress(self.mm[offset:offset + length])
+
+    def get(self, chunk_id: str):
+        """Chunk text, or None if the id is unknown."""
+        entry = self.entries.get(chunk_id)
+        if entry is None:
+            return None
+        block_no, offset, length = entry
+        if self.compression == "zstd":
+            raw = self._block(block_no)
+        else:
+            raw = self.mm
+            offset += self.blocks[block_no][0]
+        return bytes(raw[offset:offset + length]).decode("utf-8")
+
+    def get_many(self, chunk_ids):
+        return {chunk_id: self.get(chunk_id) for chunk_id in chunk_ids}
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def iter_items(self):
+        """Yield (chunk_id, text) for every chunk in the store."""
+        for chunk_id in self.entries:
+            yield chunk_id, self.get(chunk_id)
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
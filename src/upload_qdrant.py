@@ -1,68 +1,196 @@
 """
 upload_to_qdrant.py
 Upload pre-embedded ToSDR documents into an embedded Qdrant instance (no Docker or Cloud needed).
+
+Points only carry the chunk id and source; chunk text goes to the
+memory-mapped text store next to the collection (see text_store.py).
+Canonical chunks from dedup.py also list the near-duplicates they stand for.
+Afterwards the passage index (sentence_index.py) is rebuilt from the text store.
+Collection names, storage folders and per-collection settings (embedder,
+chunker) come from collection_registry.py; the default collection is used
+unless one is named.
 """
 
+import os
 import json
 from tqdm import tqdm
 from qdrant_client import QdrantClient, models
 import uuid
+from chunking import parse_doc_metadata
+from index_metadata import write_index_metadata, read_index_metadata, record_model
+from text_store import TextStoreWriter, text_store_path
+from collection_registry import default_collection, storage_path, get_settings, collection_embedder
+import sentence_index
 
 # Path to your local JSONL with embeddings
 DATA_PATH = "data/processed/tosdr_docs_embedded.jsonl"
-QDRANT_PATH = "data/qdrant_data"  # Folder where Qdrant stores its local DB
-COLLECTION_NAME = "tosdr_docs"
-EMBEDDING_SIZE = 1536  # 1536 for OpenAI's text-embedding-3-small
+CHUNKS_PATH = "data/processed/tosdr_docs_deduped.jsonl"  # source of the chunk text and duplicate lists
+COLLECTION_NAME = default_collection()
+QDRANT_PATH = storage_path(COLLECTION_NAME)  # Folder where Qdrant stores its local DB
+EMBEDDING_SIZE = 1536  # default; the actual size is taken from the embedded records
+
+# Payload indexes used for pre-filtered retrieval (e.g. only Apple's chunks).
+# Embedded Qdrant ignores them; they take effect once the collection is served by a Qdrant server.
+PAYLOAD_INDEXES = {
+    "company": models.PayloadSchemaType.KEYWORD,
+    "doc_type": models.PayloadSchemaType.KEYWORD,
+    "chunk_index": models.PayloadSchemaType.INTEGER,
+}
 
 
 def make_uuid_from_str(s: str) -> str:
     return str(uuid.uuid5(uuid.NAMESPACE_DNS, s))
 
-def main():
+def ensure_collection(client: QdrantClient, recreate: bool = True, dim: int = EMBEDDING_SIZE,
+                      collection_name: str = COLLECTION_NAME):
+    """Create the collection, dropping any existing one when `recreate` is set."""
+    if not recreate and client.collection_exists(collection_name):
+        return
+    client.recreate_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+        optimizers_config={"indexing_threshold": 20000},
+    )
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+        )
+
+def duplicate_payload(info):
+    """
+    Payload fields of a canonical chunk that stands in for near-duplicates
+    (see dedup.py). `company` becomes the list of every company sharing the
+    text, so company-filtered searches still find it.
+    """
+    return {"duplicate_ids": info["duplicate_ids"],
+            "sources": info["sources"],
+            "company": info["companies"]}
+
+def payload_companies(payload):
+    company = payload["company"]
+    return company if isinstance(company, list) else [company]
+
+def build_point(doc, duplicates=None) -> models.PointStruct:
+    """Prepare a Qdrant point from an embedded chunk record."""
+    payload = {"source_id": doc["id"],
+               "source": doc["source"],
+               **parse_doc_metadata(doc["id"])}
+    if duplicates:
+        payload.update(duplicate_payload(duplicates))
+    return models.PointStruct(
+        id=make_uuid_from_str(doc["id"]),
+        vector=doc["embedding"],
+        payload=payload,
+    )
+
+def load_duplicate_info(chunks_path):
+    """Duplicate lists of the canonical chunks in a deduped chunks file."""
+    info = {}
+    if not os.path.exists(chunks_path):
+        return info
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            if chunk.get("duplicate_ids"):
+                info[chunk["id"]] = {key: chunk[key] for key in ("duplicate_ids", "sources", "companies")}
+    return info
+
+def record_index_metadata(qdrant_path, embedding_model, embedding_dim, companies=(), merge=False,
+                          collection_name=COLLECTION_NAME):
+    """
+    Record the model/dimension that built the collection (checked by rag_pipeline
+    at query time), its chunker settings, and the company
+    names the query path can filter on.
+    With `merge`, companies already recorded (e.g. by a resumed run) are kept.
+    """
+    companies = set(companies)
+    if merge:
+        companies |= set(read_index_metadata(qdrant_path).get(collection_name, {}).get("companies", []))
+    settings = get_settings(collection_name)
+    write_index_metadata(
+        qdrant_path, collection_name, embedding_model, embedding_dim,
+        words_per_chunk=settings["words_per_chunk"], overlap=settings["overlap"],
+        companies=sorted(companies),
+    )
+
+def main(data_path=DATA_PATH, qdrant_path=QDRANT_PATH, chunks_path=CHUNKS_PATH, sentences=True,
+         collection_name=COLLECTION_NAME):
+    # The first record decides the embedding model and vector size of the collection
+    with open(data_path, "r", encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    embedding_model, embedding_dim = record_model(first), len(first["embedding"])
+
     # 1️⃣ Start embedded Qdrant (runs inside Python, no Docker)
     print("🚀 Starting embedded Qdrant...")
-    client = QdrantClient(path=QDRANT_PATH)
+    client = QdrantClient(path=qdrant_path)
 
     # 2️⃣ Create or recreate collection
-    print("📁 Creating collection (if not exists)...")
-    client.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(size=EMBEDDING_SIZE, distance=models.Distance.COSINE),
-        optimizers_config={"indexing_threshold": 20000},
-    )
+    print(f"📁 Creating collection for {embedding_model} ({embedding_dim} dims)...")
+    ensure_collection(client, recreate=True, dim=embedding_dim, collection_name=collection_name)
 
     # 3️⃣ Load documents and upload
-    print(f"📤 Uploading embeddings from {DATA_PATH} ...")
+    print(f"📤 Uploading embeddings from {data_path} ...")
 
     batch = []
     batch_size = 100  # adjust if needed
     count = 0
+    uploaded_ids, stored_ids, companies = set(), set(), set()
+    duplicates = load_duplicate_info(chunks_path)
+    texts = TextStoreWriter(text_store_path(qdrant_path, collection_name))
 
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
+    with open(data_path, "r", encoding="utf-8") as f:
         for line in tqdm(f, desc="Processing documents"):
             doc = json.loads(line.strip())
-            # Prepare a point for Qdrant
-            point = models.PointStruct(
-                id=make_uuid_from_str(doc["id"]),
-                vector=doc["embedding"],
-                payload={"source_id": doc["id"],
-                         "source": doc["source"], 
-                         "content": doc["content"]},
-            )
+            if record_model(doc) != embedding_model:
+                raise ValueError(
+                    f"{doc['id']} was embedded with {record_model(doc)}, expected {embedding_model}; "
+                    "re-run embedding_generation with a single model"
+                )
+            point = build_point(doc, duplicates.get(doc["id"]))
             batch.append(point)
+            companies.update(payload_companies(point.payload))
+            uploaded_ids.add(doc["id"])
+            if "content" in doc:
+                # older embedded files still carry the text
+                texts.add(doc["id"], doc["content"])
+                stored_ids.add(doc["id"])
             # Batch insert for efficiency
             if len(batch) >= batch_size:
-                client.upsert(collection_name=COLLECTION_NAME, points=batch)
+                client.upsert(collection_name=collection_name, points=batch)
                 count += len(batch)
                 batch.clear()
 
         # Upload remaining points
         if batch:
-            client.upsert(collection_name=COLLECTION_NAME, points=batch)
+            client.upsert(collection_name=collection_name, points=batch)
             count += len(batch)
 
-    print(f"✅ Successfully uploaded {count} documents to Qdrant collection '{COLLECTION_NAME}'!")
+    # 4️⃣ Store chunk text outside the vector payloads
+    missing_text = uploaded_ids - stored_ids
+    if missing_text:
+        print(f"📝 Writing {len(missing_text)} chunk texts from {chunks_path} ...")
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                if chunk["id"] in missing_text:
+                    texts.add(chunk["id"], chunk["content"])
+    texts.close()
+
     client.close()
+    record_index_metadata(qdrant_path, embedding_model, embedding_dim, companies, collection_name=collection_name)
+    print(f"✅ Successfully uploaded {count} documents to Qdrant collection '{collection_name}'!")
+
+    # 5️⃣ Passage index for span extraction at query time (needs the embedder that built the vectors)
+    if sentences:
+        embedder = collection_embedder(collection_name)
+        if embedder.model_name == embedding_model:
+            sentence_index.build_for_collection(qdrant_path, collection_name, embedder)
+        else:
+            print(f"⚠️ Skipping the sentence index: current embedder is {embedder.model_name}, "
+                  f"vectors are {embedding_model}.")
+    return count
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Offline, self-contained settings for every test (read by the modules at import time)
+os.environ["LLM_PROVIDER"] = "mock"
+os.environ.pop("EMBEDDING_PROVIDER", None)
+for name in ("ROUTING_POLICY", "SMALL_MIN_SCORE"):  # routing defaults
+    os.environ.pop(name, None)
+os.environ["COLLECTIONS_FILE"] = os.path.join(os.path.dirname(__file__), "no_collections.json")  # missing: default collection only
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import api
+import rag_pipeline
+
+CORPUS = [SimpleNamespace(score=round(0.9 - i * 0.01, 4),
+                          payload={"source_id": f"Acme_Terms_chunk{i}", "source": "Acme_Terms.txt", "company": "Acme"})
+          for i in range(25)]
+
+
+class CountingEmbedder:
+    model_name = "fake-embedder"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(("embed_query", [text]))
+        return [1.0, 0.0]
+
+    def embed_queries(self, texts):
+        self.calls.append(("embed_queries", list(texts)))
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    embedder = CountingEmbedder()
+    monkeypatch.setattr(rag_pipeline, "get_embedder", lambda collection=None: embedder)
+    monkeypatch.setattr(rag_pipeline, "retrieve",
+                        lambda query, emb, top_k=3, offset=0, collection=None: CORPUS[offset:offset + top_k])
+    monkeypatch.setattr(rag_pipeline, "answer", lambda query, emb=None, collection=None: {
+        "answer": f"Answer to {query}", "model": "gpt-4o", "early_exit": False, "hits": []})
+    return embedder
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(api.api)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    {"query": "q", "offset": -1},
+    {"query": "q", "offset": "10"},
+    {"query": "q", "limit": 0},
+    {"query": "q", "limit": api.MAX_SEARCH_LIMIT + 1},
+    {"query": "q", "limit": True},
+])
+def test_search_rejects_bad_offset_and_limit(client, embedder, body):
+    response = client.post("/api/search", json=body)
+    assert response.status_code == 400
+    assert "must be an integer" in response.get_json()["error"]
+    assert embedder.calls == []
+
+
+@pytest.mark.parametrize("endpoint", ["/api/search", "/api/answer"])
+@pytest.mark.parametrize("body", [{}, {"query": "   "}, {"query": 3}])
+def test_missing_query(client, embedder, endpoint, body):
+    response = client.post(endpoint, json=body)
+    assert response.status_code == 400
+    assert "'query'" in response.get_json()["error"]
+
+
+def test_non_json_body_and_unknown_collection(client, embedder):
+    assert client.post("/api/answer", data="query=q").status_code == 400
+    response = client.post("/api/search", json={"query": "q", "collection": "nope"})
+    assert response.status_code == 404
+
+
+def test_oversize_batch_is_rejected(client, embedder):
+    queries = [f"question {i}" for i in range(api.MAX_BATCH_QUERIES + 1)]
+    response = client.post("/api/batch", json={"queries": queries})
+    assert response.status_code == 413
+    assert embedder.calls == []
+
+
+def test_search_pagination(client, embedder):
+    seen, offset = [], 0
+    while offset is not None:
+        page = client.post("/api/search", json={"query": "Does Acme sell my data?", "limit": 10, "offset": offset}).get_json()
+        assert page["offset"] == offset
+        seen += [result["chunk_id"] for result in page["results"]]
+        offset = page["next_offset"]
+    assert seen == [hit.payload["source_id"] for hit in CORPUS]
+    assert {"embed", "search", "fetch", "total"} <= set(page["timings_ms"])
+
+
+def test_answer(client, embedder):
+    response = client.post("/api/answer", json={"query": "Does Acme sell my data?"})
+    assert response.status_code == 200
+    assert response.get_json()["answer"] == "Answer to Does Acme sell my data?"
+
+
+@pytest.mark.parametrize("mode", ["answer", "search"])
+def test_batch_embeds_distinct_queries_in_one_call(client, embedder, mode):
+    queries = ["Does Acme sell my data?", "Can I delete my account?", "does acme  sell my data?"]
+    response = client.post("/api/batch", json={"queries": queries, "mode": mode, "limit": 2})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert embedder.calls == [("embed_queries", queries[:2])]
+    assert (data["count"], data["unique"]) == (3, 2)
+    assert [result["query"] for result in data["results"]] == queries
+    if mode == "search":
+        assert all(len(result["results"]) == 2 for result in data["results"])
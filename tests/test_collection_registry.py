@@ -0,0 +1,130 @@
+import json
+import threading
+
+import pytest
+
+import collection_registry
+from collection_registry import CollectionHandle, CollectionRegistry
+
+MB = 2 ** 20
+SIZES_MB = {"tosdr_docs": 4, "acme": 3, "globex": 2}
+
+
+class FakeHandle:
+    """Stands in for CollectionHandle (no Qdrant): a size, a user count and close()."""
+
+    opened = []
+
+    def __init__(self, name):
+        self.name = name
+        self.memory_bytes = SIZES_MB[name] * MB
+        self.points = 0
+        self.users = 0
+        self.retired = False
+        self.closed = threading.Event()
+        FakeHandle.opened.append(self)
+
+    def close(self):
+        assert not self.closed.is_set(), "closed twice"
+        self.closed.set()
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    config = tmp_path / "collections.json"
+    config.write_text(json.dumps({"collections": {name: {} for name in SIZES_MB}}))
+    monkeypatch.setattr(collection_registry, "COLLECTIONS_FILE", str(config))
+    monkeypatch.setattr(collection_registry, "CollectionHandle", FakeHandle)
+    FakeHandle.opened = []
+    collection_registry.load_config.cache_clear()
+    yield CollectionRegistry(memory_budget_mb=7)
+    collection_registry.load_config.cache_clear()
+
+
+def use(registry, *names):
+    for name in names:
+        with registry.acquire(name):
+            pass
+
+
+def test_least_recently_used_is_unloaded_first(registry):
+    use(registry, "tosdr_docs", "acme", "tosdr_docs", "globex")  # 4 + 3 + 2 MB > 7 MB
+
+    assert list(registry.handles) == ["tosdr_docs", "globex"]
+    acme = FakeHandle.opened[1]
+    assert acme.name == "acme" and acme.closed.is_set()
+    assert registry.counts == {"loads": 3, "hits": 1, "unloads": 1}
+
+
+def test_budget_accounting(registry):
+    use(registry, "acme", "globex")
+    stats = registry.stats()
+    assert stats["loaded"].keys() == {"acme", "globex"}
+    assert (stats["memory_mb"], stats["budget_mb"]) == (5, 7)
+
+    use(registry, "tosdr_docs")  # 9 MB: unload until the rest fits
+    assert registry.stats()["memory_mb"] == 6
+    assert list(registry.handles) == ["globex", "tosdr_docs"]
+
+
+def test_newest_handle_stays_even_over_budget(registry):
+    registry.memory_budget_mb = 1
+    use(registry, "acme", "tosdr_docs")
+    assert list(registry.handles) == ["tosdr_docs"]
+
+
+def test_handle_unloaded_while_in_use_closes_on_release(registry):
+    with registry.acquire("tosdr_docs") as handle:
+        use(registry, "acme", "globex")
+        assert handle.retired and not handle.closed.is_set()
+        assert registry.retired == {"tosdr_docs": handle}
+    assert handle.closed.is_set()
+    assert registry.retired == {}
+
+    use(registry, "tosdr_docs")  # reopened with a fresh handle
+    assert registry.handles["tosdr_docs"] is not handle
+
+
+def test_reacquiring_an_unloaded_collection_on_the_same_thread_fails_fast(registry):
+    with registry.acquire("tosdr_docs") as handle:
+        use(registry, "acme", "globex")
+        with pytest.raises(RuntimeError, match="tosdr_docs"):
+            use(registry, "tosdr_docs")
+        assert not handle.closed.is_set()
+    assert handle.closed.is_set()
+
+
+def test_other_threads_wait_for_the_unloaded_handle_to_close(registry):
+    with registry.acquire("tosdr_docs") as handle:
+        use(registry, "acme", "globex")
+        other = threading.Thread(target=use, args=(registry, "tosdr_docs"))
+        other.start()
+        other.join(0.2)
+        assert other.is_alive()  # embedded Qdrant allows one client per folder
+    other.join(5)
+    assert not other.is_alive() and handle.closed.is_set()
+
+
+def test_close_all_keeps_handles_in_use_open(registry):
+    with registry.acquire("acme") as busy:
+        use(registry, "globex")
+        registry.close_all()
+        assert registry.handles == {} and not busy.closed.is_set()
+    assert all(handle.closed.is_set() for handle in FakeHandle.opened)
+
+
+def test_mapped_bytes_counts_text_store_and_loaded_sentence_index(tmp_path):
+    text_store = tmp_path / "text_store" / "acme"
+    index = tmp_path / "sentence_index" / "acme"
+    for directory, size in ((text_store, 1000), (index, 300)):
+        directory.mkdir(parents=True)
+        (directory / "data.bin").write_bytes(b"x" * size)
+        (directory / "meta.json").write_bytes(b"{}")
+
+    handle = CollectionHandle.__new__(CollectionHandle)  # only the fields _mapped_bytes reads
+    handle.name, handle.path = "acme", str(tmp_path)
+    handle.sentence_index = None
+    assert handle._mapped_bytes(str(text_store)) == 1002
+
+    handle.sentence_index = object()
+    assert handle._mapped_bytes(str(text_store)) == 1002 + 302
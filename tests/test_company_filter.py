@@ -0,0 +1,19 @@
+from company_filter import build_company_aliases, detect_companies
+
+# Service names as they appear in ToS;DR document ids (e.g. "WhatsApp_PrivacyPolicy")
+COMPANIES = ["YouTube", "DataCamp", "AllTrails", "NewYorkTimes", "WhatsApp", "Google",
+             "MicrosoftServices", "Apple", "Fitbit", "AmazonWebServices"]
+ALIASES = build_company_aliases(COMPANIES)
+
+
+def test_common_words_do_not_select_companies():
+    assert detect_companies("Can you delete my data?", ALIASES) == []
+    assert detect_companies("What is new in all of the terms?", ALIASES) == []
+    assert detect_companies("What data does Google collect?", ALIASES) == ["Google"]
+
+
+def test_full_names_match_in_any_spelling():
+    assert detect_companies("Does WhatsApp share my number?", ALIASES) == ["WhatsApp"]
+    assert detect_companies("Does the New York Times sell my data?", ALIASES) == ["NewYorkTimes"]
+    assert detect_companies("microsoft services account deletion", ALIASES) == ["MicrosoftServices"]
+    assert detect_companies("Do Apple and Fitbit track location?", ALIASES) == ["Apple", "Fitbit"]
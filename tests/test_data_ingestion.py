@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import data_ingestion
+from data_ingestion import download_tosdr_dataset, file_sha256, object_path, read_manifest
+
+FILES = {
+    "tosdr/Acme_Terms.txt": "Acme may share your data with advertising partners.\n",
+    "tosdr/Globex_Privacy.txt": "Globex deletes your account data within 30 days.\n",
+}
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    mirror = tmp_path / "mirror"
+    for rel, text in FILES.items():
+        (mirror / rel).parent.mkdir(parents=True, exist_ok=True)
+        (mirror / rel).write_text(text)
+    return mirror, tmp_path / "raw", tmp_path / "cache"
+
+
+def sync(dirs, target=None, verify=False):
+    mirror, raw, cache = dirs
+    return download_tosdr_dataset(target or raw, mirror_dir=mirror, cache_dir=cache, verify=verify, workers=2)
+
+
+def overwrite_in_place(path, text):
+    """Change a file's content but keep its size and mtime, as silent corruption would."""
+    stat = path.stat()
+    path.chmod(0o644)
+    with open(path, "r+", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_files_are_hard_links_to_checksummed_cache_objects(dirs):
+    mirror, raw, cache = dirs
+    sync(dirs)
+
+    manifest = read_manifest(raw)
+    assert sorted(manifest) == sorted(FILES)
+    for rel in FILES:
+        sha256 = manifest[rel]["sha256"]
+        assert sha256 == file_sha256(mirror / rel)
+        assert os.path.samefile(raw / rel, object_path(sha256, cache))
+
+
+def test_second_target_reuses_the_cached_blob(dirs, tmp_path, monkeypatch):
+    sync(dirs)
+    place = data_ingestion.place
+
+    def link_only(src, dst, link=True):
+        assert link, "the cache already holds every blob; nothing should be copied into it"
+        return place(src, dst, link)
+    monkeypatch.setattr(data_ingestion, "place", link_only)
+    other = tmp_path / "other_raw"
+    sync(dirs, target=other)
+
+    for rel, entry in read_manifest(other).items():
+        obj = object_path(entry["sha256"], dirs[2])
+        assert os.path.samefile(other / rel, obj)
+        assert obj.stat().st_nlink == 3  # cache, raw and other_raw share one inode
+
+
+def test_populated_target_is_not_fetched_again(dirs, monkeypatch):
+    sync(dirs)
+    monkeypatch.setattr(data_ingestion, "fetch_source", lambda mirror_dir=None: pytest.fail("fetched again"))
+    sync(dirs)
+
+
+def test_verify_detects_a_corrupted_file_that_size_and_mtime_miss(dirs):
+    mirror, raw, cache = dirs
+    sync(dirs)
+    rel = "tosdr/Acme_Terms.txt"
+    overwrite_in_place(raw / rel, "X" * len(FILES[rel]))
+
+    sync(dirs)  # size and mtime still match: trusted
+    assert (raw / rel).read_text() != FILES[rel]
+
+    sync(dirs, verify=True)
+    assert (raw / rel).read_text() == FILES[rel]
+    assert file_sha256(raw / rel) == read_manifest(raw)[rel]["sha256"]
+
+
+def test_corrupted_cache_entry_is_replaced_not_linked(dirs):
+    mirror, raw, cache = dirs
+    sync(dirs)
+    rel = "tosdr/Globex_Privacy.txt"
+    sha256 = read_manifest(raw)[rel]["sha256"]
+    os.unlink(raw / rel)
+    overwrite_in_place(object_path(sha256, cache), "X" * len(FILES[rel]))
+
+    sync(dirs)
+
+    assert (raw / rel).read_text() == FILES[rel]
+    assert file_sha256(object_path(sha256, cache)) == sha256
+    assert os.path.samefile(raw / rel, object_path(sha256, cache))
@@ -0,0 +1,93 @@
+import json
+import random
+
+from dedup import Deduplicator, dedup_chunks
+
+VOCABULARY = ("we may collect share store delete your personal data information cookies partners "
+              "advertising services account terms policy third parties consent law request device "
+              "location usage content rights arbitration notice changes").split()
+
+
+def policy_text(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def near_copy(text, changes=2, seed=0):
+    rng = random.Random(seed)
+    words = text.split()
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = "modified"
+    return " ".join(words)
+
+
+def chunk(chunk_id, text):
+    return {"id": chunk_id, "source": chunk_id.rsplit("_chunk", 1)[0] + ".txt", "content": text}
+
+
+def corpus():
+    boilerplate, other = policy_text(1), policy_text(2)
+    return [
+        chunk("Acme_PrivacyPolicy_chunk1", boilerplate),
+        chunk("Globex_PrivacyPolicy_chunk1", other),
+        chunk("AcmeMusic_PrivacyPolicy_chunk1", near_copy(boilerplate, seed=1)),
+        chunk("Initech_Terms_chunk1", policy_text(3)),
+        chunk("AcmeVideo_PrivacyPolicy_chunk1", near_copy(boilerplate, seed=2)),
+        chunk("Globex_Terms_chunk1", near_copy(other, seed=3)),
+    ]
+
+
+def test_near_duplicates_are_merged_and_distinct_chunks_kept():
+    deduper = Deduplicator()
+    decisions = {c["id"]: deduper.check(c) for c in corpus()}
+
+    assert decisions == {
+        "Acme_PrivacyPolicy_chunk1": None,
+        "Globex_PrivacyPolicy_chunk1": None,
+        "AcmeMusic_PrivacyPolicy_chunk1": "Acme_PrivacyPolicy_chunk1",
+        "Initech_Terms_chunk1": None,
+        "AcmeVideo_PrivacyPolicy_chunk1": "Acme_PrivacyPolicy_chunk1",
+        "Globex_Terms_chunk1": "Globex_PrivacyPolicy_chunk1",
+    }
+    info = deduper.duplicate_info("Acme_PrivacyPolicy_chunk1")
+    assert info["duplicate_ids"] == ["AcmeMusic_PrivacyPolicy_chunk1", "AcmeVideo_PrivacyPolicy_chunk1"]
+    assert info["companies"] == ["Acme", "AcmeMusic", "AcmeVideo"]
+    assert deduper.duplicate_info("Initech_Terms_chunk1") is None
+    assert deduper.report()["duplicates"] == 3
+
+
+def test_chunks_below_the_threshold_are_kept():
+    deduper = Deduplicator()
+    text = policy_text(4)
+    assert deduper.check(chunk("A_Terms_chunk1", text)) is None
+    assert deduper.check(chunk("B_Terms_chunk1", near_copy(text, changes=40, seed=4))) is None
+
+
+def test_replaying_state_matches_a_fresh_run(tmp_path):
+    chunks = corpus()
+    fresh = Deduplicator()
+    for c in chunks:
+        fresh.check(c)
+
+    # An interrupted run: the first half is decided, then ingestion restarts from the state file
+    state = str(tmp_path / "dedup_state.jsonl")
+    first = Deduplicator(state_path=state)
+    for c in chunks[:3]:
+        first.check(c)
+    resumed = Deduplicator(state_path=state)
+    for c in chunks:  # the resumed run sees every chunk again
+        resumed.check(c)
+
+    for canonical in ("Acme_PrivacyPolicy_chunk1", "Globex_PrivacyPolicy_chunk1", "Initech_Terms_chunk1"):
+        assert resumed.duplicate_info(canonical) == fresh.duplicate_info(canonical)
+    assert resumed.canonical_of == fresh.canonical_of
+
+
+def test_dedup_chunks_writes_canonical_records(tmp_path):
+    chunked, deduped, report = tmp_path / "chunked.jsonl", tmp_path / "deduped.jsonl", tmp_path / "report.json"
+    chunked.write_text("".join(json.dumps(c) + "\n" for c in corpus()), encoding="utf-8")
+
+    assert dedup_chunks(str(chunked), str(deduped), str(report)) == 3
+    records = [json.loads(line) for line in deduped.read_text(encoding="utf-8").splitlines()]
+    assert [r["id"] for r in records] == ["Acme_PrivacyPolicy_chunk1", "Globex_PrivacyPolicy_chunk1", "Initech_Terms_chunk1"]
+    assert records[0]["duplicate_ids"] == ["AcmeMusic_PrivacyPolicy_chunk1", "AcmeVideo_PrivacyPolicy_chunk1"]
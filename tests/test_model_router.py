@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+
+import model_router
+
+
+class FakeClient:
+    """Chat client returning a fixed answer and usage, shaped like the openai SDK."""
+
+    def __init__(self, usage, answer="Yes, the service shares your data with advertising partners."):
+        response = SimpleNamespace(
+            usage=usage,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer), finish_reason="stop")],
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response))
+
+
+def test_cached_tokens_from_untyped_usage_details():
+    # openai==1.39 keeps prompt_tokens_details as an untyped extra, i.e. a dict
+    usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=50,
+                            prompt_tokens_details={"cached_tokens": 1024})
+    result = model_router._complete(FakeClient(usage), "gpt-4o", [{"role": "user", "content": "q"}])
+
+    assert result["cached_tokens"] == 1024
+    assert result["cost_usd"] == model_router.completion_cost("gpt-4o", 1200, 50, cached_tokens=1024)
+    assert result["cost_usd"] < model_router.completion_cost("gpt-4o", 1200, 50)
+
+
+def test_cached_tokens_from_typed_or_missing_details():
+    typed = SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=256))
+    assert model_router.cached_prompt_tokens(typed) == 256
+    assert model_router.cached_prompt_tokens(SimpleNamespace(prompt_tokens_details=None)) == 0
+    assert model_router.cached_prompt_tokens(SimpleNamespace(prompt_tokens_details={"cached_tokens": None})) == 0
+    assert model_router.cached_prompt_tokens(None) == 0
+
+
+class ScriptedClient:
+    """Chat client answering each call from a list of (answer, finish_reason), recording the models asked."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages):
+        self.models.append(model)
+        answer, finish_reason = self.replies.pop(0)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_tokens_details=None)
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=SimpleNamespace(content=answer),
+                                                                     finish_reason=finish_reason)])
+
+
+GOOD_ANSWER = "Yes, Acme may share your email address with its advertising partners (Acme Terms)."
+MESSAGES = [{"role": "system", "content": "Answer from the context."}, {"role": "user", "content": "Context ..."}]
+
+
+def hits(score):
+    return [SimpleNamespace(score=score)]
+
+
+def test_default_policy_keeps_the_large_model():
+    assert model_router.ROUTING_POLICY == "large"
+    model, reason = model_router.choose_model("Does Acme sell my data?", hits(0.9), MESSAGES)
+    assert (model, reason) == (model_router.LARGE_MODEL, "policy")
+
+
+def test_tiered_routing_signals(monkeypatch):
+    def choose(query, top_score=0.9, messages=MESSAGES):
+        return model_router.choose_model(query, hits(top_score), messages, policy="tiered")
+
+    assert choose("Does Acme sell my data?") == (model_router.SMALL_MODEL, "simple")
+    assert choose(" ".join(["word"] * 21)) == (model_router.LARGE_MODEL, "long query")
+    assert choose("Compare Acme and Globex on data retention") == (model_router.LARGE_MODEL, "comparative query")
+    big = [{"role": "user", "content": "x" * 4 * (model_router.MAX_SMALL_CONTEXT_TOKENS + 1)}]
+    assert choose("Does Acme sell my data?", messages=big) == (model_router.LARGE_MODEL, "large context")
+
+    # retrieval confidence only routes once a threshold is configured
+    assert choose("Does Acme sell my data?", top_score=0.1) == (model_router.SMALL_MODEL, "simple")
+    monkeypatch.setattr(model_router, "SMALL_MIN_SCORE", 0.5)
+    assert choose("Does Acme sell my data?", top_score=0.1) == (model_router.LARGE_MODEL, "low retrieval confidence")
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError, match="cheapest"):
+        model_router.choose_model("q", [], MESSAGES, policy="cheapest")
+
+
+def test_needs_escalation():
+    assert not model_router.needs_escalation(GOOD_ANSWER, "stop")
+    assert model_router.needs_escalation(GOOD_ANSWER, "length")
+    assert model_router.needs_escalation(GOOD_ANSWER, "content_filter")
+    assert model_router.needs_escalation("Yes.", "stop")
+    assert model_router.needs_escalation(None, "stop")
+    assert model_router.needs_escalation("I'm not sure whether the terms allow this, the context is unclear.", "stop")
+
+
+def test_small_answer_is_kept_when_it_passes_the_check():
+    client = ScriptedClient((GOOD_ANSWER, "stop"))
+    result = model_router.route_completion(client, MESSAGES, "Does Acme sell my data?", hits(0.9),
+                                           policy="tiered", fallback=True)
+
+    assert client.models == [model_router.SMALL_MODEL]
+    assert (result["route"], result["answer"]) == ("small", GOOD_ANSWER)
+
+
+def test_failed_small_answer_is_escalated_with_summed_usage():
+    client = ScriptedClient(("I don't know.", "stop"), (GOOD_ANSWER, "stop"))
+    result = model_router.route_completion(client, MESSAGES, "Does Acme sell my data?", hits(0.9),
+                                           policy="tiered", fallback=True)
+
+    assert client.models == [model_router.SMALL_MODEL, model_router.LARGE_MODEL]
+    assert result["route"] == "escalated" and result["model"] == model_router.LARGE_MODEL
+    assert result["answer"] == GOOD_ANSWER and result["reason"] == "simple; escalated"
+    assert (result["prompt_tokens"], result["completion_tokens"]) == (200, 40)
+
+
+def test_no_escalation_without_fallback():
+    client = ScriptedClient(("I don't know.", "stop"))
+    result = model_router.route_completion(client, MESSAGES, "Does Acme sell my data?", hits(0.9),
+                                           policy="tiered", fallback=False)
+
+    assert client.models == [model_router.SMALL_MODEL]
+    assert result["route"] == "small"
@@ -0,0 +1,91 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import rag_pipeline
+from rag_pipeline import NO_RELEVANT_ANSWER, TOP_K, select_hits
+
+THRESHOLDS = {"min_score": 0.3, "min_confidence": 0.5, "score_gap": 0.1, "max_k": 5}
+
+
+def hits(*scores):
+    return [SimpleNamespace(score=score, payload={"source_id": f"Acme_Terms_chunk{i}", "source": "Acme_Terms.txt"})
+            for i, score in enumerate(scores, 1)]
+
+
+def scores(selected):
+    return [hit.score for hit in selected]
+
+
+@pytest.fixture
+def untuned(tmp_path, monkeypatch):
+    """Thresholds as a fresh deployment sees them: no tuned file, no overrides."""
+    monkeypatch.setattr(rag_pipeline, "SCORE_THRESHOLDS_FILE", str(tmp_path / "missing.json"))
+    for key in rag_pipeline.DEFAULT_THRESHOLDS:
+        monkeypatch.delenv(key.upper(), raising=False)
+    rag_pipeline._score_thresholds.cache_clear()
+    yield
+    rag_pipeline._score_thresholds.cache_clear()
+
+
+def test_stops_at_the_first_large_score_gap():
+    assert scores(select_hits(hits(0.82, 0.80, 0.78, 0.60, 0.59), THRESHOLDS)) == [0.82, 0.80, 0.78]
+
+
+def test_drops_hits_below_min_score():
+    assert scores(select_hits(hits(0.55, 0.50, 0.45, 0.29), {**THRESHOLDS, "score_gap": 1.0})) == [0.55, 0.50, 0.45]
+
+
+def test_keeps_at_most_max_k():
+    assert len(select_hits(hits(0.9, 0.9, 0.9, 0.9, 0.9, 0.9, 0.9), THRESHOLDS)) == 5
+
+
+def test_low_confidence_selects_nothing():
+    assert select_hits(hits(0.49, 0.48), THRESHOLDS) == []
+    assert select_hits([], THRESHOLDS) == []
+
+
+def test_untuned_defaults_keep_the_fixed_k_baseline(untuned):
+    thresholds = rag_pipeline.get_score_thresholds()
+    assert thresholds["max_k"] == TOP_K
+    assert thresholds["min_score"] == thresholds["min_confidence"] == 0.0
+    # close scores: exactly TOP_K hits, as with the old fixed-k retrieval
+    assert len(select_hits(hits(0.5, 0.49, 0.48, 0.47, 0.46, 0.45), thresholds)) == TOP_K
+
+
+def test_tuned_file_and_environment_override_the_defaults(untuned, tmp_path, monkeypatch):
+    model = rag_pipeline.get_embedder().model_name
+    tuned = tmp_path / "tuned.json"
+    tuned.write_text(json.dumps({"embedding_model": model, "max_k": 8, "min_confidence": 0.4}))
+    monkeypatch.setattr(rag_pipeline, "SCORE_THRESHOLDS_FILE", str(tuned))
+    monkeypatch.setenv("SCORE_GAP", "0.05")
+
+    thresholds = rag_pipeline.get_score_thresholds()
+    assert (thresholds["max_k"], thresholds["min_confidence"], thresholds["score_gap"]) == (8, 0.4, 0.05)
+
+
+def test_thresholds_tuned_for_another_model_are_ignored(untuned, tmp_path, monkeypatch):
+    tuned = tmp_path / "tuned.json"
+    tuned.write_text(json.dumps({"embedding_model": "some-other-model", "max_k": 8}))
+    monkeypatch.setattr(rag_pipeline, "SCORE_THRESHOLDS_FILE", str(tuned))
+    assert rag_pipeline.get_score_thresholds()["max_k"] == TOP_K
+
+
+def test_answer_exits_early_without_calling_the_llm(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "get_score_thresholds", lambda collection=None: THRESHOLDS)
+    monkeypatch.setattr(rag_pipeline, "retrieve", lambda *args, **kwargs: hits(0.31, 0.30))
+
+    def no_llm(*args, **kwargs):
+        raise AssertionError("the LLM must not be called for a low-confidence retrieval")
+    monkeypatch.setattr(rag_pipeline, "route_completion", no_llm)
+    monkeypatch.setattr(rag_pipeline, "build_prompt", no_llm)
+    before = rag_pipeline.get_query_stats()
+
+    result = rag_pipeline.answer("What does Acme do with my data?")
+
+    assert result["answer"] == NO_RELEVANT_ANSWER
+    assert result["early_exit"] and result["hits"] == [] and result["model"] is None
+    after = rag_pipeline.get_query_stats()
+    assert after["early_exits"] == before["early_exits"] + 1
+    assert after["llm_calls"] == before["llm_calls"]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from providers import get_embedder
+from sentence_index import SentenceIndex, build_sentence_index
+from text_store import TextStore, TextStoreWriter
+
+LONG_TEXT = " ".join(f"Sentence number {i} says we may share your data with partners." for i in range(30))
+
+
+def write_store(path, chunks, append=False):
+    with TextStoreWriter(str(path), append=append) as writer:
+        for chunk_id, text in chunks.items():
+            writer.add(chunk_id, text)
+    return TextStore(str(path))
+
+
+def build(tmp_path, chunks, append=False):
+    store = write_store(tmp_path / "store", chunks, append=append)
+    try:
+        build_sentence_index(store, str(tmp_path / "index"), get_embedder("mock"))
+    finally:
+        store.close()
+    return SentenceIndex(str(tmp_path / "index"))
+
+
+def test_rebuild_over_changed_text_re_embeds_the_chunk(tmp_path, capsys):
+    build(tmp_path, {"Acme_Terms_chunk1": LONG_TEXT})
+    changed = "We sell your data."  # same chunk id, new text (e.g. re-ingestion with another chunker)
+    index = build(tmp_path, {"Acme_Terms_chunk1": changed})
+
+    assert "1 new passages to embed, 0 chunks reused" in capsys.readouterr().out
+    lo, hi = index.rows["Acme_Terms_chunk1"]
+    assert [tuple(span) for span in index.spans[lo:hi]] == [(0, len(changed))]
+    query = get_embedder("mock").embed_query("sell data")
+    assert index.select_spans(query, ["Acme_Terms_chunk1"]) == {"Acme_Terms_chunk1": [(0, len(changed))]}
+
+
+def test_unchanged_chunks_are_reused(tmp_path, capsys):
+    first = build(tmp_path, {"Acme_Terms_chunk1": LONG_TEXT})
+    vectors = np.array(first.vectors)
+    del first
+    index = build(tmp_path, {"Acme_Terms_chunk2": "Arbitration applies."}, append=True)
+
+    assert "1 chunks reused" in capsys.readouterr().out.splitlines()[-1]
+    lo, hi = index.rows["Acme_Terms_chunk1"]
+    assert np.array_equal(index.vectors[lo:hi], vectors)
+    assert index.rows["Acme_Terms_chunk2"][1] == len(index)
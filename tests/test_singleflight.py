@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight, normalize_query
+
+fcntl = pytest.importorskip("fcntl")  # cross-process coalescing needs flock
+
+
+def run_concurrently(n, target):
+    """Start n threads on target(i) together; return their results in order."""
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def slow_call(counter, value="answer", delay=0.2):
+    def fn():
+        with counter["lock"]:
+            counter["calls"] += 1
+        time.sleep(delay)
+        return value
+    return fn
+
+
+def new_counter():
+    return {"calls": 0, "lock": threading.Lock()}
+
+
+def test_normalize_query():
+    assert normalize_query("  Does Google   SELL my data? ") == "does google sell my data?"
+
+
+def test_concurrent_callers_share_one_call():
+    flight, counter = SingleFlight(), new_counter()
+    results = run_concurrently(8, lambda i: flight.do("same", slow_call(counter)))
+
+    assert results == ["answer"] * 8
+    assert counter["calls"] == 1
+    assert flight.stats == {"calls": 8, "shared": 7}
+
+
+def test_different_keys_do_not_coalesce():
+    flight, counter = SingleFlight(), new_counter()
+    results = run_concurrently(4, lambda i: flight.do(f"key{i}", slow_call(counter, value=i, delay=0.05)))
+
+    assert results == [0, 1, 2, 3]
+    assert counter["calls"] == 4
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError("LLM timeout")
+
+    results = run_concurrently(5, lambda i: flight.do("same", failing))
+    assert all(isinstance(r, RuntimeError) and str(r) == "LLM timeout" for r in results)
+    assert flight.do("same", lambda: "recovered") == "recovered"
+
+
+def test_flights_with_a_lock_dir_share_results_across_instances(tmp_path):
+    # One SingleFlight per worker process; separate instances only share the lock directory
+    flights, counter = [SingleFlight(lock_dir=str(tmp_path)) for _ in range(4)], new_counter()
+    results = run_concurrently(4, lambda i: flights[i].do("same", slow_call(counter, value={"answer": "shared"})))
+
+    assert results == [{"answer": "shared"}] * 4
+    assert counter["calls"] == 1
+    assert sum(flight.stats["shared"] for flight in flights) == 3
+
+
+def test_cross_process_waiter_recomputes_when_the_leader_fails(tmp_path):
+    flights, counter = [SingleFlight(lock_dir=str(tmp_path)) for _ in range(2)], new_counter()
+
+    def call(i):
+        if i == 0:
+            def failing():
+                time.sleep(0.2)
+                raise RuntimeError("leader failed")
+            return flights[0].do("same", failing)
+        time.sleep(0.05)  # let the leader take the lock first
+        return flights[1].do("same", slow_call(counter, delay=0))
+
+    results = run_concurrently(2, call)
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == "answer"
+    assert counter["calls"] == 1
+
+
+def test_stale_results_are_not_reused(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    assert flight.do("same", lambda: "first") == "first"
+    assert flight.do("same", lambda: "second") == "second"  # nobody was waiting: recompute
+
+
+def test_prune_removes_idle_lock_and_old_result_files(tmp_path, monkeypatch):
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    for i in range(3):
+        flight.do(f"query {i}", lambda: "answer")
+    assert len(os.listdir(tmp_path)) == 6  # a .lock and a .json per key
+
+    held_path = tmp_path / "held.lock"
+    held = open(held_path, "a")
+    fcntl.flock(held.fileno(), fcntl.LOCK_EX)  # a key some process is computing right now
+    old = time.time() - 2 * singleflight.RESULT_MAX_AGE
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (old, old))
+
+    monkeypatch.setattr(singleflight, "PRUNE_INTERVAL", 0)
+    flight.last_prune = 0
+    flight._prune()
+
+    assert os.listdir(tmp_path) == ["held.lock"]
+    held.close()
+
+
+def test_lock_pruned_while_waiting_is_relocked(tmp_path):
+    lock_path = str(tmp_path / "key.lock")
+    holder = open(lock_path, "a")
+    fcntl.flock(holder.fileno(), fcntl.LOCK_EX)
+    locked = {}
+
+    def waiter():
+        lock_file, waiting_since = SingleFlight._lock(lock_path)
+        locked.update(file=lock_file, waited=waiting_since is not None)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.1)
+    os.remove(lock_path)  # pruned by another process
+    fcntl.flock(holder.fileno(), fcntl.LOCK_UN)
+    thread.join(timeout=5)
+
+    assert locked["waited"]
+    assert os.fstat(locked["file"].fileno()).st_ino == os.stat(lock_path).st_ino
+    locked["file"].close()
+    holder.close()
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import pytest
+
+from text_store import DATA_FILE, INDEX_FILE, TextStore, TextStoreWriter, zstandard
+
+COMPRESSIONS = ["none", pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard not installed"))]
+CHUNKS = {f"Service{i}_PrivacyPolicy_chunk{i}": f"Chunk {i}: données personnelles — {'x' * (i * 37)}" for i in range(40)}
+
+
+def write(path, chunks, **kwargs):
+    with TextStoreWriter(str(path), **kwargs) as writer:
+        for chunk_id, text in chunks.items():
+            writer.add(chunk_id, text)
+
+
+def read_all(path):
+    store = TextStore(str(path))
+    try:
+        return dict(store.iter_items())
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_round_trip_across_blocks(tmp_path, compression):
+    write(tmp_path, CHUNKS, compression=compression, block_size=256)  # many small blocks
+
+    store = TextStore(str(tmp_path))
+    try:
+        assert store.compression == compression
+        assert len(store) == len(CHUNKS)
+        assert store.get("Service7_PrivacyPolicy_chunk7") == CHUNKS["Service7_PrivacyPolicy_chunk7"]
+        assert store.get("unknown") is None
+        assert dict(store.iter_items()) == CHUNKS
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_append_keeps_existing_chunks_and_format(tmp_path, compression):
+    first = dict(list(CHUNKS.items())[:25])
+    rest = dict(list(CHUNKS.items())[25:])
+    write(tmp_path, first, compression=compression, block_size=256)
+    write(tmp_path, rest, compression="auto", append=True, block_size=256)
+
+    assert read_all(tmp_path) == CHUNKS
+    store = TextStore(str(tmp_path))
+    assert store.compression == compression
+    store.close()
+
+
+def test_reopening_without_append_starts_a_new_store(tmp_path):
+    write(tmp_path, CHUNKS)
+    write(tmp_path, {"Only_Terms_chunk1": "fresh"})
+    assert read_all(tmp_path) == {"Only_Terms_chunk1": "fresh"}
+
+
+def test_append_drops_a_block_without_index_line(tmp_path):
+    write(tmp_path, dict(list(CHUNKS.items())[:5]), compression="none")
+    with open(tmp_path / DATA_FILE, "ab") as f:
+        f.write(b"partial block of an interrupted writer")
+    write(tmp_path, {"Late_Terms_chunk1": "after the crash"}, append=True)
+
+    assert read_all(tmp_path) == {**dict(list(CHUNKS.items())[:5]), "Late_Terms_chunk1": "after the crash"}
+
+
+@pytest.mark.parametrize("append", [True, False])
+def test_writing_to_a_hardlinked_store_leaves_the_source_untouched(tmp_path, append):
+    snapshot, live = tmp_path / "snapshot", tmp_path / "live"
+    write(snapshot, CHUNKS, block_size=256)
+    shutil.copytree(snapshot, live, copy_function=os.link)  # as index_snapshot imports it
+    before = {name: (snapshot / name).read_bytes() for name in (DATA_FILE, INDEX_FILE)}
+
+    write(live, {"New_Terms_chunk1": "added on the serving node"}, append=append)
+
+    assert {name: (snapshot / name).read_bytes() for name in (DATA_FILE, INDEX_FILE)} == before
+    assert read_all(snapshot) == CHUNKS
+    expected = {**CHUNKS, "New_Terms_chunk1": "added on the serving node"} if append else {"New_Terms_chunk1": "added on the serving node"}
+    assert read_all(live) == expected